@@ -1,9 +1,33 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any
+
 from aioxmpp import JID
 from data.algorithm import AlgorithmData
 from spade.agent import Agent
 from spade.behaviour import CyclicBehaviour
 from spade.message import Message
+from utilities.codec import PayloadCodec
+from utilities.coalition import CoalitionManager
+from utilities.delta import DeltaDecoder, DeltaEncoder, DeltaMismatchError
+from utilities.mailbox import CoalescingMailbox
+from utilities.metrics import MetricsRegistry
 from utilities.multipart import MultipartHandler
+from utilities.pipeline import SendPipeline
+from utilities.transport import LoopbackTransport
+
+# Only used in annotations, torch is imported when a model is set (the launcher never trains)
+if TYPE_CHECKING:
+    import torch
+    import torch.nn as nn
+    from nn.aggregation import ModelAggregator
+    from nn.scheduler import TrainingScheduler
 
 
 class AgentBase(Agent):
@@ -15,26 +39,275 @@ class AgentBase(Agent):
         web_address: str = "0.0.0.0",
         web_port: int = 10000,
         verify_security: bool = False,
+        quantization: str = "fp32",
+        max_message_size: int = 256 * 1024,
+        send_window: int = 8,
+        max_pending_bytes: int = 8 * 1024 * 1024,
+        transport: LoopbackTransport = None,
     ):
         super().__init__(jid=jid, password=password, verify_security=verify_security)
         self.neighbours = neighbours
         self.web_address = web_address
         self.web_port = web_port
-        self.multipart_handler = MultipartHandler()
+        self.max_message_size = max_message_size
+        self.metrics = MetricsRegistry(agent=str(self.jid.bare()))
+        self.multipart_handler = MultipartHandler(metrics=self.metrics)
+        self.payload_codec = PayloadCodec(quantization=quantization)
+        self.send_pipeline = SendPipeline(
+            window=send_window, max_pending_bytes=max_pending_bytes
+        )
+        self.stop_callbacks: list[Callable[["AgentBase"], None]] = []
+        self.transport = transport
+
+    async def _async_start(self, auto_register: bool = True) -> None:
+        # Agent.start returns this coroutine when it is called in the loop of the container and a Future that
+        # runs it otherwise, so the start of the agent is measured here for both
+        started = time.perf_counter()
+        try:
+            await super()._async_start(auto_register=auto_register)
+        except BaseException:
+            if self.transport is not None:
+                self.transport.unregister(self)
+            raise
+        # Registration and connection to the XMPP server, until the agent is ready to send its first message
+        self.metrics.observe("xmpp_registration_seconds", time.perf_counter() - started)
+
+    async def _hook_plugin_after_connection(self) -> None:
+        # Registered once connected and before the behaviours start, so they can receive local messages
+        if self.transport is not None:
+            self.transport.register(self)
+
+    async def async_start(self, auto_register: bool = True) -> None:
+        """
+        Starts the agent and waits until it is started, from any event loop. Agent.start returns a coroutine when
+        it is called in the loop of the container and a Future when it is called from other loops or threads.
+        """
+        start = self.start(auto_register=auto_register)
+        if isinstance(start, Future):
+            await asyncio.wrap_future(start)
+        else:
+            await start
+
+    async def _async_stop(self) -> None:
+        # Like _async_start, it runs for both the coroutine and the Future returned by Agent.stop
+        try:
+            await super()._async_stop()
+        finally:
+            self.notify_stop()
+
+    async def async_stop(self) -> None:
+        """
+        Stops the agent and waits until it is stopped, from any event loop, like async_start.
+        """
+        stop = self.stop()
+        if isinstance(stop, Future):
+            await asyncio.wrap_future(stop)
+        else:
+            await stop
+
+    def notify_stop(self) -> None:
+        if self.transport is not None:
+            self.transport.unregister(self)
+        for callback in self.stop_callbacks:
+            callback(self)
+
+    def record_sent(self, destination: str, size: int, parts: int) -> None:
+        self.metrics.inc("messages_sent", to=destination)
+        self.metrics.inc("bytes_sent", size, to=destination)
+        self.metrics.observe(
+            "multipart_parts", parts, buckets=MetricsRegistry.COUNT_BUCKETS
+        )
+
+    def record_received(self, message: Message) -> None:
+        sender = str(message.sender.bare())
+        self.metrics.inc("parts_received", sender=sender)
+        self.metrics.inc(
+            "bytes_received",
+            len(message.body) if message.body is not None else 0,
+            sender=sender,
+        )
 
     async def send(self, message: Message, behaviour: CyclicBehaviour = None) -> None:
-        messages: list[Message] = self.multipart_handler.generate_multipart_messages(
-            content=message.body, message_base=message
+        await self.send_content(
+            message=message, content=message.body, behaviour=behaviour
+        )
+
+    async def send_content(
+        self,
+        message: Message,
+        content: str | bytes,
+        behaviour: CyclicBehaviour = None,
+    ) -> None:
+        """
+        Sends the content using the message as base, splitting it in multipart messages when it exceeds
+        the maximum message size. The multipart messages are generated lazily and sent through the send pipeline,
+        keeping a window of messages in flight. If the receiver runs in the same process and shares the
+        transport of the agent, the content is delivered directly without splitting it.
+
+        Args:
+            message (Message): The message used as base.
+            content (str | bytes): The body to send, ASCII bytes are sliced without copying the whole payload.
+            behaviour (CyclicBehaviour, optional): The behaviour used to send the message. Defaults to None.
+        """
+        if self.is_local(message.to):
+            await self.send_locally(
+                message=message, content=content, recipients=[message.to]
+            )
+            return
+        messages = self.multipart_handler.iter_multipart_messages(
+            content=content,
+            max_size=self.max_message_size,
+            message_base=message,
         )
         if messages is None:
+            if not isinstance(content, str):
+                message.body = str(content, "ascii")
             messages = [message]
-        for msg in messages:
-            if behaviour is not None:
-                await behaviour.send(msg=msg)
-            else:
-                futures = self.dispatch(msg=msg)
-                for f in futures:
-                    f.result()
+        self.record_sent(
+            destination=str(message.to.bare()),
+            size=len(content),
+            parts=self.multipart_handler.get_total_parts(
+                len(content), self.max_message_size
+            ),
+        )
+        await self.send_pipeline.send_all(
+            destination=str(message.to),
+            messages=messages,
+            send=self.get_send_function(behaviour),
+        )
+
+    def is_local(self, jid: JID | str | None) -> bool:
+        return self.transport is not None and self.transport.is_local(jid)
+
+    async def send_locally(
+        self, message: Message, content: str | bytes, recipients: list[JID]
+    ) -> None:
+        """
+        Delivers a copy of the message with the whole content to every recipient through the loopback transport.
+        """
+        body = content if isinstance(content, str) else str(content, "ascii")
+        sender = str(message.sender if message.sender is not None else self.jid)
+        deliveries = []
+        for recipient in recipients:
+            local_message = self.multipart_handler.build_message(
+                message, body, to=str(recipient)
+            )
+            local_message.sender = sender
+            self.record_sent(
+                destination=str(local_message.to.bare()), size=len(body), parts=1
+            )
+            deliveries.append(self.transport.deliver(local_message))
+        await asyncio.gather(*deliveries)
+
+    def get_send_function(
+        self, behaviour: CyclicBehaviour = None
+    ) -> Callable[[Message], Awaitable[None]]:
+        return behaviour.send if behaviour is not None else self.send_message
+
+    async def send_message(self, msg: Message) -> None:
+        """
+        Sends a message without a behaviour, like CyclicBehaviour.send does: directly to the receiver if it is
+        registered in the container of the agent, otherwise through the XMPP client.
+        """
+        if not msg.sender:
+            msg.sender = str(self.jid)
+        to = str(msg.to)
+        if self.container.has_agent(to):
+            self.container.get_agent(to).dispatch(msg)
+        else:
+            await self.client.send(msg.prepare())
+        msg.sent = True
+
+    def post(self, message: Message, behaviour: CyclicBehaviour = None) -> asyncio.Task:
+        """
+        Schedules the message to be sent without waiting for it.
+
+        Returns:
+            asyncio.Task: Awaitable that completes when the whole message (all its multipart messages) has been handed off.
+            Nobody may await it, so its errors are also reported and counted in the "post_errors" metric.
+        """
+        task = asyncio.ensure_future(self.send(message=message, behaviour=behaviour))
+        task.add_done_callback(lambda t: self.report_post_error(t, message))
+        return task
+
+    def report_post_error(self, task: asyncio.Task, message: Message) -> None:
+        if task.cancelled() or task.exception() is None:
+            return
+        self.metrics.inc("post_errors", to=str(message.to))
+        print(
+            f"[{self.jid}] failed to send a message to {message.to}, because: {task.exception()}."
+        )
+
+    async def send_to_neighbours(
+        self, message: Message, behaviour: CyclicBehaviour = None
+    ) -> None:
+        """
+        Sends a copy of the message to every neighbour concurrently.
+
+        Args:
+            message (Message): The message to send, its "to" field is replaced for each neighbour.
+            behaviour (CyclicBehaviour, optional): The behaviour used to send the messages. Defaults to None.
+        """
+        await asyncio.gather(
+            *[
+                self.send(
+                    message=self.multipart_handler.build_message(
+                        message, message.body, to=str(neighbour)
+                    ),
+                    behaviour=behaviour,
+                )
+                for neighbour in self.neighbours
+            ]
+        )
+
+    async def send_model(
+        self,
+        message: Message,
+        state_dict: dict[str, torch.Tensor],
+        behaviour: CyclicBehaviour = None,
+    ) -> None:
+        """
+        Encodes the state dict with the agent payload codec and sends it in the body of the message.
+
+        Args:
+            message (Message): The message used as base, its body is replaced by the encoded model.
+            state_dict (dict[str, torch.Tensor]): The model parameters to send.
+            behaviour (CyclicBehaviour, optional): The behaviour used to send the message. Defaults to None.
+        """
+        with self.metrics.timer("encode_seconds"):
+            content = self.payload_codec.encode_bytes(state_dict)
+        await self.send_content(message=message, content=content, behaviour=behaviour)
+
+    async def receive(
+        self, behaviour: CyclicBehaviour, timeout: float = None
+    ) -> Message | None:
+        """
+        Receives a message with the behaviour and rebuilds it if it is part of a multipart message.
+
+        Args:
+            behaviour (CyclicBehaviour): The behaviour used to receive the message.
+            timeout (float, optional): Seconds to wait for a message. Defaults to None.
+
+        Returns:
+            Message | None: The complete message or None if there is no message or the multipart message is not complete yet.
+        """
+        message = await behaviour.receive(timeout=timeout)
+        # The streams of senders that went quiet are evicted even if no more parts arrive
+        self.multipart_handler.evict_streams()
+        if message is not None:
+            self.record_received(message)
+        if message is not None and self.multipart_handler.is_multipart(message):
+            return self.multipart_handler.rebuild_multipart(message)
+        return message
+
+    def is_model_message(self, message: Message) -> bool:
+        return self.payload_codec.is_encoded(message.body)
+
+    def decode_model(self, message: Message) -> OrderedDict[str, torch.Tensor] | None:
+        if not self.is_model_message(message):
+            return None
+        with self.metrics.timer("decode_seconds"):
+            return self.payload_codec.decode(message.body)
 
 
 class AgentNodeBase(AgentBase):
@@ -48,6 +321,18 @@ class AgentNodeBase(AgentBase):
         web_address: str = "0.0.0.0",
         web_port: int = 10000,
         verify_security: bool = False,
+        quantization: str = "fp32",
+        max_message_size: int = 256 * 1024,
+        send_window: int = 8,
+        max_pending_bytes: int = 8 * 1024 * 1024,
+        model: nn.Module = None,
+        aggregation_strategy: str = "fedavg",
+        update_mode: str = "full",
+        update_ratio: float = 0.01,
+        coalitions: CoalitionManager = None,
+        transport: LoopbackTransport = None,
+        training_scheduler: TrainingScheduler = None,
+        failure_timeout: float = 60.0,
     ):
         super().__init__(
             jid=jid,
@@ -56,6 +341,540 @@ class AgentNodeBase(AgentBase):
             web_address=web_address,
             web_port=web_port,
             verify_security=verify_security,
+            quantization=quantization,
+            max_message_size=max_message_size,
+            send_window=send_window,
+            max_pending_bytes=max_pending_bytes,
+            transport=transport,
         )
         self.observers = observers
         self.algorithm = algorithm
+        self.model: nn.Module = None
+        self.aggregator: ModelAggregator = None
+        if model is not None:
+            self.set_model(model=model, aggregation_strategy=aggregation_strategy)
+        self.delta_encoder = DeltaEncoder(
+            mode=update_mode, ratio=update_ratio, codec=self.payload_codec
+        )
+        self.delta_decoder = DeltaDecoder()
+        self.model_mailbox = CoalescingMailbox(
+            multipart_handler=self.multipart_handler, is_model=self.is_model_message
+        )
+        self.coalitions = coalitions
+        # Seconds without messages after which a coalition agent that sends to this one is considered failed
+        self.failure_timeout = failure_timeout
+        self.last_seen: dict[str, float] = {}
+        self.training_scheduler = training_scheduler
+        self.optimizer: torch.optim.Optimizer = None
+        # Updated by the algorithms, saved with the checkpoints
+        self.round: int = 0
+        self.neighbours_metadata: dict[str, dict[str, Any]] = {}
+        self.broadcast_cache: OrderedDict[Hashable, list[str]] = OrderedDict()
+        self.broadcast_contents: OrderedDict[Hashable, bytes] = OrderedDict()
+        self.broadcast_cache_size: int = 1
+
+    def get_checkpoint(self) -> tuple[dict[str, torch.Tensor], dict[str, Any]]:
+        """
+        Captures the state needed to resume the agent: the model, the optimizer state, the round, the metadata of
+        the neighbours and the models of the delta encoder and decoder (the neighbours expect the updates against
+        them). The tensors and the metadata are copied, so they can be written while the agent keeps running.
+
+        Returns:
+            tuple[dict[str, torch.Tensor], dict[str, Any]]: The tensors, with names like "model/fc1.weight", and
+            the JSON serializable metadata.
+        """
+        import torch
+
+        tensors: dict[str, torch.Tensor] = {}
+        metadata = {
+            "round": self.round,
+            "neighbours": self.neighbours_metadata,
+            "delta_sequences": {
+                "delta_encoder": self.delta_encoder.sequences,
+                "delta_decoder": self.delta_decoder.sequences,
+            },
+        }
+        if self.model is not None:
+            for name, tensor in self.model.state_dict().items():
+                tensors[f"model/{name}"] = tensor.detach().clone()
+        if self.optimizer is not None:
+            optimizer_state = self.optimizer.state_dict()
+            values = {}
+            for parameter, state in optimizer_state["state"].items():
+                for key, value in state.items():
+                    if torch.is_tensor(value):
+                        tensors[f"optimizer/{parameter}/{key}"] = value.detach().clone()
+                    else:
+                        values.setdefault(str(parameter), {})[key] = value
+            metadata["optimizer"] = {
+                "param_groups": optimizer_state["param_groups"],
+                "state": values,
+            }
+        for prefix, models in (
+            ("delta_encoder", self.delta_encoder.references),
+            ("delta_decoder", self.delta_decoder.models),
+        ):
+            for neighbour, model in models.items():
+                for name, tensor in model.items():
+                    tensors[f"{prefix}/{neighbour}/{name}"] = tensor.clone()
+        # The metadata holds the live dicts of the agent and the optimizer, which change while it is serialized
+        return tensors, copy.deepcopy(metadata)
+
+    def load_checkpoint(
+        self, tensors: dict[str, torch.Tensor], metadata: dict[str, Any]
+    ) -> None:
+        """
+        Restores the state captured by get_checkpoint. The model and the optimizer must be set before, their
+        tensors are loaded in place.
+
+        Raises:
+            ValueError: If the checkpoint has a model or an optimizer state and the agent does not have one.
+        """
+        if self.model is None and any(k.startswith("model/") for k in tensors.keys()):
+            raise ValueError(
+                f"The checkpoint of {self.jid} has a model, but the agent does not have one to restore it."
+            )
+        if self.optimizer is None and (
+            "optimizer" in metadata.keys()
+            or any(k.startswith("optimizer/") for k in tensors.keys())
+        ):
+            raise ValueError(
+                f"The checkpoint of {self.jid} has an optimizer state, but the agent does not have an optimizer to restore it."
+            )
+        self.round = metadata["round"]
+        self.neighbours_metadata = metadata["neighbours"]
+        model = OrderedDict()
+        optimizer_tensors = {}
+        delta = {"delta_encoder": {}, "delta_decoder": {}}
+        for key, tensor in tensors.items():
+            kind, name = key.split("/", 1)
+            if kind == "model":
+                model[name] = tensor
+            elif kind == "optimizer":
+                parameter, name = name.split("/", 1)
+                optimizer_tensors.setdefault(parameter, {})[name] = tensor
+            else:
+                neighbour, name = name.split("/", 1)
+                delta[kind].setdefault(neighbour, OrderedDict())[name] = tensor.clone()
+        if model:
+            self.model.load_state_dict(model)
+        if "optimizer" in metadata.keys():
+            state = metadata["optimizer"]["state"]
+            parameters = set(state.keys()) | set(optimizer_tensors.keys())
+            self.optimizer.load_state_dict(
+                {
+                    "state": {
+                        int(p): {**state.get(p, {}), **optimizer_tensors.get(p, {})}
+                        for p in parameters
+                    },
+                    "param_groups": metadata["optimizer"]["param_groups"],
+                }
+            )
+        sequences = metadata.get("delta_sequences", {})
+        self.delta_encoder.references = delta["delta_encoder"]
+        self.delta_encoder.sequences = dict(sequences.get("delta_encoder", {}))
+        self.delta_decoder.models = delta["delta_decoder"]
+        self.delta_decoder.sequences = dict(sequences.get("delta_decoder", {}))
+
+    def get_model_recipients(self) -> list[JID]:
+        """
+        Returns the agents that receive the model of this agent: the coalition recipients (leader, members
+        and other leaders) when the agent belongs to a coalition, otherwise the neighbours.
+        """
+        if self.coalitions is None:
+            return self.neighbours
+        self.detect_failures()
+        return [
+            JID.fromstr(r) for r in self.coalitions.get_recipients(str(self.jid.bare()))
+        ]
+
+    def record_received(self, message: Message) -> None:
+        super().record_received(message)
+        self.mark_seen(str(message.sender.bare()))
+
+    def mark_seen(self, agent: str) -> None:
+        """
+        Records a message of the agent and, if it was considered failed in the coalitions, marks it as recovered.
+        """
+        self.last_seen[agent] = time.monotonic()
+        if self.coalitions is not None and agent in self.coalitions.failed:
+            self.coalitions.mark_recovered(agent)
+            self.metrics.inc("coalition_recoveries", agent=agent)
+
+    def detect_failures(self, now: float = None) -> list[str]:
+        """
+        Marks as failed in the coalitions the agents that send their models to this one (its leader or, for a
+        leader, its members and the other leaders) and have not sent any message for failure_timeout seconds,
+        so the leadership rotates when a leader fails. The agents are marked as recovered when they send again.
+        Every agent that is expected to send gets failure_timeout seconds from the first check, or from the
+        moment it becomes a leader, to send its first message.
+
+        Args:
+            now (float, optional): The time.monotonic() of the check. Defaults to None (now).
+
+        Returns:
+            list[str]: The agents marked as failed.
+        """
+        if self.coalitions is None or self.failure_timeout is None:
+            return []
+        now = time.monotonic() if now is None else now
+        jid = str(self.jid.bare())
+        failed = []
+        senders = self.coalitions.get_recipients(jid)
+        while True:
+            silent = [
+                a
+                for a in senders
+                if now - self.last_seen.setdefault(a, now) > self.failure_timeout
+            ]
+            if not silent:
+                return failed
+            for agent in silent:
+                self.coalitions.mark_failed(agent)
+                self.metrics.inc("coalition_failures", agent=agent)
+            failed.extend(silent)
+            previous_senders = senders
+            senders = self.coalitions.get_recipients(jid)
+            for agent in senders:
+                if not agent in previous_senders:
+                    self.last_seen[agent] = now
+
+    def set_model(self, model: nn.Module, aggregation_strategy: str = "fedavg") -> None:
+        """
+        Sets the local model. The aggregator moves the model tensors into its flat buffer, the parameter
+        objects are kept, so optimizers created before this call keep working.
+        """
+        from nn.aggregation import ModelAggregator
+
+        self.model = model
+        self.aggregator = ModelAggregator(model=model, strategy=aggregation_strategy)
+
+    def aggregate_models(
+        self,
+        models: list[dict[str, torch.Tensor]],
+        num_samples: list[int] = None,
+        staleness: list[int] = None,
+        local_num_samples: int = None,
+    ) -> nn.Module:
+        """
+        Aggregates the neighbour models into the local model in place with the aggregator of the agent.
+        """
+        return self.aggregator.aggregate(
+            models=models,
+            num_samples=num_samples,
+            staleness=staleness,
+            local_num_samples=local_num_samples,
+        )
+
+    async def train(
+        self, function: Callable[..., Any], *args, staleness: int = 0, **kwargs
+    ) -> Any:
+        """
+        Runs the local training function. With a training scheduler, it waits for a free training slot and runs in
+        a worker thread with the thread budget of the scheduler, so the event loop is not blocked; otherwise,
+        it runs directly.
+
+        Args:
+            function (Callable[..., Any]): The training function, called with args and kwargs.
+            staleness (int, optional): Rounds behind the neighbours, used by the "staleness" policy. Defaults to 0.
+
+        Returns:
+            Any: The result of the function.
+        """
+        if self.training_scheduler is None:
+            with self.metrics.timer("training_step_seconds"):
+                return function(*args, **kwargs)
+        return await self.training_scheduler.run(
+            str(self.jid.bare()),
+            function,
+            *args,
+            staleness=staleness,
+            metrics=self.metrics,
+            **kwargs,
+        )
+
+    async def receive_models(
+        self, behaviour: CyclicBehaviour, timeout: float = None
+    ) -> OrderedDict[str, list[Message]]:
+        """
+        Drains the behaviour mailbox into the coalescing model mailbox and returns the model messages of every
+        sender: the latest complete full model and the differences (send_model_update) received after it, which
+        must be decoded in order. Older full models from the same sender are discarded without being rebuilt
+        or decoded. The messages that are not models can be retrieved with model_mailbox.pop_other_message().
+
+        Args:
+            behaviour (CyclicBehaviour): The behaviour used to receive the messages.
+            timeout (float, optional): Seconds to wait for the first message. Defaults to None (do not wait).
+
+        Returns:
+            OrderedDict[str, list[Message]]: The model messages of every sender in order, keyed by the sender bare JID.
+        """
+        message = await behaviour.receive(timeout=timeout)
+        while message is not None:
+            self.record_received(message)
+            if not self.handle_resync_request(message):
+                self.model_mailbox.put(message)
+            message = await behaviour.receive()
+        self.multipart_handler.evict_streams()
+        self.detect_failures()
+        self.metrics.set("mailbox_depth", self.model_mailbox.size())
+        self.metrics.set("discarded_models", self.model_mailbox.discarded_models)
+        models = self.model_mailbox.pop_models()
+        for sender in models.keys():
+            metadata = self.neighbours_metadata.setdefault(sender, {})
+            metadata["models_received"] = metadata.get("models_received", 0) + 1
+            metadata["last_model_round"] = self.round
+        return models
+
+    async def send_model_update(
+        self,
+        message: Message,
+        state_dict: dict[str, torch.Tensor],
+        behaviour: CyclicBehaviour = None,
+    ) -> None:
+        """
+        Sends the model to the receiver of the message as an update (full, dense delta or top-k sparse delta,
+        depending on the update_mode) against the last model sent to that receiver. The kind of update and its
+        sequence number travel in the "update" and "update_sequence" metadata of the message.
+        """
+        kind, sequence, tensors = self.delta_encoder.encode(
+            neighbour=str(message.to.bare()), state_dict=state_dict
+        )
+        message.set_metadata("update", kind)
+        message.set_metadata("update_sequence", str(sequence))
+        await self.send_model(message=message, state_dict=tensors, behaviour=behaviour)
+
+    def decode_model_update(
+        self, message: Message
+    ) -> OrderedDict[str, torch.Tensor] | None:
+        """
+        Decodes a message sent with send_model_update and applies it to the copy of the sender model. If the
+        update does not follow the last one applied (an update was lost), the sender is asked to send its full
+        model again.
+
+        Returns:
+            OrderedDict[str, torch.Tensor] | None: The sender model or None if the message does not contain a model
+            or the update can not be applied.
+        """
+        tensors = self.decode_model(message)
+        if tensors is None:
+            return None
+        kind = message.get_metadata("update")
+        sequence = message.get_metadata("update_sequence")
+        sender = str(message.sender.bare())
+        try:
+            return self.delta_decoder.decode(
+                sender=sender,
+                kind=kind if kind is not None else "full",
+                tensors=tensors,
+                sequence=int(sequence) if sequence is not None else None,
+            )
+        except DeltaMismatchError:
+            self.metrics.inc("delta_resync_requests", sender=sender)
+            self.post(Message(to=sender, body="", metadata={"update": "resync"}))
+            return None
+
+    def handle_resync_request(self, message: Message) -> bool:
+        """
+        Resets the delta reference of the sender if the message asks for the full model.
+
+        Returns:
+            bool: Whether the message was a resync request.
+        """
+        if message.get_metadata("update") != "resync":
+            return False
+        self.delta_encoder.reset(str(message.sender.bare()))
+        return True
+
+    async def receive(
+        self, behaviour: CyclicBehaviour, timeout: float = None
+    ) -> Message | None:
+        message = await super().receive(behaviour=behaviour, timeout=timeout)
+        if message is not None and self.handle_resync_request(message):
+            return None
+        return message
+
+    def get_broadcast_bodies(
+        self, content: str | bytes, version: Hashable = None
+    ) -> list[str]:
+        """
+        Returns the bodies (multipart or not) of the content, splitting it only once per version.
+
+        Args:
+            content (str | bytes): The content to split.
+            version (Hashable, optional): Identifier of the content, for example the model round. The bodies
+            of the last "broadcast_cache_size" versions are cached. Defaults to None (not cached).
+
+        Returns:
+            list[str]: The bodies to send to every recipient.
+        """
+        if version is not None and version in self.broadcast_cache.keys():
+            return self.broadcast_cache[version]
+        bodies = self.multipart_handler.generate_multipart_content(
+            content=content, max_size=self.max_message_size
+        )
+        if bodies is None:
+            bodies = [content if isinstance(content, str) else str(content, "ascii")]
+        if version is not None:
+            self.broadcast_cache[version] = bodies
+            while len(self.broadcast_cache) > self.broadcast_cache_size:
+                self.broadcast_cache.popitem(last=False)
+        return bodies
+
+    def get_broadcast_content(
+        self, state_dict: dict[str, torch.Tensor], version: Hashable = None
+    ) -> bytes:
+        """
+        Returns the encoded model, encoding it only once per version.
+
+        Args:
+            state_dict (dict[str, torch.Tensor]): The model parameters to encode.
+            version (Hashable, optional): Identifier of the model. The contents of the last "broadcast_cache_size"
+            versions are cached. Defaults to None (not cached).
+
+        Returns:
+            bytes: The encoded model.
+        """
+        if version is not None and version in self.broadcast_contents.keys():
+            return self.broadcast_contents[version]
+        with self.metrics.timer("encode_seconds"):
+            content = self.payload_codec.encode_bytes(state_dict)
+        if version is not None:
+            self.broadcast_contents[version] = content
+            while len(self.broadcast_contents) > self.broadcast_cache_size:
+                self.broadcast_contents.popitem(last=False)
+        return content
+
+    def split_recipients(self, recipients: list[JID]) -> tuple[list[JID], list[JID]]:
+        """
+        Returns:
+            tuple[list[JID], list[JID]]: The recipients reachable through the loopback transport and the rest.
+        """
+        local_recipients = [r for r in recipients if self.is_local(r)]
+        remote_recipients = [r for r in recipients if not self.is_local(r)]
+        return local_recipients, remote_recipients
+
+    async def send_bodies(
+        self,
+        message: Message,
+        bodies: list[str],
+        recipients: list[JID],
+        behaviour: CyclicBehaviour = None,
+    ) -> None:
+        send = self.get_send_function(behaviour)
+        size = sum(len(body) for body in bodies)
+        for recipient in recipients:
+            self.record_sent(
+                destination=str(recipient),
+                size=size,
+                parts=len(bodies),
+            )
+        await asyncio.gather(
+            *[
+                self.send_pipeline.send_all(
+                    destination=str(recipient),
+                    messages=(
+                        self.multipart_handler.build_message(
+                            message, body, to=str(recipient)
+                        )
+                        for body in bodies
+                    ),
+                    send=send,
+                )
+                for recipient in recipients
+            ]
+        )
+
+    async def broadcast(
+        self,
+        message: Message,
+        version: Hashable = None,
+        recipients: list[JID] = None,
+        behaviour: CyclicBehaviour = None,
+    ) -> None:
+        """
+        Sends the message body to several recipients concurrently. The body is split once and the
+        multipart messages of each recipient only differ in the "to" field. The recipients that share
+        the loopback transport receive the whole body.
+
+        Args:
+            message (Message): The message to send, its "to" field is replaced for each recipient.
+            version (Hashable, optional): Identifier used to cache the split body. Defaults to None.
+            recipients (list[JID], optional): The receivers. Defaults to None (the neighbours).
+            behaviour (CyclicBehaviour, optional): The behaviour used to send the messages. Defaults to None.
+        """
+        local_recipients, remote_recipients = self.split_recipients(
+            self.neighbours if recipients is None else recipients
+        )
+        sends = []
+        if local_recipients:
+            sends.append(
+                self.send_locally(
+                    message=message, content=message.body, recipients=local_recipients
+                )
+            )
+        if remote_recipients:
+            bodies = self.get_broadcast_bodies(content=message.body, version=version)
+            sends.append(
+                self.send_bodies(
+                    message=message,
+                    bodies=bodies,
+                    recipients=remote_recipients,
+                    behaviour=behaviour,
+                )
+            )
+        await asyncio.gather(*sends)
+
+    async def broadcast_model(
+        self,
+        message: Message,
+        state_dict: dict[str, torch.Tensor],
+        version: Hashable = None,
+        recipients: list[JID] = None,
+        behaviour: CyclicBehaviour = None,
+    ) -> None:
+        """
+        Encodes the model once per version and sends it to the recipients (the neighbours, or the coalition
+        recipients if the agent belongs to a coalition, by default).
+        The version is sent in the "version" metadata, so the receivers can discard older models.
+
+        Args:
+            message (Message): The message used as base, its body is not used.
+            state_dict (dict[str, torch.Tensor]): The model parameters to send.
+            version (Hashable, optional): Identifier of the model, for example the training round. Defaults to None.
+            recipients (list[JID], optional): The receivers. Defaults to None (get_model_recipients).
+            behaviour (CyclicBehaviour, optional): The behaviour used to send the messages. Defaults to None.
+        """
+        if version is not None:
+            message.set_metadata("version", str(version))
+        local_recipients, remote_recipients = self.split_recipients(
+            self.get_model_recipients() if recipients is None else recipients
+        )
+        content = None
+        # The local recipients need the whole content, the remote ones can use the cached bodies
+        if local_recipients or not (
+            version is not None and version in self.broadcast_cache.keys()
+        ):
+            content = self.get_broadcast_content(state_dict=state_dict, version=version)
+        sends = []
+        if local_recipients:
+            sends.append(
+                self.send_locally(
+                    message=message, content=content, recipients=local_recipients
+                )
+            )
+        if remote_recipients:
+            bodies = (
+                self.broadcast_cache[version]
+                if content is None
+                else self.get_broadcast_bodies(content=content, version=version)
+            )
+            sends.append(
+                self.send_bodies(
+                    message=message,
+                    bodies=bodies,
+                    recipients=remote_recipients,
+                    behaviour=behaviour,
+                )
+            )
+        await asyncio.gather(*sends)
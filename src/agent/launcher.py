@@ -1,13 +1,25 @@
 import asyncio
+import os
 import time
 
+from aiohttp import web
 from aioxmpp import JID
-import networkx as nx
 
-from concurrent.futures import CancelledError
-from threading import Thread
-from spade.agent import Agent
+from concurrent.futures import CancelledError, Future
+from threading import Event, Lock, Thread
+from spade.behaviour import PeriodicBehaviour
 from base import AgentBase, AgentNodeBase
+from shard import AgentShard, AgentSpec, WarmWorkerFactory
+from utilities.checkpoint import CheckpointStore
+from utilities.metrics import to_json, to_prometheus
+
+
+class CheckpointBehaviour(PeriodicBehaviour):
+    async def run(self) -> None:
+        try:
+            await self.agent.async_checkpoint()
+        except Exception as e:
+            print(f"[{self.agent.name}] checkpoint failed, because: {e}.")
 
 
 class LauncherAgent(AgentBase):
@@ -20,6 +32,9 @@ class LauncherAgent(AgentBase):
         web_address: str = "0.0.0.0",
         web_port: int = 10000,
         verify_security: bool = False,
+        agent_specs: list[AgentSpec] = None,
+        checkpoint_store: CheckpointStore = None,
+        checkpoint_interval: float = None,
     ):
         super().__init__(
             jid=jid,
@@ -34,6 +49,30 @@ class LauncherAgent(AgentBase):
         self.launched_agents: dict[AgentNodeBase, bool] = {
             a: False for a in self.agents
         }
+        self.agents_lock = Lock()
+        self.agents_launched = Event()
+        self.agents_stopped = Event()
+        self.async_agents_stopped: asyncio.Event | None = None
+        self.stopped_agents: set[AgentNodeBase] = set()
+        self.starting_agents: set[AgentNodeBase] = set()
+        for agent in self.agents:
+            agent.stop_callbacks.append(self.on_agent_stopped)
+        self.agent_specs: list[AgentSpec] = (
+            agent_specs if agent_specs is not None else []
+        )
+        self.shards: list[AgentShard] = []
+        self.checkpoint_store = checkpoint_store
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_lock: asyncio.Lock | None = None
+        self.resume_snapshot: int | None = None
+
+    async def setup(self) -> None:
+        self.web.add_get("/metrics", self.web_metrics, None, raw=True)
+        self.web.add_get("/metrics/json", self.web_metrics_json, None, raw=True)
+        self.web.add_post("/agents/start", self.web_start_agents, None, raw=True)
+        self.web.start(hostname=self.web_address, port=self.web_port)
+        if self.checkpoint_store is not None and self.checkpoint_interval is not None:
+            self.add_behaviour(CheckpointBehaviour(period=self.checkpoint_interval))
 
     def launch_agents(self) -> None:
         for agent in self.agents:
@@ -47,16 +86,145 @@ class LauncherAgent(AgentBase):
                 print(f"[{agent.jid}] launched.")
             except RuntimeError as e:
                 print(f"[{agent.jid}] exploded before being launched, because: {e}.")
+        self.agents_launched.set()
+
+    async def async_launch_agents(
+        self, max_concurrency: int = 64, stagger: float = 0.0
+    ) -> None:
+        """
+        Starts all the agents concurrently in the event loop, without a thread per agent. The agents that are
+        already launched, running or starting (for example, by a previous call) are skipped.
+
+        Args:
+            max_concurrency (int, optional): Maximum number of agents starting (registering and connecting
+            to the XMPP server) at the same time. Defaults to 64.
+            stagger (float, optional): Seconds between the start of consecutive agents to avoid a registration
+            storm in the XMPP server. Defaults to 0.0.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        agents = [
+            a
+            for a in self.agents
+            if not self.launched_agents[a]
+            and not a.is_alive()
+            and not a in self.starting_agents
+        ]
+        self.starting_agents.update(agents)
+
+        async def start(agent: AgentNodeBase, delay: float) -> None:
+            try:
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                async with semaphore:
+                    await agent.async_start(auto_register=True)
+                    self.launched_agents[agent] = True
+                    print(f"[{agent.jid}] launched.")
+            except Exception as e:
+                print(f"[{agent.jid}] exploded before being launched, because: {e}.")
+            finally:
+                self.starting_agents.discard(agent)
+
+        await asyncio.gather(
+            *[start(agent, i * stagger) for i, agent in enumerate(agents)]
+        )
+        self.agents_launched.set()
+
+    def launch_agents_concurrently(
+        self, max_concurrency: int = 64, stagger: float = 0.0
+    ) -> Future:
+        """
+        Non blocking call to async_launch_agents from outside of the event loop. The launcher must be started.
+
+        Returns:
+            Future: Future that is done when all the agents are launched.
+        """
+        return self.submit(
+            self.async_launch_agents(max_concurrency=max_concurrency, stagger=stagger)
+        )
+
+    def launch_agents_sharded(
+        self,
+        processes: int = None,
+        start_method: str = "spawn",
+        factory: WarmWorkerFactory = None,
+        timeout: float = None,
+    ) -> None:
+        """
+        Spreads the agent_specs across worker processes, each one with its own SPADE event loop, and waits
+        until all of them have started their agents.
+
+        Args:
+            processes (int, optional): Number of worker processes. Defaults to None (the number of cores).
+            start_method (str, optional): The multiprocessing start method. Defaults to "spawn".
+            factory (WarmWorkerFactory, optional): Creates the shards from a warm process instead of the start
+            method, so they do not import the dependencies again. Defaults to None.
+            timeout (float, optional): Maximum seconds to wait for each shard, the agents of the shards that do not
+            answer in time are reported as failed. Defaults to None (wait while the worker is alive).
+        """
+        processes = os.cpu_count() if processes is None else processes
+        processes = max(1, min(processes, len(self.agent_specs)))
+        self.shards = [
+            (
+                factory.create(
+                    index=i,
+                    specs=self.agent_specs[i::processes],
+                    checkpoint_store=self.checkpoint_store,
+                    resume_snapshot=self.resume_snapshot,
+                )
+                if factory is not None
+                else AgentShard(
+                    index=i,
+                    specs=self.agent_specs[i::processes],
+                    start_method=start_method,
+                    checkpoint_store=self.checkpoint_store,
+                    resume_snapshot=self.resume_snapshot,
+                )
+            )
+            for i in range(processes)
+        ]
+        for shard in self.shards:
+            shard.start()
+        for shard in self.shards:
+            for jid, alive in shard.wait_for_launch(timeout=timeout).items():
+                print(
+                    f"[{jid}] {'launched' if alive else 'failed to launch'} in {shard.process.name}."
+                )
+        self.agents_launched.set()
+
+    def agents_status(self) -> dict[str, bool]:
+        """
+        Returns:
+            dict[str, bool]: Whether each agent is alive, both local and sharded ones.
+        """
+        status = {str(agent.jid): agent.is_alive() for agent in self.agents}
+        for shard in self.shards:
+            status.update(shard.status())
+        return status
+
+    def on_agent_stopped(self, agent: AgentNodeBase) -> None:
+        with self.agents_lock:
+            self.stopped_agents.add(agent)
+            if len(self.stopped_agents) < len(self.agents):
+                return
+        self.agents_stopped.set()
+        if self.async_agents_stopped is not None:
+            self.loop.call_soon_threadsafe(self.async_agents_stopped.set)
 
     def any_agent_alive(self) -> bool:
-        return any(agent.is_alive() for agent in self.agents)
+        return any(agent.is_alive() for agent in self.agents) or any(
+            any(shard.status().values()) for shard in self.shards
+        )
 
     def all_agents_are_launched(self) -> bool:
         return all(self.launched_agents.values())
 
-    def wait_for_agents(self) -> None:
+    def wait_for_launch(self, timeout: float = None) -> bool:
+        return self.agents_launched.wait(timeout=timeout)
+
+    def wait_for_agents(self, timeout: float = 1) -> None:
+        # Woken up as soon as the last agent stops, the timeout covers agents that die without being stopped
         while self.any_agent_alive():
-            time.sleep(1)
+            self.agents_stopped.wait(timeout=timeout)
 
     def wait_for_agent_threads(self) -> None:
         for thread in self.threads:
@@ -67,23 +235,126 @@ class LauncherAgent(AgentBase):
             if agent.is_alive():
                 future = agent.stop()
                 future.result()
+        self.stop_shards()
+
+    def stop_shards(self) -> None:
+        for shard in self.shards:
+            shard.stop()
+        for shard in self.shards:
+            shard.join()
+
+    async def async_checkpoint(self) -> int:
+        """
+        Saves a snapshot of all the agents, local and sharded, in the checkpoint store. The state of the local
+        agents is captured in the event loop, between behaviour steps, and the store is written in a thread.
+
+        Returns:
+            int: The number of the snapshot.
+        """
+        if self.checkpoint_lock is None:
+            self.checkpoint_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        async with self.checkpoint_lock:
+            start = time.perf_counter()
+            states = {
+                str(agent.jid.bare()): agent.get_checkpoint()
+                for agent in self.agents
+                if agent.is_alive()
+            }
+            for shard_states in await asyncio.gather(
+                *[loop.run_in_executor(None, shard.checkpoint) for shard in self.shards]
+            ):
+                states.update(shard_states)
+            snapshot = await loop.run_in_executor(
+                None, self.checkpoint_store.save, states
+            )
+            self.metrics.observe("checkpoint_seconds", time.perf_counter() - start)
+            self.metrics.inc(
+                "checkpoint_bytes_written", self.checkpoint_store.last_written_bytes
+            )
+            self.metrics.set("checkpoint_snapshot", snapshot)
+        return snapshot
+
+    def checkpoint(self) -> int:
+        """
+        Blocking call to async_checkpoint from outside of the event loop. The launcher must be started.
+        """
+        return self.submit(self.async_checkpoint()).result()
+
+    def restore(self, snapshot: int = None) -> int | None:
+        """
+        Restores the local agents from a snapshot of the checkpoint store. It must be called before launching the
+        agents, the agents of the shards are restored in their processes by launch_agents_sharded.
+
+        Args:
+            snapshot (int, optional): The snapshot to restore. Defaults to None (the latest consistent snapshot).
+
+        Returns:
+            int | None: The restored snapshot or None if the store is empty.
+        """
+        snapshot = self.checkpoint_store.latest() if snapshot is None else snapshot
+        if snapshot is None:
+            return None
+        for agent in self.agents:
+            jid = str(agent.jid.bare())
+            if self.checkpoint_store.contains(snapshot, jid):
+                agent.load_checkpoint(*self.checkpoint_store.load(jid, snapshot))
+        self.resume_snapshot = snapshot
+        return snapshot
 
-    async def aync_wait_for_agents(self) -> None:
+    async def aync_wait_for_agents(self, timeout: float = 1) -> None:
+        if self.async_agents_stopped is None:
+            self.async_agents_stopped = asyncio.Event()
         while self.any_agent_alive():
-            await asyncio.sleep(1)
+            try:
+                await asyncio.wait_for(self.async_agents_stopped.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
     async def async_stop_agents(self) -> None:
-        for agent in self.agents:
-            await agent.stop()
+        await asyncio.gather(
+            *[agent.async_stop() for agent in self.agents if agent.is_alive()]
+        )
+        if self.shards:
+            await asyncio.get_running_loop().run_in_executor(None, self.stop_shards)
+
+    def get_metrics_snapshots(self) -> list[dict[str, list[dict]]]:
+        """
+        Returns:
+            list[dict[str, list[dict]]]: The metrics snapshots of the launcher and all the agents, local and sharded.
+        """
+        snapshots = [self.metrics.snapshot()]
+        snapshots.extend(agent.metrics.snapshot() for agent in self.agents)
+        for shard in self.shards:
+            snapshots.extend(shard.metrics())
+        return snapshots
 
-    async def web_start_agents(self, request):
+    async def web_metrics(self, request: web.Request) -> web.Response:
+        # Shards answer through pipes, so they are queried outside of the event loop
+        snapshots = await asyncio.get_running_loop().run_in_executor(
+            None, self.get_metrics_snapshots
+        )
+        return web.Response(text=to_prometheus(snapshots), content_type="text/plain")
+
+    async def web_metrics_json(self, request: web.Request) -> web.Response:
+        snapshots = await asyncio.get_running_loop().run_in_executor(
+            None, self.get_metrics_snapshots
+        )
+        return web.Response(text=to_json(snapshots), content_type="application/json")
+
+    async def web_start_agents(self, request: web.Request) -> web.Response:
         post_parameters = await request.post()
+        await self.async_launch_agents(
+            max_concurrency=int(post_parameters.get("max_concurrency", 64)),
+            stagger=float(post_parameters.get("stagger", 0.0)),
+        )
+        return web.json_response(self.agents_status())
 
     def launch_agent(self, agent: AgentNodeBase) -> None:
         try:
             future = agent.start(auto_register=True)
             future.result()
-        except CancelledError as e:
+        except CancelledError:
             print(f"[{agent.jid}] cancelled.")
         finally:
             print(f"[{agent.jid}] ending thread.")
@@ -0,0 +1,262 @@
+import multiprocessing
+import multiprocessing.forkserver
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from threading import Lock
+from typing import Any
+
+from base import AgentNodeBase
+from utilities.checkpoint import CheckpointStore
+
+
+@dataclass
+class AgentSpec:
+    """
+    Recipe to build an agent inside a shard process. SPADE agents can not be sent to other processes,
+    so the class (importable from the worker) and the constructor arguments are sent instead.
+    """
+
+    agent_class: type
+    kwargs: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def jid(self) -> str:
+        return str(self.kwargs["jid"])
+
+    def build(self) -> AgentNodeBase:
+        return self.agent_class(**self.kwargs)
+
+
+def run_shard(
+    connection: Connection,
+    specs: list[AgentSpec],
+    checkpoint_store: CheckpointStore = None,
+    resume_snapshot: int = None,
+) -> None:
+    """
+    Entry point of the shard processes. Starts the agents in the SPADE loop of the process and answers the
+    commands of the launcher ("status", "metrics", "checkpoint" and "stop") until it is asked to stop or the
+    launcher disappears. If a snapshot to resume is given, the agents are restored from the store before starting.
+    """
+    agents = [spec.build() for spec in specs]
+    if checkpoint_store is not None and resume_snapshot is not None:
+        for agent in agents:
+            jid = str(agent.jid.bare())
+            if checkpoint_store.contains(resume_snapshot, jid):
+                agent.load_checkpoint(*checkpoint_store.load(jid, resume_snapshot))
+    # All the agents start at the same time in the loop of the process, without a thread per agent
+    futures = [agent.start(auto_register=True) for agent in agents]
+    for agent, future in zip(agents, futures):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"[{agent.jid}] exploded before being launched, because: {e}.")
+    connection.send({str(agent.jid): agent.is_alive() for agent in agents})
+    while True:
+        try:
+            command = connection.recv()
+        except EOFError:
+            command = "stop"
+        if command == "status":
+            connection.send({str(agent.jid): agent.is_alive() for agent in agents})
+        elif command == "metrics":
+            connection.send([agent.metrics.snapshot() for agent in agents])
+        elif command == "checkpoint":
+            connection.send(capture_checkpoints(agents))
+        elif command == "stop":
+            for agent in agents:
+                if agent.is_alive():
+                    agent.stop().result()
+            if not connection.closed:
+                try:
+                    connection.send({str(agent.jid): False for agent in agents})
+                except (BrokenPipeError, OSError):
+                    pass
+            return
+
+
+def capture_checkpoints(
+    agents: list[AgentNodeBase],
+) -> dict[str, tuple[dict[str, Any], dict[str, Any]]]:
+    """
+    Captures the checkpoint of the alive agents in their event loop, so no state is captured in the middle
+    of a behaviour step.
+    """
+
+    async def capture(agent: AgentNodeBase) -> tuple[dict[str, Any], dict[str, Any]]:
+        return agent.get_checkpoint()
+
+    futures = {
+        str(agent.jid.bare()): agent.submit(capture(agent))
+        for agent in agents
+        if agent.is_alive()
+    }
+    return {jid: future.result() for jid, future in futures.items()}
+
+
+class AgentShard:
+    """
+    Process that runs a subset of the agents of the launcher with its own SPADE event loop.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        specs: list[AgentSpec],
+        start_method: str = "spawn",
+        context: BaseContext = None,
+        checkpoint_store: CheckpointStore = None,
+        resume_snapshot: int = None,
+    ) -> None:
+        self.index = index
+        self.specs = specs
+        if context is None:
+            context = multiprocessing.get_context(start_method)
+        self.connection, self.child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_shard,
+            args=(self.child_connection, specs, checkpoint_store, resume_snapshot),
+            name=f"shard-{index}",
+            daemon=True,
+        )
+        self.lock = Lock()
+        self.last_status: dict[str, bool] = {spec.jid: False for spec in specs}
+
+    def start(self) -> None:
+        self.process.start()
+        # Without the copy of the parent, the connection gets EOF when the worker dies
+        self.child_connection.close()
+
+    def wait_for_launch(
+        self, timeout: float = None, poll_interval: float = 1
+    ) -> dict[str, bool]:
+        """
+        Waits for the launch status of the agents of the shard. If the worker dies before sending it (for example,
+        an agent constructor raises) or the timeout expires, all the agents are reported as not launched.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait. Defaults to None (wait while the worker is alive).
+            poll_interval (float, optional): Seconds between the checks of the worker. Defaults to 1.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.lock:
+            try:
+                while not self.connection.poll(poll_interval):
+                    expired = deadline is not None and time.monotonic() > deadline
+                    if not expired and self.process.is_alive():
+                        continue
+                    # The status may have arrived right before the worker exited
+                    if self.connection.poll(0):
+                        break
+                    self.last_status = {jid: False for jid in self.last_status.keys()}
+                    return self.last_status
+                self.last_status = self.connection.recv()
+            except (EOFError, OSError):
+                self.last_status = {jid: False for jid in self.last_status.keys()}
+        return self.last_status
+
+    def request(self, command: str) -> dict[str, bool]:
+        with self.lock:
+            if not self.process.is_alive():
+                self.last_status = {jid: False for jid in self.last_status.keys()}
+                return self.last_status
+            try:
+                self.connection.send(command)
+                self.last_status = self.connection.recv()
+            except (EOFError, BrokenPipeError, OSError):
+                self.last_status = {jid: False for jid in self.last_status.keys()}
+        return self.last_status
+
+    def status(self) -> dict[str, bool]:
+        return self.request("status")
+
+    def metrics(self) -> list[dict[str, list[dict]]]:
+        """
+        Returns:
+            list[dict[str, list[dict]]]: The metrics snapshots of the agents of the shard.
+        """
+        with self.lock:
+            if not self.process.is_alive():
+                return []
+            try:
+                self.connection.send("metrics")
+                return self.connection.recv()
+            except (EOFError, BrokenPipeError, OSError):
+                return []
+
+    def checkpoint(self) -> dict[str, tuple[dict[str, Any], dict[str, Any]]]:
+        """
+        Returns:
+            dict[str, tuple[dict[str, Any], dict[str, Any]]]: The checkpoint (tensors and metadata) of the alive
+            agents of the shard, keyed by their JID.
+        """
+        with self.lock:
+            if not self.process.is_alive():
+                return {}
+            try:
+                self.connection.send("checkpoint")
+                return self.connection.recv()
+            except (EOFError, BrokenPipeError, OSError):
+                return {}
+
+    def stop(self) -> dict[str, bool]:
+        return self.request("stop")
+
+    def join(self, timeout: float = None) -> None:
+        self.process.join(timeout=timeout)
+
+
+class WarmWorkerFactory:
+    """
+    Class created to create the shard processes without paying the import of the heavy dependencies (torch,
+    SPADE, aioxmpp...) in every one of them. With the "spawn" start method every worker starts a new interpreter
+    and imports everything again, which takes seconds per process. The factory uses the "forkserver" start
+    method: a server process imports the preload modules once (warm_up) and every shard is forked from it,
+    so the workers start with the modules already imported and only build their agents.
+
+    The server is shared by all the factories of the process. Where "forkserver" is not available (Windows),
+    the shards are spawned.
+    """
+
+    PRELOAD = ("torch", "aioxmpp", "spade.agent", "base")
+
+    def __init__(self, preload: Iterable[str] = PRELOAD) -> None:
+        self.preload = list(preload)
+        self.warm = False
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self.context = multiprocessing.get_context("forkserver")
+            self.context.set_forkserver_preload(self.preload)
+        else:
+            self.context = multiprocessing.get_context("spawn")
+
+    def warm_up(self) -> None:
+        """
+        Starts the server process, which imports the preload modules in the background. It is called by the
+        first create, calling it before (for example, while the launcher registers) takes the imports out of
+        the launch.
+        """
+        if self.context.get_start_method() == "forkserver":
+            multiprocessing.forkserver.ensure_running()
+        self.warm = True
+
+    def create(self, index: int, specs: list[AgentSpec], **kwargs) -> AgentShard:
+        """
+        Args:
+            index (int): The index of the shard.
+            specs (list[AgentSpec]): The agents of the shard, their classes are added to the preload modules
+            if the server is not running yet.
+            kwargs: Other arguments of the shard (checkpoint_store and resume_snapshot).
+
+        Returns:
+            AgentShard: The shard, not started.
+        """
+        if not self.warm:
+            modules = {spec.agent_class.__module__ for spec in specs}
+            self.preload.extend(sorted(modules - set(self.preload)))
+            if self.context.get_start_method() == "forkserver":
+                self.context.set_forkserver_preload(self.preload)
+            self.warm_up()
+        return AgentShard(index=index, specs=specs, context=self.context, **kwargs)
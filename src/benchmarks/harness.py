@@ -0,0 +1,163 @@
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Timings of one benchmark case. "items" is the amount of work done by one repetition (bytes, messages,
+    samples...) in the unit "unit", so the throughput is items / median seconds.
+    """
+
+    name: str
+    params: dict[str, Any]
+    times: list[float]
+    items: float = 1
+    unit: str = "ops"
+    skipped: str | None = None
+
+    @property
+    def key(self) -> str:
+        params = ",".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.name}[{params}]" if params else self.name
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.times) if self.times else float("nan")
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.median if self.times else float("nan")
+
+    def to_dict(self) -> dict[str, Any]:
+        result = asdict(self)
+        result.update(
+            key=self.key,
+            median=self.median,
+            min=min(self.times) if self.times else None,
+            throughput=self.throughput,
+        )
+        return result
+
+
+@dataclass
+class BenchmarkSuite:
+    """
+    Collects the benchmark cases and runs them with a fixed seed, warmup repetitions and measured repetitions.
+    The results are written as JSON and can be compared with the results of a previous run (the baseline).
+    """
+
+    repeats: int = 5
+    warmup: int = 1
+    seed: int = 0
+    results: list[BenchmarkResult] = field(default_factory=list)
+
+    def seed_everything(self) -> None:
+        random.seed(self.seed)
+        np.random.seed(self.seed)
+        torch.manual_seed(self.seed)
+
+    def measure(
+        self,
+        name: str,
+        function: Callable[[], Any],
+        params: dict[str, Any] = None,
+        items: float = 1,
+        unit: str = "ops",
+        setup: Callable[[], Any] = None,
+    ) -> BenchmarkResult:
+        """
+        Times the function. If setup is given, it runs before every repetition (not timed) and its result
+        is passed to the function.
+        """
+        self.seed_everything()
+        times = []
+        for i in range(self.warmup + self.repeats):
+            argument = setup() if setup is not None else None
+            gc.collect()
+            start = time.perf_counter()
+            function(argument) if setup is not None else function()
+            elapsed = time.perf_counter() - start
+            if i >= self.warmup:
+                times.append(elapsed)
+        result = BenchmarkResult(
+            name=name, params=params or {}, times=times, items=items, unit=unit
+        )
+        self.results.append(result)
+        print(
+            f"{result.key:<60} {result.median * 1000:>10.3f} ms {result.throughput:>14.1f} {unit}/s"
+        )
+        return result
+
+    def skip(self, name: str, reason: str, params: dict[str, Any] = None) -> None:
+        result = BenchmarkResult(
+            name=name, params=params or {}, times=[], skipped=reason
+        )
+        self.results.append(result)
+        print(f"{result.key:<60} skipped: {reason}")
+
+    def get_environment(self) -> dict[str, Any]:
+        return {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "numpy": np.__version__,
+            "seed": self.seed,
+            "repeats": self.repeats,
+            "warmup": self.warmup,
+        }
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "environment": self.get_environment(),
+                    "results": [r.to_dict() for r in self.results],
+                },
+                f,
+                indent=2,
+            )
+
+    def compare(self, baseline_path: str | Path, tolerance: float = 0.1) -> list[str]:
+        """
+        Compares the medians with a baseline results file.
+
+        Args:
+            baseline_path (str | Path): JSON file written by save.
+            tolerance (float, optional): Allowed relative slowdown. Defaults to 0.1 (10 %).
+
+        Returns:
+            list[str]: The description of the cases that are slower than the baseline beyond the tolerance.
+        """
+        with open(baseline_path) as f:
+            baseline = {r["key"]: r for r in json.load(f)["results"]}
+        regressions = []
+        for result in self.results:
+            reference = baseline.get(result.key)
+            if result.skipped or reference is None or reference["skipped"]:
+                continue
+            ratio = result.median / reference["median"]
+            status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+            print(f"{result.key:<60} {ratio:>8.2f}x baseline time {status}")
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    f"{result.key}: {reference['median'] * 1000:.3f} ms -> {result.median * 1000:.3f} ms"
+                )
+        return regressions
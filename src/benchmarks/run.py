@@ -0,0 +1,330 @@
+"""
+Benchmarks of the communication, data and launch hot paths. Run them from the src folder, with the agent
+folder in the path like the launcher does:
+
+    PYTHONPATH=agent python -m benchmarks.run --output results.json
+    PYTHONPATH=agent python -m benchmarks.run --baseline results.json --tolerance 0.1
+
+The command fails (exit code 1) if a case is slower than the baseline beyond the tolerance.
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import torch
+from aioxmpp import JID
+from spade.message import Message
+
+from base import AgentNodeBase
+from benchmarks.harness import BenchmarkSuite
+from launcher import LauncherAgent
+from nn.batched import BatchedCIFAR8TinyCNN
+from nn.cnn import CIFAR8TinyCNN
+from utilities.multipart import MultipartHandler
+from utilities.transport import OfflineConnection
+
+GROUPS = ("multipart", "fanout", "dataset", "training", "launcher")
+
+
+class StandInBehaviour:
+    """
+    Replaces the behaviour used to send: counts the messages instead of sending them to the XMPP server.
+    """
+
+    def __init__(self) -> None:
+        self.messages: int = 0
+        self.bytes: int = 0
+
+    async def send(self, msg: Message) -> None:
+        self.messages += 1
+        self.bytes += len(msg.body)
+
+
+class StandInAgent(OfflineConnection, AgentNodeBase):
+    """
+    Node agent of the launcher benchmark: it starts like the real agents in the container loop, but the
+    registration and connection to the XMPP server are replaced by connect_latency seconds of the event loop.
+    """
+
+    def __init__(self, jid: str, connect_latency: float) -> None:
+        super().__init__(jid=jid, password="benchmark", observers=[], neighbours=[])
+        self.connect_latency = connect_latency
+
+
+def bench_multipart(suite: BenchmarkSuite, sizes: list[int], max_size: int) -> None:
+    handler = MultipartHandler()
+    message_base = Message(to="receiver@localhost", sender="sender@localhost")
+    for size in sizes:
+        content = base64.b64encode(os.urandom(size * 3 // 4))
+        params = {"size": size, "max_size": max_size}
+        suite.measure(
+            "multipart_split",
+            lambda: handler.generate_multipart_messages(
+                content, max_size, message_base
+            ),
+            params=params,
+            items=len(content),
+            unit="B",
+        )
+
+        def rebuild(messages: list[Message]) -> None:
+            for message in messages:
+                rebuilt = handler.rebuild_multipart(message)
+            assert rebuilt is not None and len(rebuilt.body) == len(content)
+
+        suite.measure(
+            "multipart_rebuild",
+            rebuild,
+            params=params,
+            items=len(content),
+            unit="B",
+            setup=lambda: handler.generate_multipart_messages(
+                content, max_size, message_base
+            ),
+        )
+
+
+def bench_fanout(
+    suite: BenchmarkSuite, loop: asyncio.AbstractEventLoop, neighbours: list[int]
+) -> None:
+    model = CIFAR8TinyCNN()
+    state_dict = model.state_dict()
+    for count in neighbours:
+        agent = AgentNodeBase(
+            jid="sender@localhost",
+            password="benchmark",
+            observers=[],
+            neighbours=[JID.fromstr(f"node{i}@localhost") for i in range(count)],
+        )
+        body = agent.payload_codec.encode(state_dict)
+        params = {"neighbours": count}
+        behaviour = StandInBehaviour()
+        suite.measure(
+            "send_to_neighbours",
+            lambda: loop.run_until_complete(
+                agent.send_to_neighbours(
+                    Message(sender="sender@localhost", body=body), behaviour=behaviour
+                )
+            ),
+            params=params,
+            items=count,
+            unit="msg",
+        )
+        suite.measure(
+            "broadcast_model",
+            lambda: loop.run_until_complete(
+                agent.broadcast_model(
+                    Message(sender="sender@localhost"),
+                    state_dict,
+                    behaviour=behaviour,
+                )
+            ),
+            params=params,
+            items=count,
+            unit="msg",
+        )
+
+
+def bench_dataset(suite: BenchmarkSuite, cifar_root: str | None) -> None:
+    if cifar_root is None or not os.path.isdir(cifar_root):
+        for name in ("cifarn_construction", "cifar8_get_subset"):
+            suite.skip(name, "the CIFAR-100 root is not available (--cifar-root)")
+        return
+    # Imported here, torchvision is only needed by this group
+    from dataset.cifar import CIFAR8
+
+    suite.measure(
+        "cifarn_construction",
+        lambda: CIFAR8(root=cifar_root, train=True),
+        params={"cache": False},
+    )
+    with tempfile.TemporaryDirectory() as cache_root:
+        CIFAR8(root=cifar_root, train=True, cache_root=cache_root)
+        suite.measure(
+            "cifarn_construction",
+            lambda: CIFAR8(root=cifar_root, train=True, cache_root=cache_root),
+            params={"cache": True},
+        )
+    dataset = CIFAR8(root=cifar_root, train=True)
+    for labels in (1, 4, 8):
+        subset = dataset.get_subset(list(range(labels)))
+        suite.measure(
+            "cifar8_get_subset",
+            lambda: dataset.get_subset(list(range(labels))),
+            params={"labels": labels},
+            items=len(subset),
+            unit="samples",
+        )
+
+
+def bench_training(suite: BenchmarkSuite, batch_sizes: list[int], steps: int) -> None:
+    model = CIFAR8TinyCNN()
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+    criterion = torch.nn.CrossEntropyLoss()
+    for batch_size in batch_sizes:
+        inputs = torch.randn(batch_size, 3, 32, 32)
+        targets = torch.randint(0, 8, (batch_size,))
+
+        def train() -> None:
+            for _ in range(steps):
+                optimizer.zero_grad()
+                criterion(model(inputs), targets).backward()
+                optimizer.step()
+
+        suite.measure(
+            "cifar8_tiny_cnn_train",
+            train,
+            params={"batch_size": batch_size, "threads": torch.get_num_threads()},
+            items=steps * batch_size,
+            unit="samples",
+        )
+
+
+def bench_batched_training(
+    suite: BenchmarkSuite, model_counts: list[int], batch_size: int, steps: int
+) -> None:
+    criterion = torch.nn.CrossEntropyLoss()
+    for count in model_counts:
+        models = [CIFAR8TinyCNN() for _ in range(count)]
+        inputs = torch.randn(count, batch_size, 3, 32, 32)
+        targets = torch.randint(0, 8, (count, batch_size))
+        optimizers = [torch.optim.SGD(m.parameters(), lr=0.01) for m in models]
+
+        def train_sequentially() -> None:
+            for _ in range(steps):
+                for model, optimizer, x, y in zip(models, optimizers, inputs, targets):
+                    optimizer.zero_grad()
+                    criterion(model(x), y).backward()
+                    optimizer.step()
+
+        batched = BatchedCIFAR8TinyCNN(models)
+        batched_optimizer = torch.optim.SGD(batched.parameters(), lr=0.01)
+
+        def train_batched() -> None:
+            for _ in range(steps):
+                batched.train_step(inputs, targets, batched_optimizer)
+            batched.write_back()
+
+        params = {"models": count, "batch_size": batch_size}
+        for name, function in (
+            ("multi_model_train_sequential", train_sequentially),
+            ("multi_model_train_batched", train_batched),
+        ):
+            suite.measure(
+                name,
+                function,
+                params=params,
+                items=steps * count * batch_size,
+                unit="samples",
+            )
+
+
+def bench_launcher(
+    suite: BenchmarkSuite, agent_counts: list[int], connect_latency: float
+) -> None:
+    launchers: list[LauncherAgent] = []
+
+    def stop_launchers() -> None:
+        # All the agents share the container, so the agents of the previous repetition are stopped
+        for launcher in launchers:
+            launcher.stop_agents()
+        launchers.clear()
+
+    for count in agent_counts:
+
+        def build_launcher() -> LauncherAgent:
+            stop_launchers()
+            agents = [
+                StandInAgent(f"node{i}@localhost", connect_latency)
+                for i in range(count)
+            ]
+            launcher = LauncherAgent(
+                jid="launcher@localhost",
+                password="benchmark",
+                neighbours=[],
+                agents=agents,
+            )
+            launchers.append(launcher)
+            return launcher
+
+        def launch(launcher: LauncherAgent) -> None:
+            # The launcher prints a line per agent
+            with contextlib.redirect_stdout(io.StringIO()):
+                launcher.launch_agents_concurrently().result()
+            assert launcher.all_agents_are_launched()
+
+        suite.measure(
+            "launcher_startup",
+            launch,
+            params={"agents": count, "connect_latency": connect_latency},
+            items=count,
+            unit="agents",
+            setup=build_launcher,
+        )
+    stop_launchers()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the communication, data and launch hot paths."
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Results file of a previous run.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--cifar-root", help="Root folder of CIFAR-100.")
+    parser.add_argument(
+        "--quick", action="store_true", help="Runs the smallest cases only."
+    )
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(repeats=args.repeats, warmup=args.warmup, seed=args.seed)
+    loop = asyncio.new_event_loop()
+    if "multipart" in args.only:
+        sizes = [1024 * 1024] + (
+            [] if args.quick else [4 * 1024 * 1024, 32 * 1024 * 1024]
+        )
+        bench_multipart(suite, sizes=sizes, max_size=256 * 1024)
+    if "fanout" in args.only:
+        bench_fanout(suite, loop, neighbours=[1, 8] + ([] if args.quick else [64]))
+    if "dataset" in args.only:
+        bench_dataset(suite, cifar_root=args.cifar_root)
+    if "training" in args.only:
+        bench_training(
+            suite, batch_sizes=[32] + ([] if args.quick else [128]), steps=10
+        )
+        bench_batched_training(
+            suite,
+            model_counts=[16] + ([] if args.quick else [64]),
+            batch_size=8,
+            steps=5,
+        )
+    if "launcher" in args.only:
+        bench_launcher(
+            suite,
+            agent_counts=[10, 100] + ([] if args.quick else [1000]),
+            connect_latency=0.01,
+        )
+    loop.close()
+
+    suite.save(args.output)
+    print(f"Results saved in {args.output}")
+    if args.baseline is not None:
+        regressions = suite.compare(args.baseline, tolerance=args.tolerance)
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
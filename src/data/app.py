@@ -1,6 +1,12 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 from data.algorithm import AlgorithmData
 from data.log import LogData
-from agent.launcher import LauncherAgent
+
+if TYPE_CHECKING:
+    from agent.launcher import LauncherAgent
 
 
 class AppData:
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+
+
+class DatasetCache:
+    """
+    Class created to share a preprocessed (filtered and remapped) dataset split between all the agents of a host.
+    The images are written once to a uint8 ".npy" file and the targets and class names to an index ".npz" file.
+    The agents open the images as a read-only memory map, so all of them, even in different processes,
+    share the same page cache copy instead of decoding and keeping their own copy of the dataset.
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_root: str | Path) -> None:
+        self.cache_root = Path(cache_root)
+
+    def get_key(self, name: str, classes_names: list[str], train: bool) -> str:
+        description = json.dumps(
+            {
+                "name": name,
+                "classes": classes_names,
+                "train": train,
+                "version": self.VERSION,
+            }
+        )
+        digest = hashlib.sha1(description.encode("utf-8")).hexdigest()[:16]
+        return f"{name}-{'train' if train else 'test'}-{digest}"
+
+    def get_data_path(self, key: str) -> Path:
+        return self.cache_root / f"{key}.data.npy"
+
+    def get_index_path(self, key: str) -> Path:
+        return self.cache_root / f"{key}.index.npz"
+
+    def exists(self, key: str) -> bool:
+        # The index is written after the data, so its existence means that the entry is complete
+        return self.get_index_path(key).is_file() and self.get_data_path(key).is_file()
+
+    def save(
+        self,
+        key: str,
+        data: np.ndarray,
+        targets: np.ndarray,
+        classes: list[str],
+        class_to_idx: dict[str, int],
+    ) -> None:
+        """
+        Writes a dataset split to the cache. The files are written to temporary names and renamed, so
+        concurrent writers (several agents building the same split at startup) never expose partial files.
+        """
+        self.cache_root.mkdir(parents=True, exist_ok=True)
+        data_path = self.get_data_path(key)
+        index_path = self.get_index_path(key)
+        data_temporary = self.write_temporary(
+            key,
+            lambda f: np.save(f, np.ascontiguousarray(data, dtype=np.uint8)),
+        )
+        index_temporary = self.write_temporary(
+            key,
+            lambda f: np.savez(
+                f,
+                targets=np.asarray(targets, dtype=np.int64),
+                classes=np.asarray(classes),
+                class_names=np.asarray(list(class_to_idx.keys())),
+                class_ids=np.asarray(list(class_to_idx.values()), dtype=np.int64),
+            ),
+        )
+        os.replace(data_temporary, data_path)
+        os.replace(index_temporary, index_path)
+
+    def write_temporary(self, key: str, write: Callable[[BinaryIO], None]) -> str:
+        """
+        Writes a file with a unique temporary name in the cache root, so every writer (even in the same
+        process) has its own file.
+
+        Returns:
+            str: The path of the temporary file.
+        """
+        descriptor, path = tempfile.mkstemp(
+            prefix=f"{key}.", suffix=".tmp", dir=self.cache_root
+        )
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                write(f)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def load(
+        self, key: str
+    ) -> tuple[np.ndarray, np.ndarray, list[str], dict[str, int]]:
+        """
+        Opens a cached dataset split.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, list[str], dict[str, int]]: The read-only memory mapped images,
+            the targets, the original class names and the class_to_idx of the selected classes.
+        """
+        data = np.load(self.get_data_path(key), mmap_mode="r")
+        with np.load(self.get_index_path(key), allow_pickle=False) as index:
+            targets = index["targets"]
+            classes = index["classes"].tolist()
+            class_to_idx = dict(
+                zip(index["class_names"].tolist(), index["class_ids"].tolist())
+            )
+        return data, targets, classes, class_to_idx
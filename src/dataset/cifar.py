@@ -1,6 +1,11 @@
+import numpy as np
 from torchvision import datasets
 from torch.utils.data import Subset
 
+from dataset.cache import DatasetCache
+from dataset.loader import TensorBatchLoader
+from dataset.partition import DataPartition, DataPartitioner
+
 
 class CIFARN(datasets.CIFAR100):
     def __init__(
@@ -11,10 +16,32 @@ class CIFARN(datasets.CIFAR100):
         transform=None,
         target_transform=None,
         download=False,
+        cache_root=None,
     ):
         if len(selected_classes_names) == 0:
             raise ValueError("selected_classes_names must have content.")
 
+        cache = DatasetCache(cache_root) if cache_root is not None else None
+        cache_key = (
+            cache.get_key(type(self).__name__, selected_classes_names, train)
+            if cache is not None
+            else None
+        )
+        if cache is not None and cache.exists(cache_key):
+            # Skips the CIFAR-100 decoding and shares the cached images through a memory map
+            datasets.VisionDataset.__init__(
+                self, root, transform=transform, target_transform=target_transform
+            )
+            self.train = train
+            self.data, self.targets, self.classes, self.class_to_idx = cache.load(
+                cache_key
+            )
+            self.original_class_mapping = {
+                self.classes.index(k): v for (k, v) in self.class_to_idx.items()
+            }
+            self.build_class_indices(num_classes=len(selected_classes_names))
+            return
+
         super().__init__(
             root,
             train=train,
@@ -23,31 +50,54 @@ class CIFARN(datasets.CIFAR100):
             download=download,
         )
 
+        new_idx = {k: i for (i, k) in enumerate(selected_classes_names)}
         selected_classes = {
-            k: v for (k, v) in self.class_to_idx.items() if k in selected_classes_names
+            k: v for (k, v) in self.class_to_idx.items() if k in new_idx
         }  # example: {'bicycle': 8, 'dolphin': 30, 'motorcycle': 48, 'ray': 67, 'shark': 73, 'tank': 85, 'tractor': 89, 'trout': 91}
         self.class_to_idx = {
-            k: selected_classes_names.index(k)
-            for (k, v) in self.class_to_idx.items()
-            if k in selected_classes_names
+            k: new_idx[k] for k in selected_classes.keys()
         }  # example: {'bicycle': 4, 'dolphin': 3, 'motorcycle': 5, 'ray': 0, 'shark': 2, 'tank': 6, 'tractor': 7, 'trout': 1}
         self.original_class_mapping = {
             selected_classes[k]: self.class_to_idx[k] for k in selected_classes.keys()
         }  # example: {8: 4, 30: 3, 48: 5 ...}
 
-        # Filter and remap classes
-        mask = [target in self.original_class_mapping for target in self.targets]
+        # Filter and remap classes with a lookup table, -1 marks the discarded classes
+        lookup_table = np.full(len(self.classes), -1, dtype=np.int64)
+        for original, new in self.original_class_mapping.items():
+            lookup_table[original] = new
+        remapped_targets = lookup_table[np.asarray(self.targets, dtype=np.int64)]
+        mask = remapped_targets >= 0
         self.data = self.data[mask]
-        self.targets = [
-            self.original_class_mapping[target]
-            for target in self.targets
-            if target in self.original_class_mapping
-        ]
+        self.targets = remapped_targets[mask]
+        self.build_class_indices(num_classes=len(selected_classes_names))
+        if cache is not None:
+            cache.save(
+                cache_key,
+                data=self.data,
+                targets=self.targets,
+                classes=self.classes,
+                class_to_idx=self.class_to_idx,
+            )
+            self.data, _, _, _ = cache.load(cache_key)
+
+    def build_class_indices(self, num_classes: int) -> None:
+        """
+        Precomputes the sample indices of every class, sorted in ascending order.
+        """
+        order = np.argsort(self.targets, kind="stable")
+        counts = np.bincount(self.targets, minlength=num_classes)
+        self.class_indices: list[np.ndarray] = np.split(order, np.cumsum(counts)[:-1])
 
 
 class CIFAR8(CIFARN):
     def __init__(
-        self, root, train=True, transform=None, target_transform=None, download=False
+        self,
+        root,
+        train=True,
+        transform=None,
+        target_transform=None,
+        download=False,
+        cache_root=None,
     ):
         self.selected_classes_names = [
             "ray",
@@ -67,11 +117,13 @@ class CIFAR8(CIFARN):
             transform=transform,
             target_transform=target_transform,
             download=download,
+            cache_root=cache_root,
         )
 
     def get_subset(self, labels: list[str] | list[int]) -> Subset:
         """
         Returns a torch.utils.data.Subset containing only the filtered data that match the labels passed by the argument.
+        The indices are grouped by label, in the order of the labels argument.
 
         Args:
             labels (list[str] | list[int]): list of label names or label IDs.
@@ -79,11 +131,53 @@ class CIFAR8(CIFARN):
         Returns:
             Subset: Torch Subset containing the filtered data.
         """
-        idx_labels = [
+        idx_labels = dict.fromkeys(
             self.class_to_idx[lbl] if isinstance(lbl, str) else lbl for lbl in labels
-        ]
+        )
 
-        filtered_indices = [
-            idx for idx, lbl in enumerate(self.targets) if lbl in idx_labels
-        ]
+        filtered_indices = np.concatenate(
+            [np.empty(0, dtype=np.int64)]
+            + [
+                self.class_indices[lbl]
+                for lbl in idx_labels
+                if 0 <= lbl < len(self.class_indices)
+            ]
+        )
         return Subset(self, filtered_indices)
+
+    def get_partitioner(self, seed: int = 0) -> DataPartitioner:
+        return DataPartitioner(
+            targets=self.targets,
+            num_classes=len(self.selected_classes_names),
+            seed=seed,
+        )
+
+    def get_partition_subset(self, partition: DataPartition, client: int) -> Subset:
+        """
+        Returns a torch.utils.data.Subset with the samples of one client of a partition.
+
+        Args:
+            partition (DataPartition): Partition generated by a DataPartitioner from the targets of this dataset.
+            client (int): Index of the client.
+
+        Returns:
+            Subset: Torch Subset containing the data of the client.
+        """
+        return Subset(self, partition.get_indices(client))
+
+    def get_tensor_loader(
+        self, indices: np.ndarray | list[int] = None, **kwargs
+    ) -> TensorBatchLoader:
+        """
+        Returns a TensorBatchLoader with the samples of the indices (all of them by default). It yields
+        normalized float batches without going through the per-sample PIL transforms.
+
+        Args:
+            indices (np.ndarray | list[int], optional): Indices of the samples. Defaults to None.
+            **kwargs: Arguments of the TensorBatchLoader, like batch_size, shuffle, mean and std.
+
+        Returns:
+            TensorBatchLoader: The loader of the samples.
+        """
+        dataset = self if indices is None else Subset(self, indices)
+        return TensorBatchLoader.from_dataset(dataset, **kwargs)
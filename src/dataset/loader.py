@@ -0,0 +1,111 @@
+from collections.abc import Iterator
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import Dataset, Subset
+
+
+class TensorBatchLoader:
+    """
+    Class created to replace the DataLoader of small image datasets (like CIFAR8) when the per-sample PIL
+    transforms are the bottleneck of the training. All the images are kept in one contiguous uint8 tensor
+    and every batch is gathered, converted to float, augmented and normalized with batch-wise tensor operations.
+
+    The images are uint8 with shape (N, H, W, C), like the "data" of the CIFAR datasets. The supported
+    augmentations are the ones used with CIFAR: random horizontal flip and random crop with zero padding.
+    """
+
+    def __init__(
+        self,
+        images: np.ndarray | torch.Tensor,
+        targets: np.ndarray | torch.Tensor | list[int],
+        batch_size: int = 64,
+        shuffle: bool = True,
+        mean: tuple[float, ...] = None,
+        std: tuple[float, ...] = None,
+        random_horizontal_flip: bool = False,
+        random_crop_padding: int = 0,
+        drop_last: bool = False,
+        generator: torch.Generator = None,
+    ) -> None:
+        self.images = (
+            torch.as_tensor(np.ascontiguousarray(images))
+            .permute(0, 3, 1, 2)
+            .contiguous()
+        )
+        self.targets = torch.as_tensor(np.asarray(targets), dtype=torch.int64)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        channels = self.images.shape[1]
+        self.mean = torch.tensor(
+            mean if mean is not None else (0.0,) * channels
+        ).view(1, channels, 1, 1)
+        self.std = torch.tensor(std if std is not None else (1.0,) * channels).view(
+            1, channels, 1, 1
+        )
+        self.random_horizontal_flip = random_horizontal_flip
+        self.random_crop_padding = random_crop_padding
+        self.drop_last = drop_last
+        self.generator = generator
+
+    @classmethod
+    def from_dataset(cls, dataset: Dataset, **kwargs) -> "TensorBatchLoader":
+        """
+        Builds the loader from a dataset with "data" and "targets" (for example CIFAR8) or a Subset of it.
+        """
+        indices = None
+        while isinstance(dataset, Subset):
+            indices = (
+                np.asarray(dataset.indices)
+                if indices is None
+                else np.asarray(dataset.indices)[indices]
+            )
+            dataset = dataset.dataset
+        images = dataset.data
+        targets = np.asarray(dataset.targets)
+        if indices is not None:
+            images = images[indices]
+            targets = targets[indices]
+        return cls(images=images, targets=targets, **kwargs)
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return len(self.targets) // self.batch_size
+        return -(-len(self.targets) // self.batch_size)
+
+    def random_crop(self, batch: torch.Tensor) -> torch.Tensor:
+        padding = self.random_crop_padding
+        n, c, h, w = batch.shape
+        padded = F.pad(batch, (padding, padding, padding, padding))
+        offsets = torch.randint(
+            0, 2 * padding + 1, (2, n), generator=self.generator
+        )
+        rows = offsets[0][:, None] + torch.arange(h)
+        columns = offsets[1][:, None] + torch.arange(w)
+        return padded[
+            torch.arange(n)[:, None, None, None],
+            torch.arange(c)[None, :, None, None],
+            rows[:, None, :, None],
+            columns[:, None, None, :],
+        ]
+
+    def __iter__(self) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+        size = len(self.targets)
+        order = (
+            torch.randperm(size, generator=self.generator)
+            if self.shuffle
+            else torch.arange(size)
+        )
+        for start in range(0, size, self.batch_size):
+            indices = order[start : start + self.batch_size]
+            if self.drop_last and len(indices) < self.batch_size:
+                break
+            batch = self.images[indices].float().div_(255)
+            if self.random_horizontal_flip:
+                flip = torch.rand(len(indices), generator=self.generator) < 0.5
+                batch[flip] = batch[flip].flip(3)
+            if self.random_crop_padding > 0:
+                batch = self.random_crop(batch)
+            batch.sub_(self.mean).div_(self.std)
+            yield batch, self.targets[indices]
@@ -0,0 +1,159 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+class DataPartition:
+    """
+    Sample indices of every client stored as one concatenated array and the offsets where each client starts,
+    so the indices of a client are a slice and the whole partition is saved and loaded as two arrays.
+    """
+
+    def __init__(
+        self, indices: np.ndarray, offsets: np.ndarray, description: dict = None
+    ) -> None:
+        self.indices = indices
+        self.offsets = offsets
+        self.description = description if description is not None else {}
+
+    @classmethod
+    def from_assignment(
+        cls, client_of_sample: np.ndarray, num_clients: int, description: dict = None
+    ) -> "DataPartition":
+        """
+        Builds the partition from the client assigned to every sample, -1 means that the sample is not used.
+        """
+        assigned = np.flatnonzero(client_of_sample >= 0)
+        clients = client_of_sample[assigned]
+        order = np.argsort(clients, kind="stable")
+        counts = np.bincount(clients, minlength=num_clients)
+        offsets = np.zeros(num_clients + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        dtype = np.int32 if len(client_of_sample) < np.iinfo(np.int32).max else np.int64
+        return cls(
+            indices=assigned[order].astype(dtype),
+            offsets=offsets,
+            description=description,
+        )
+
+    @property
+    def num_clients(self) -> int:
+        return len(self.offsets) - 1
+
+    def get_indices(self, client: int) -> np.ndarray:
+        return self.indices[self.offsets[client] : self.offsets[client + 1]]
+
+    def get_sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def save(self, path: str | Path) -> None:
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                indices=self.indices,
+                offsets=self.offsets,
+                description=np.asarray(json.dumps(self.description)),
+            )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "DataPartition":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                indices=data["indices"],
+                offsets=data["offsets"],
+                description=json.loads(data["description"].item()),
+            )
+
+
+class DataPartitioner:
+    """
+    Class created to split the samples of a dataset among the clients (agents) of a federated experiment.
+    Every partition is computed with vectorized operations over the targets (looping only over the classes),
+    it is reproducible through the seed and it can be saved once and loaded by every agent.
+
+    The available partitions are:
+        - iid: the samples are shuffled and dealt evenly among the clients.
+        - label_skew: every client has only "labels_per_client" labels and the samples of each label are
+          dealt evenly among the clients that have it.
+        - dirichlet: the proportion of the samples of each label that goes to each client follows a
+          Dirichlet(alpha) distribution, the lower the alpha the more non-IID the partition is.
+    """
+
+    def __init__(self, targets: np.ndarray, num_classes: int = None, seed: int = 0):
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.num_classes = (
+            num_classes if num_classes is not None else int(self.targets.max()) + 1
+        )
+        self.seed = seed
+
+    def get_class_indices(self, rng: np.random.Generator) -> list[np.ndarray]:
+        order = np.argsort(self.targets, kind="stable")
+        counts = np.bincount(self.targets, minlength=self.num_classes)
+        return [rng.permutation(c) for c in np.split(order, np.cumsum(counts)[:-1])]
+
+    def iid(self, num_clients: int) -> DataPartition:
+        rng = np.random.default_rng(self.seed)
+        client_of_sample = np.empty(len(self.targets), dtype=np.int64)
+        client_of_sample[rng.permutation(len(self.targets))] = (
+            np.arange(len(self.targets)) % num_clients
+        )
+        return DataPartition.from_assignment(
+            client_of_sample,
+            num_clients,
+            {"method": "iid", "num_clients": num_clients, "seed": self.seed},
+        )
+
+    def label_skew(self, num_clients: int, labels_per_client: int) -> DataPartition:
+        if not 0 < labels_per_client <= self.num_classes:
+            raise ValueError(
+                f"labels_per_client must be between 1 and {self.num_classes}."
+            )
+        rng = np.random.default_rng(self.seed)
+        # Consecutive clients take consecutive labels of a shuffled label order, so every label is used
+        # as long as num_clients * labels_per_client >= num_classes
+        label_order = rng.permutation(self.num_classes)
+        client_labels = label_order[
+            (
+                np.arange(num_clients)[:, None] * labels_per_client
+                + np.arange(labels_per_client)
+            )
+            % self.num_classes
+        ]
+        client_of_sample = np.full(len(self.targets), -1, dtype=np.int64)
+        for label, indices in enumerate(self.get_class_indices(rng)):
+            holders = np.flatnonzero((client_labels == label).any(axis=1))
+            if len(holders) > 0:
+                client_of_sample[indices] = holders[
+                    np.arange(len(indices)) % len(holders)
+                ]
+        return DataPartition.from_assignment(
+            client_of_sample,
+            num_clients,
+            {
+                "method": "label_skew",
+                "num_clients": num_clients,
+                "labels_per_client": labels_per_client,
+                "seed": self.seed,
+            },
+        )
+
+    def dirichlet(self, num_clients: int, alpha: float) -> DataPartition:
+        if alpha <= 0:
+            raise ValueError("alpha must be greater than 0.")
+        rng = np.random.default_rng(self.seed)
+        proportions = rng.dirichlet(np.full(num_clients, alpha), size=self.num_classes)
+        client_of_sample = np.empty(len(self.targets), dtype=np.int64)
+        for label, indices in enumerate(self.get_class_indices(rng)):
+            counts = rng.multinomial(len(indices), proportions[label])
+            client_of_sample[indices] = np.repeat(np.arange(num_clients), counts)
+        return DataPartition.from_assignment(
+            client_of_sample,
+            num_clients,
+            {
+                "method": "dirichlet",
+                "num_clients": num_clients,
+                "alpha": alpha,
+                "seed": self.seed,
+            },
+        )
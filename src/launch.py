@@ -1,25 +1,36 @@
-import time
-
-from agent.launcher import LauncherAgent
-from data.app import AppData
-from data.algorithm import AlgorithmData, FLAMAS, COL, ACOL, ACOAL
-from log.log import CsvLogHandler
+from utilities.startup import StartupTimer
 
 if __name__ == "__main__":
+    timer = StartupTimer()
+    with timer.phase("imports"):
+        from data.app import AppData
+        from data.algorithm import ACOL
+        from log.log import CsvLogHandler
+
     log = CsvLogHandler()
     app = AppData(algorithm=ACOL, log=log)
     launcher = app.get_launcher_agent()
-    future = launcher.start(auto_register=True)
-    future.result()
+    timer.set_metrics(launcher.metrics)
+    if launcher.checkpoint_store is not None:
+        snapshot = launcher.restore()
+        if snapshot is not None:
+            print(f"[{launcher.name}] Agents resumed from the snapshot {snapshot}.")
+    with timer.phase("launcher_registration"):
+        future = launcher.start(auto_register=True)
+        future.result()
     try:
-        while not launcher.all_agents_are_launched():
-            time.sleep(1)
+        with timer.phase("agents_launch"):
+            launcher.wait_for_launch()
+        print(f"[{launcher.name}] Startup times:\n{timer.report()}")
         print(
             f"[{launcher.name}] All agents are launched. Waiting for them to finish..."
         )
         launcher.wait_for_agents()
     except KeyboardInterrupt:
         print("Experiment cancelled by keyboard interruption.")
+        if launcher.checkpoint_store is not None:
+            snapshot = launcher.checkpoint()
+            print(f"[{launcher.name}] Agents saved in the snapshot {snapshot}.")
     finally:
         launcher.stop_agents()
         future = launcher.stop()
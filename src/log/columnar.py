@@ -0,0 +1,225 @@
+import logging
+import os
+import socket
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from data.log import LogData
+
+
+class ColumnarLogWriter:
+    """
+    Class created to store experiment logs in a compact binary columnar format instead of text CSV.
+    The rows are buffered in memory and written as compressed, append-only ".npz" segments with typed columns:
+        - "timestamp": float64 seconds since the epoch.
+        - "agent" and "category": int32 codes of the dictionaries "agent_names" and "category_names".
+        - "metric:[name]": one float64 column per metric, NaN when a row does not have the metric.
+    Every writer writes its own segments, named with the host, the process id, a random identifier of the writer
+    and a sequence number, so several writers (in the same or in different processes) can write to the same folder. The segments are merged by export_logs.
+    """
+
+    def __init__(
+        self, segments_folder: str | Path, segment_size: int = 65536, prefix: str = None
+    ) -> None:
+        self.segments_folder = Path(segments_folder)
+        self.segment_size = segment_size
+        self.prefix = (
+            prefix
+            if prefix is not None
+            else f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self.sequence: int = 0
+        self.clear()
+
+    def clear(self) -> None:
+        self.timestamps: list[float] = []
+        self.agents: list[int] = []
+        self.categories: list[int] = []
+        self.metrics: dict[str, list[float]] = {}
+        self.agent_codes: dict[str, int] = {}
+        self.category_codes: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(
+        self, timestamp: float, agent: str, category: str, metrics: dict[str, float]
+    ) -> None:
+        row = len(self.timestamps)
+        self.timestamps.append(timestamp)
+        self.agents.append(self.agent_codes.setdefault(agent, len(self.agent_codes)))
+        self.categories.append(
+            self.category_codes.setdefault(category, len(self.category_codes))
+        )
+        for name in metrics.keys() - self.metrics.keys():
+            self.metrics[name] = [np.nan] * row
+        for name, column in self.metrics.items():
+            column.append(metrics.get(name, np.nan))
+        if len(self.timestamps) >= self.segment_size:
+            self.flush()
+
+    def flush(self) -> Path | None:
+        """
+        Writes the buffered rows as a new segment.
+
+        Returns:
+            Path | None: The path of the segment or None if there were no rows.
+        """
+        if len(self.timestamps) == 0:
+            return None
+        path = self.segments_folder / f"{self.prefix}-{self.sequence:06d}.npz"
+        columns = {
+            "timestamp": np.asarray(self.timestamps, dtype=np.float64),
+            "agent": np.asarray(self.agents, dtype=np.int32),
+            "category": np.asarray(self.categories, dtype=np.int32),
+            "agent_names": np.asarray(list(self.agent_codes.keys()), dtype=str),
+            "category_names": np.asarray(list(self.category_codes.keys()), dtype=str),
+        }
+        for name, column in self.metrics.items():
+            columns[f"metric:{name}"] = np.asarray(column, dtype=np.float64)
+        save_segment(path, columns)
+        self.sequence += 1
+        self.clear()
+        return path
+
+
+class ColumnarLogHandler(logging.Handler):
+    """
+    Logging handler that stores the numeric metrics of the records in a ColumnarLogWriter. The records must
+    carry the metrics in their extra fields: logger.info("...", extra={"agent": "a1@localhost",
+    "category": "Training Logs", "metrics": {"loss": 0.3, "accuracy": 0.9}}). When the handler is closed,
+    the logs are exported if LogData.export_logs_at_end_of_execution is set and the handler is the owner of the
+    export: only one process (the launcher) must export, the handlers of the other processes (for example, the
+    shards) are created with export_at_close=False and only write their segments. A handler inherited by a forked
+    process never exports.
+    """
+
+    def __init__(
+        self,
+        log_data: LogData,
+        segments_folder: str | Path = None,
+        export_at_close: bool = True,
+        **kwargs,
+    ) -> None:
+        super().__init__()
+        self.log_data = log_data
+        self.export_at_close = export_at_close
+        self.owner_pid = os.getpid()
+        self.segments_folder = Path(
+            segments_folder
+            if segments_folder is not None
+            else Path(log_data.logs_root_folder) / "segments"
+        )
+        self.writer = ColumnarLogWriter(self.segments_folder, **kwargs)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.acquire()
+            try:
+                self.writer.append(
+                    timestamp=record.created,
+                    agent=str(getattr(record, "agent", record.name)),
+                    category=str(getattr(record, "category", "")),
+                    metrics=getattr(record, "metrics", {}),
+                )
+            finally:
+                self.release()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            self.writer.flush()
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.flush()
+        if (
+            self.log_data.export_logs_at_end_of_execution
+            and self.export_at_close
+            and os.getpid() == self.owner_pid
+        ):
+            # Imported here to avoid a circular import, export imports this module
+            from log.export import export_logs
+
+            export_logs(log_data=self.log_data, segments_folder=self.segments_folder)
+        super().close()
+
+
+def load_segment(path: str | Path) -> dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as segment:
+        return {name: segment[name] for name in segment.files}
+
+
+def save_segment(path: str | Path, columns: dict[str, np.ndarray]) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix(".tmp")
+    with open(temporary_path, "wb") as f:
+        np.savez_compressed(f, **columns)
+    os.replace(temporary_path, path)
+
+
+def merge_columns(parts: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """
+    Merges several segments, remapping the agent and category codes to common dictionaries. The metrics that
+    are missing in a segment are filled with NaN.
+
+    Returns:
+        dict[str, np.ndarray]: The merged columns, with the same layout as one segment.
+    """
+    agent_names: dict[str, int] = {}
+    category_names: dict[str, int] = {}
+    metric_names: dict[str, None] = {}
+    remapped_parts: list[dict[str, np.ndarray]] = []
+    for columns in parts:
+        agents_map = np.asarray(
+            [
+                agent_names.setdefault(a, len(agent_names))
+                for a in columns["agent_names"]
+            ],
+            dtype=np.int32,
+        )
+        categories_map = np.asarray(
+            [
+                category_names.setdefault(c, len(category_names))
+                for c in columns["category_names"]
+            ],
+            dtype=np.int32,
+        )
+        columns = dict(columns)
+        columns["agent"] = agents_map[columns["agent"]]
+        columns["category"] = categories_map[columns["category"]]
+        metric_names.update(
+            dict.fromkeys(n for n in columns if n.startswith("metric:"))
+        )
+        remapped_parts.append(columns)
+    merged = {
+        "agent_names": np.asarray(list(agent_names.keys()), dtype=str),
+        "category_names": np.asarray(list(category_names.keys()), dtype=str),
+    }
+    for name, dtype in (
+        ("timestamp", np.float64),
+        ("agent", np.int32),
+        ("category", np.int32),
+    ):
+        merged[name] = np.concatenate(
+            [np.empty(0, dtype=dtype)] + [p[name] for p in remapped_parts]
+        )
+    for name in metric_names.keys():
+        merged[name] = np.concatenate(
+            [np.empty(0)]
+            + [
+                p[name] if name in p.keys() else np.full(len(p["timestamp"]), np.nan)
+                for p in remapped_parts
+            ]
+        )
+    return merged
+
+
+def read_segments(paths: list[str | Path]) -> dict[str, np.ndarray]:
+    return merge_columns([load_segment(path) for path in paths])
@@ -0,0 +1,129 @@
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+
+from data.log import LogData
+from log.columnar import load_segment, merge_columns, read_segments, save_segment
+
+
+def get_export_folder(log_data: LogData) -> Path:
+    """
+    Returns the experiment folder of the export: "[export_logs_root_path]/[export_logs_folder_prefix][N]".
+    The last folder (highest N) is reused if export_logs_append_to_last_log_folder_instead_of_create is set,
+    otherwise a new one is created.
+    """
+    root = Path(log_data.export_logs_root_path)
+    pattern = re.compile(rf"{re.escape(log_data.export_logs_folder_prefix)}(\d+)")
+    numbers = [
+        int(match.group(1))
+        for folder in (root.iterdir() if root.is_dir() else [])
+        if folder.is_dir() and (match := pattern.fullmatch(folder.name)) is not None
+    ]
+    if numbers and log_data.export_logs_append_to_last_log_folder_instead_of_create:
+        number = max(numbers)
+    else:
+        number = max(numbers) + 1 if numbers else 0
+    return root / f"{log_data.export_logs_folder_prefix}{number}"
+
+
+def select_rows(
+    columns: dict[str, np.ndarray], rows: np.ndarray
+) -> dict[str, np.ndarray]:
+    """
+    Returns the given rows of the columns, removing the metrics that are NaN in all of them.
+    """
+    selected = {
+        "timestamp": columns["timestamp"][rows],
+        "agent": columns["agent"][rows],
+        "category": columns["category"][rows],
+        "agent_names": columns["agent_names"],
+        "category_names": columns["category_names"],
+    }
+    for name, column in columns.items():
+        if name.startswith("metric:") and not np.isnan(column[rows]).all():
+            selected[name] = column[rows]
+    return selected
+
+
+def export_logs(
+    log_data: LogData,
+    segments_folder: str | Path = None,
+    file_name: str = "logs.npz",
+    remove_segments: bool = True,
+) -> Path:
+    """
+    Merges the columnar log segments of all the agents and processes into the experiment folder, with one
+    file per category folder of LogData.logs_folders (the rows of other categories go to a folder with the
+    name of the category). The rows are sorted by timestamp and, when the last experiment folder is reused,
+    merged with the rows already exported there.
+
+    Args:
+        log_data (LogData): The export options.
+        segments_folder (str | Path, optional): The folder of the segments. Defaults to "[logs_root_folder]/segments".
+        file_name (str, optional): The name of the file of each category. Defaults to "logs.npz".
+        remove_segments (bool, optional): Removes the segments once they are exported, so they are not exported twice. Defaults to True.
+
+    Returns:
+        Path: The experiment folder.
+    """
+    segments_folder = Path(
+        segments_folder
+        if segments_folder is not None
+        else Path(log_data.logs_root_folder) / "segments"
+    )
+    segments = sorted(segments_folder.glob("*.npz"))
+    export_folder = get_export_folder(log_data)
+    export_folder.mkdir(parents=True, exist_ok=True)
+    columns = read_segments(segments)
+    folders = {folder.lower(): folder for folder in log_data.logs_folders}
+    for code, category in enumerate(columns["category_names"]):
+        folder = folders.get(category.lower(), category if category else "Other Logs")
+        path = export_folder / folder / file_name
+        category_columns = select_rows(
+            columns, np.flatnonzero(columns["category"] == code)
+        )
+        if path.exists():
+            category_columns = merge_columns([load_segment(path), category_columns])
+        order = np.argsort(category_columns["timestamp"], kind="stable")
+        save_segment(path, select_rows(category_columns, order))
+    if remove_segments:
+        for segment in segments:
+            segment.unlink()
+    return export_folder
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Merges the columnar log segments into an experiment folder."
+    )
+    parser.add_argument("segments_folder", help="Folder of the .npz log segments.")
+    parser.add_argument("--export-root", default=LogData().export_logs_root_path)
+    parser.add_argument("--prefix", default=LogData().export_logs_folder_prefix)
+    parser.add_argument(
+        "--new-folder",
+        action="store_true",
+        help="Creates a new experiment folder instead of appending to the last one.",
+    )
+    parser.add_argument(
+        "--keep-segments",
+        action="store_true",
+        help="Does not remove the segments after the export.",
+    )
+    args = parser.parse_args()
+    log_data = LogData(
+        export_logs_root_path=args.export_root,
+        export_logs_folder_prefix=args.prefix,
+        export_logs_append_to_last_log_folder_instead_of_create=not args.new_folder,
+    )
+    export_folder = export_logs(
+        log_data=log_data,
+        segments_folder=args.segments_folder,
+        remove_segments=not args.keep_segments,
+    )
+    print(f"Logs exported to {export_folder}")
+
+
+if __name__ == "__main__":
+    main()
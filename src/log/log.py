@@ -1,5 +1,12 @@
+import atexit
 import logging
-from datetime import datetime
+import queue
+import time
+from pathlib import Path
+from threading import Event, Thread
+from typing import TextIO
+
+from data.log import LogData
 
 
 class CsvLogHandler(logging.StreamHandler):
@@ -9,10 +16,139 @@ class CsvLogHandler(logging.StreamHandler):
             f.write(f"{log_entry}\n")
 
 
-def setup_logging():
+class WriterRequest:
+    def __init__(self, stop: bool = False) -> None:
+        self.stop = stop
+        self.done = Event()
+
+
+class BatchedCsvLogHandler(logging.Handler):
+    """
+    Non-blocking version of the CsvLogHandler. The records are formatted and put in a queue by the agents,
+    and a background thread writes them in batches to files that are kept open, flushing them when the batch
+    size is reached or every flush interval.
+
+    If log_data is given, the records are routed to the category folders of LogData.logs_folders inside
+    LogData.logs_root_folder. The category of a record is its "category" attribute (logger.info(...,
+    extra={"category": "Message Logs"})) or the last component of the logger name ("spade.message" goes to
+    "Message Logs", "rrf.training_time" to "Training Time Logs"). Records without category go to default_file.
+    """
+
+    def __init__(
+        self,
+        log_data: LogData = None,
+        default_file: str = "spade_logs.csv",
+        file_name: str = "logs.csv",
+        batch_size: int = 1024,
+        flush_interval: float = 1.0,
+    ) -> None:
+        super().__init__()
+        self.log_data = log_data
+        self.default_file = Path(default_file)
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.categories: dict[str, str] = {}
+        if log_data is not None:
+            for folder in log_data.logs_folders:
+                self.categories[folder.lower()] = folder
+                key = folder.lower().removesuffix(" logs").replace(" ", "_")
+                self.categories[key] = folder
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.files: dict[Path, TextIO] = {}
+        self.writer = Thread(target=self.write_loop, name="csv-log-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def get_path(self, record: logging.LogRecord) -> Path:
+        if self.log_data is None:
+            return self.default_file
+        category = getattr(record, "category", None)
+        if category is None:
+            category = record.name.rsplit(".", 1)[-1]
+        folder = self.categories.get(str(category).lower())
+        if folder is None:
+            return self.default_file
+        return Path(self.log_data.logs_root_folder) / folder / self.file_name
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait((self.get_path(record), self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+    def get_file(self, path: Path) -> TextIO:
+        if not path in self.files.keys():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.files[path] = open(path, "a")
+        return self.files[path]
+
+    def write_batch(self, batch: dict[Path, list[str]]) -> None:
+        # The errors are reported and the lines dropped, so the writer thread keeps running
+        for path, lines in batch.items():
+            try:
+                f = self.get_file(path)
+                f.write("\n".join(lines))
+                f.write("\n")
+                f.flush()
+            except Exception as e:
+                print(
+                    f"[{self.writer.name}] {len(lines)} log lines not written to {path}, because: {e}."
+                )
+
+    def write_loop(self) -> None:
+        batch: dict[Path, list[str]] = {}
+        batch_length = 0
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if isinstance(item, WriterRequest):
+                # Flush or close request: everything queued before it is written
+                self.write_batch(batch)
+                batch, batch_length, last_flush = {}, 0, time.monotonic()
+                running = not item.stop
+                item.done.set()
+                continue
+            if item is not None:
+                path, line = item
+                batch.setdefault(path, []).append(line)
+                batch_length += 1
+            if batch_length >= self.batch_size or (
+                batch_length > 0
+                and time.monotonic() - last_flush >= self.flush_interval
+            ):
+                self.write_batch(batch)
+                batch, batch_length, last_flush = {}, 0, time.monotonic()
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+    def request_writer(self, stop: bool = False, timeout: float = None) -> None:
+        if not self.writer.is_alive():
+            return
+        request = WriterRequest(stop=stop)
+        self.queue.put_nowait(request)
+        request.done.wait(timeout=timeout)
+
+    def flush(self) -> None:
+        self.request_writer(stop=False)
+
+    def close(self) -> None:
+        # Unregistered so the closed handlers are not kept alive until the interpreter exits
+        atexit.unregister(self.close)
+        self.request_writer(stop=True)
+        self.writer.join(timeout=self.flush_interval * 2)
+        super().close()
+
+
+def setup_logging(log_data: LogData = None, batched: bool = False):
     logger = logging.getLogger("spade")
     logger.setLevel(logging.INFO)
-    handler = CsvLogHandler()
+    handler = BatchedCsvLogHandler(log_data=log_data) if batched else CsvLogHandler()
     formatter = logging.Formatter(
         "%(asctime)s,%(name)s,%(message)s", datefmt="%Y/%m/%d %H:%M:%S.%f"
     )
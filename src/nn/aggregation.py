@@ -0,0 +1,173 @@
+import torch
+import torch.nn as nn
+
+
+class ModelAggregator:
+    """
+    Class created to aggregate the models received from the neighbours into the local model without allocating
+    tensors in every round. The floating point parameters and buffers of the model are moved into one flat
+    buffer (the model tensors become views of it) and the incoming models are accumulated in place into a
+    preallocated accumulator of the same size, which is finally divided by the total weight into the model.
+
+    The available strategies are:
+        - "fedavg": every model has the same weight.
+        - "weighted": every model is weighted by its number of training samples.
+        - "staleness": like "weighted", but the weight decays with the staleness (rounds of delay) of the model
+          as (staleness + 1) ** -staleness_exponent, as in the asynchronous algorithms (ACoL).
+    """
+
+    STRATEGIES = ("fedavg", "weighted", "staleness")
+
+    def __init__(
+        self,
+        model: nn.Module,
+        strategy: str = "fedavg",
+        staleness_exponent: float = 0.5,
+    ) -> None:
+        if strategy not in self.STRATEGIES:
+            raise ValueError(
+                f"strategy must be one of {self.STRATEGIES}, got {strategy}."
+            )
+        self.model = model
+        self.strategy = strategy
+        self.staleness_exponent = staleness_exponent
+        self.slices: dict[str, tuple[int, int]] = {}
+        # Tied tensors (the same tensor under several names) get a single slice
+        tensors: dict[int, tuple[str, torch.Tensor]] = {}
+        for name, tensor in model.state_dict(keep_vars=True).items():
+            if tensor.is_floating_point() and id(tensor) not in tensors.keys():
+                tensors[id(tensor)] = (name, tensor)
+        dtypes = {tensor.dtype for _, tensor in tensors.values()}
+        if len(dtypes) > 1:
+            raise ValueError(
+                f"The floating point tensors of the model must have the same dtype, got {dtypes}."
+            )
+        offset = 0
+        for name, tensor in tensors.values():
+            self.slices[name] = (offset, offset + tensor.numel())
+            offset += tensor.numel()
+        first = next(iter(tensors.values()), None)
+        device = first[1].device if first is not None else None
+        dtype = first[1].dtype if first is not None else None
+        self.flat_model = torch.empty(offset, device=device, dtype=dtype)
+        self.accumulator = torch.zeros(offset, device=device, dtype=dtype)
+        self.total_weight: float = 0.0
+        self.bind_model()
+
+    def bind_model(self) -> None:
+        """
+        Copies the model tensors into the flat buffer and replaces them by views of it.
+        """
+        views: dict[int, torch.Tensor] = {}
+        with torch.no_grad():
+            for module_name, module in self.model.named_modules(remove_duplicate=False):
+                prefix = f"{module_name}." if module_name else ""
+                for registry in (module._parameters, module._buffers):
+                    for name, tensor in registry.items():
+                        key = f"{prefix}{name}"
+                        if tensor is None:
+                            continue
+                        if id(tensor) in views.keys():
+                            # Tied buffer already bound under another name
+                            registry[name] = views[id(tensor)]
+                            continue
+                        if not key in self.slices.keys():
+                            continue
+                        start, end = self.slices[key]
+                        view = self.flat_model[start:end].view_as(tensor)
+                        view.copy_(tensor)
+                        if isinstance(tensor, nn.Parameter):
+                            tensor.data = view
+                        else:
+                            registry[name] = view
+                            views[id(tensor)] = view
+
+    def get_weight(self, num_samples: int = None, staleness: int = 0) -> float:
+        if self.strategy == "fedavg":
+            return 1.0
+        weight = float(num_samples) if num_samples is not None else 1.0
+        if self.strategy == "staleness":
+            weight *= (staleness + 1) ** -self.staleness_exponent
+        return weight
+
+    def flatten(
+        self, state_dict: dict[str, torch.Tensor], out: torch.Tensor = None
+    ) -> torch.Tensor:
+        out = torch.empty_like(self.flat_model) if out is None else out
+        for name, (start, end) in self.slices.items():
+            out[start:end].copy_(state_dict[name].reshape(-1))
+        return out
+
+    def begin(self, num_samples: int = None) -> None:
+        """
+        Starts an aggregation round, accumulating the local model with its weight.
+        """
+        self.accumulator.zero_()
+        self.total_weight = 0.0
+        self.add(self.flat_model, num_samples=num_samples)
+
+    def add(
+        self,
+        model: dict[str, torch.Tensor] | torch.Tensor,
+        num_samples: int = None,
+        staleness: int = 0,
+    ) -> None:
+        """
+        Accumulates a neighbour model in place.
+
+        Args:
+            model (dict[str, torch.Tensor] | torch.Tensor): The state dict of the model or its parameters already
+            flattened (in the order of the aggregator), which are accumulated in one fused operation.
+            num_samples (int, optional): Training samples of the model, used by "weighted" and "staleness". Defaults to None.
+            staleness (int, optional): Rounds of delay of the model, used by "staleness". Defaults to 0.
+        """
+        weight = self.get_weight(num_samples=num_samples, staleness=staleness)
+        with torch.no_grad():
+            if isinstance(model, torch.Tensor):
+                self.accumulator.add_(model.reshape(-1), alpha=weight)
+            else:
+                for name, (start, end) in self.slices.items():
+                    self.accumulator[start:end].add_(
+                        model[name].reshape(-1), alpha=weight
+                    )
+        self.total_weight += weight
+
+    def finish(self) -> nn.Module:
+        """
+        Writes the weighted average of the accumulated models into the local model.
+
+        Returns:
+            nn.Module: The local model, updated in place.
+        """
+        if self.total_weight > 0:
+            with torch.no_grad():
+                torch.div(self.accumulator, self.total_weight, out=self.flat_model)
+        return self.model
+
+    def aggregate(
+        self,
+        models: list[dict[str, torch.Tensor] | torch.Tensor],
+        num_samples: list[int] = None,
+        staleness: list[int] = None,
+        local_num_samples: int = None,
+    ) -> nn.Module:
+        """
+        Aggregates the local model with the neighbour models in one call.
+
+        Args:
+            models (list[dict[str, torch.Tensor] | torch.Tensor]): The neighbour models.
+            num_samples (list[int], optional): Training samples of each neighbour model. Defaults to None.
+            staleness (list[int], optional): Staleness of each neighbour model. Defaults to None.
+            local_num_samples (int, optional): Training samples of the local model. Defaults to None.
+
+        Returns:
+            nn.Module: The local model, updated in place.
+        """
+        self.begin(num_samples=local_num_samples)
+        for i, model in enumerate(models):
+            self.add(
+                model,
+                num_samples=num_samples[i] if num_samples is not None else None,
+                staleness=staleness[i] if staleness is not None else 0,
+            )
+        return self.finish()
@@ -0,0 +1,162 @@
+import torch
+import torch.nn as nn
+
+from nn.cnn import CIFAR8TinyCNN
+
+
+class BatchedCIFAR8TinyCNN(nn.Module):
+    """
+    Class created to train the CIFAR8TinyCNN models of many simulated agents at the same time. The parameters
+    of the models are stacked in one set of tensors and the forward and backward of all of them run in a single
+    pass: the convolutions are grouped convolutions (one group per model) and the linear layers are batched
+    matrix multiplications, so the Python and kernel launch overhead is paid once instead of once per model.
+
+    The input has shape [models, batch, 3, 32, 32], every model gets its own batch (its data shard) and the
+    output has shape [models, batch, 8]. The models are not modified until write_back is called, and
+    load_models must be called after they change (for example, after the aggregation).
+
+    A single optimizer over the stacked parameters is equivalent to one optimizer per model as long as all of
+    them use the same hyperparameters, since SGD and Adam update every value independently.
+    """
+
+    CONVOLUTIONS = ("conv1", "conv2")
+    LINEARS = ("fc1", "fc2", "fc3")
+
+    def __init__(self, models: list[CIFAR8TinyCNN]) -> None:
+        super().__init__()
+        if len(models) == 0:
+            raise ValueError("models must have content.")
+        self.models = list(models)
+        self.num_models = len(models)
+        reference = models[0]
+        self.pool = reference.pool
+        self.dropout_probability = reference.dropout.p
+        for name in self.CONVOLUTIONS:
+            layer: nn.Conv2d = getattr(reference, name)
+            self.register_parameter(
+                f"{name}_weight",
+                nn.Parameter(
+                    torch.empty(
+                        self.num_models * layer.out_channels,
+                        *layer.weight.shape[1:],
+                    )
+                ),
+            )
+            self.register_parameter(
+                f"{name}_bias",
+                nn.Parameter(torch.empty(self.num_models * layer.out_channels)),
+            )
+        for name in self.LINEARS:
+            layer: nn.Linear = getattr(reference, name)
+            self.register_parameter(
+                f"{name}_weight",
+                nn.Parameter(
+                    torch.empty(self.num_models, layer.out_features, layer.in_features)
+                ),
+            )
+            self.register_parameter(
+                f"{name}_bias",
+                nn.Parameter(torch.empty(self.num_models, 1, layer.out_features)),
+            )
+        self.load_models()
+
+    def get_stacked(self) -> list[tuple[nn.Parameter, list[nn.Parameter]]]:
+        """
+        Returns:
+            list[tuple[nn.Parameter, list[nn.Parameter]]]: Every stacked parameter and the parameters of the models in it.
+        """
+        pairs = []
+        for name in self.CONVOLUTIONS + self.LINEARS:
+            for kind in ("weight", "bias"):
+                pairs.append(
+                    (
+                        getattr(self, f"{name}_{kind}"),
+                        [getattr(getattr(m, name), kind) for m in self.models],
+                    )
+                )
+        return pairs
+
+    def get_model_view(self, stacked: torch.Tensor, index: int) -> torch.Tensor:
+        if stacked.shape[0] == self.num_models:
+            return stacked[index]
+        return stacked.view(self.num_models, -1, *stacked.shape[1:])[index]
+
+    def load_models(self) -> None:
+        """
+        Copies the parameters of the models into the stacked parameters.
+        """
+        with torch.no_grad():
+            for stacked, parameters in self.get_stacked():
+                for i, parameter in enumerate(parameters):
+                    view = self.get_model_view(stacked, i)
+                    view.copy_(parameter.view_as(view))
+
+    def write_back(self) -> None:
+        """
+        Copies the stacked parameters into the parameters of every model, in place.
+        """
+        with torch.no_grad():
+            for stacked, parameters in self.get_stacked():
+                for i, parameter in enumerate(parameters):
+                    parameter.copy_(self.get_model_view(stacked, i).view_as(parameter))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        models, batch = x.shape[:2]
+        # [models, batch, C, H, W] -> [batch, models * C, H, W], the channels of every model are one group.
+        # Grouped convolutions with few channels per group are only fast on CPU in the channels last format
+        channels, height, width = x.shape[2:]
+        x = (
+            x.permute(1, 3, 4, 0, 2)
+            .reshape(batch, height, width, models * channels)
+            .permute(0, 3, 1, 2)
+        )
+        x = nn.functional.conv2d(x, self.conv1_weight, self.conv1_bias, groups=models)
+        x = self.pool(nn.functional.relu(x))
+        x = nn.functional.dropout(x, p=self.dropout_probability, training=self.training)
+        x = nn.functional.conv2d(x, self.conv2_weight, self.conv2_bias, groups=models)
+        x = self.pool(nn.functional.relu(x))
+        # [batch, models * C, H, W] -> [models, batch, C * H * W]
+        x = x.reshape(batch, models, -1).transpose(0, 1)
+        x = nn.functional.relu(
+            torch.baddbmm(self.fc1_bias, x, self.fc1_weight.transpose(1, 2))
+        )
+        x = nn.functional.relu(
+            torch.baddbmm(self.fc2_bias, x, self.fc2_weight.transpose(1, 2))
+        )
+        return torch.baddbmm(self.fc3_bias, x, self.fc3_weight.transpose(1, 2))
+
+    def loss(self, outputs: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
+        """
+        Returns:
+            torch.Tensor: The mean cross entropy of every model, with shape [models]. Its sum gives every model
+            the gradients of its own loss.
+        """
+        losses = nn.functional.cross_entropy(
+            outputs.reshape(-1, outputs.shape[-1]),
+            targets.reshape(-1),
+            reduction="none",
+        )
+        return losses.view(targets.shape).mean(dim=1)
+
+    def train_step(
+        self,
+        inputs: torch.Tensor,
+        targets: torch.Tensor,
+        optimizer: torch.optim.Optimizer,
+    ) -> torch.Tensor:
+        """
+        Runs one training step of all the models.
+
+        Args:
+            inputs (torch.Tensor): The batches of the models, with shape [models, batch, 3, 32, 32].
+            targets (torch.Tensor): The labels, with shape [models, batch].
+            optimizer (torch.optim.Optimizer): Optimizer of the parameters of this module.
+
+        Returns:
+            torch.Tensor: The loss of every model, with shape [models].
+        """
+        optimizer.zero_grad()
+        losses = self.loss(self(inputs), targets)
+        losses.sum().backward()
+        optimizer.step()
+        return losses.detach()
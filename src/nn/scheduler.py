@@ -0,0 +1,215 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Any
+
+import torch
+
+from utilities.metrics import MetricsRegistry
+
+
+class TrainingJob:
+    def __init__(
+        self,
+        agent: str,
+        function: Callable[..., Any],
+        args: tuple,
+        kwargs: dict[str, Any],
+        metrics: MetricsRegistry | None,
+    ) -> None:
+        self.agent = agent
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.metrics = metrics
+        self.future: Future = Future()
+        self.submitted = time.perf_counter()
+
+
+class TrainingScheduler:
+    """
+    Class created to share the CPU among the local trainings of the agents of one process. Without it, every
+    agent trains with all the cores (the default PyTorch intra-op threads) at the same time and the host is
+    oversubscribed. The scheduler runs at most "max_concurrent" trainings at the same time (the number of cores
+    by default) in worker threads and queues the rest.
+
+    The intra-op threads of PyTorch are a setting of the whole process, not of a thread nor a training, so the
+    scheduler sets them once to "threads_per_training" (the cores divided by "max_concurrent" by default) when it
+    is created. This also applies to every other PyTorch call of the process (for example, the evaluations), and
+    the last scheduler created in a process sets the value for all of them.
+
+    The queued trainings are started by policy:
+        - "fifo": in submission order.
+        - "fair": the agent with the fewest completed trainings first, so fast agents do not starve slow ones.
+        - "staleness": the training with the highest staleness first (ACoL), the rest in submission order.
+
+    The queue wait and compute seconds of every agent are reported by get_stats and, if the job has a metrics
+    registry, in the "training_queue_seconds" and "training_step_seconds" histograms.
+    """
+
+    POLICIES = ("fifo", "fair", "staleness")
+
+    def __init__(
+        self,
+        max_concurrent: int = None,
+        threads_per_training: int = None,
+        policy: str = "fair",
+    ) -> None:
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}, got {policy}.")
+        cores = os.cpu_count() or 1
+        self.max_concurrent = max_concurrent if max_concurrent is not None else cores
+        self.threads_per_training = (
+            threads_per_training
+            if threads_per_training is not None
+            else max(1, cores // self.max_concurrent)
+        )
+        torch.set_num_threads(self.threads_per_training)
+        self.policy = policy
+        self.condition = Condition()
+        self.queue: list[tuple[tuple, TrainingJob]] = []
+        self.sequence = itertools.count()
+        self.completed: dict[str, int] = {}
+        self.wait_seconds: dict[str, float] = {}
+        self.compute_seconds: dict[str, float] = {}
+        self.running: int = 0
+        self.closed = False
+        self.workers = [
+            Thread(target=self.work, name=f"training-{i}", daemon=True)
+            for i in range(self.max_concurrent)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def get_priority(self, agent: str, staleness: int) -> tuple:
+        sequence = next(self.sequence)
+        if self.policy == "fair":
+            return (self.completed.get(agent, 0), sequence)
+        if self.policy == "staleness":
+            return (-staleness, sequence)
+        return (sequence,)
+
+    def submit(
+        self,
+        agent: str,
+        function: Callable[..., Any],
+        *args,
+        staleness: int = 0,
+        metrics: MetricsRegistry = None,
+        **kwargs,
+    ) -> Future:
+        """
+        Queues a training.
+
+        Args:
+            agent (str): The JID of the agent that trains.
+            function (Callable[..., Any]): The training function, called with args and kwargs in a worker thread.
+            staleness (int, optional): Rounds behind the neighbours, used by the "staleness" policy. Defaults to 0.
+            metrics (MetricsRegistry, optional): Registry of the agent to record the wait and compute times. Defaults to None.
+
+        Returns:
+            Future: Future with the result of the function.
+        """
+        job = TrainingJob(
+            agent=agent, function=function, args=args, kwargs=kwargs, metrics=metrics
+        )
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The training scheduler is closed.")
+            heapq.heappush(self.queue, (self.get_priority(agent, staleness), job))
+            self.condition.notify()
+        return job.future
+
+    async def run(
+        self,
+        agent: str,
+        function: Callable[..., Any],
+        *args,
+        staleness: int = 0,
+        metrics: MetricsRegistry = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Awaitable version of submit, the event loop of the agents keeps running while the training waits or runs.
+        """
+        return await asyncio.wrap_future(
+            self.submit(
+                agent, function, *args, staleness=staleness, metrics=metrics, **kwargs
+            )
+        )
+
+    def work(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                _, job = heapq.heappop(self.queue)
+                self.running += 1
+            started = time.perf_counter()
+            if not job.future.set_running_or_notify_cancel():
+                self.record(job, wait=started - job.submitted, compute=0)
+                continue
+            result, exception = None, None
+            try:
+                result = job.function(*job.args, **job.kwargs)
+            except BaseException as e:
+                exception = e
+            # Recorded before completing the future, so the stats include the training when it is awaited
+            self.record(
+                job,
+                wait=started - job.submitted,
+                compute=time.perf_counter() - started,
+            )
+            if exception is not None:
+                job.future.set_exception(exception)
+            else:
+                job.future.set_result(result)
+
+    def record(self, job: TrainingJob, wait: float, compute: float) -> None:
+        with self.condition:
+            self.running -= 1
+            self.completed[job.agent] = self.completed.get(job.agent, 0) + 1
+            self.wait_seconds[job.agent] = self.wait_seconds.get(job.agent, 0) + wait
+            self.compute_seconds[job.agent] = (
+                self.compute_seconds.get(job.agent, 0) + compute
+            )
+        if job.metrics is not None:
+            job.metrics.observe("training_queue_seconds", wait)
+            job.metrics.observe("training_step_seconds", compute)
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """
+        Returns:
+            dict[str, dict[str, float]]: The completed trainings and the total queue wait and compute seconds of every agent.
+        """
+        with self.condition:
+            return {
+                agent: {
+                    "trainings": completed,
+                    "wait_seconds": self.wait_seconds[agent],
+                    "compute_seconds": self.compute_seconds[agent],
+                }
+                for agent, completed in self.completed.items()
+            }
+
+    def pending(self) -> int:
+        with self.condition:
+            return len(self.queue)
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Stops the workers after the queued trainings.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import torch
+
+
+class CheckpointStore:
+    """
+    Class created to save the state of the agents (tensors and JSON metadata) periodically during long experiments
+    and resume them after a crash or an interruption. The store is made of two append-only files:
+        - "{name}.data": the raw bytes of the tensors, aligned to be reinterpreted in place.
+        - "{name}.index": one JSON line per snapshot with the metadata of every agent and the offset, dtype,
+          shape and digest of every tensor in the data file.
+
+    Each snapshot only appends the tensors whose digest changed since the previous snapshot, the unchanged ones
+    point to the bytes written before. The data is flushed to disk before the index line, so a complete index
+    line is the commit marker of its snapshot: the latest complete line is the latest consistent snapshot and
+    anything written after it (a crash in the middle of a checkpoint) is ignored and overwritten.
+
+    The tensors are loaded from a copy-on-write memory map of the data file, so the readers (for example, the
+    shard processes) only read the pages of their agents. A single process must write in the store.
+    """
+
+    def __init__(self, folder: str | Path, name: str = "checkpoint") -> None:
+        self.folder = Path(folder)
+        self.name = name
+        self.data_path = self.folder / f"{name}.data"
+        self.index_path = self.folder / f"{name}.index"
+        self.alignment: int = 64
+        self.lock = Lock()
+        self.last_written_bytes: int = 0
+        self.clear_cache()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"folder": self.folder, "name": self.name}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(folder=state["folder"], name=state["name"])
+
+    def clear_cache(self) -> None:
+        self.positions: dict[int, tuple[int, int]] | None = None
+        self.index_end: int = 0
+        self.cached_snapshot: tuple[int, dict[str, dict]] | None = None
+        self.memory_map: np.ndarray | None = None
+
+    def load_index(self) -> dict[int, tuple[int, int]]:
+        """
+        Returns:
+            dict[int, tuple[int, int]]: The position (offset and length) of every complete snapshot in the index file.
+        """
+        if self.positions is not None:
+            return self.positions
+        self.positions = {}
+        self.index_end = 0
+        if not self.index_path.exists():
+            return self.positions
+        with open(self.index_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    snapshot = json.loads(line)["snapshot"]
+                except (ValueError, KeyError):
+                    break
+                self.positions[snapshot] = (offset, len(line))
+                offset += len(line)
+                self.index_end = offset
+        return self.positions
+
+    def get_snapshots(self) -> list[int]:
+        return sorted(self.load_index().keys())
+
+    def latest(self) -> int | None:
+        """
+        Returns:
+            int | None: The latest consistent snapshot or None if the store is empty.
+        """
+        snapshots = self.get_snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def get_agents(self, snapshot: int) -> dict[str, dict]:
+        """
+        Returns:
+            dict[str, dict]: The metadata and the tensor records of every agent in the snapshot.
+        """
+        if self.cached_snapshot is not None and self.cached_snapshot[0] == snapshot:
+            return self.cached_snapshot[1]
+        offset, length = self.load_index()[snapshot]
+        with open(self.index_path, "rb") as f:
+            f.seek(offset)
+            agents = json.loads(f.read(length))["agents"]
+        self.cached_snapshot = (snapshot, agents)
+        return agents
+
+    def contains(self, snapshot: int, agent: str) -> bool:
+        return snapshot in self.load_index().keys() and agent in self.get_agents(
+            snapshot
+        )
+
+    def save(
+        self, states: dict[str, tuple[dict[str, torch.Tensor], dict[str, Any]]]
+    ) -> int:
+        """
+        Appends a snapshot with the state of the agents.
+
+        Args:
+            states (dict[str, tuple[dict[str, torch.Tensor], dict[str, Any]]]): The tensors and the JSON serializable
+            metadata of every agent, keyed by the agent JID.
+
+        Returns:
+            int: The number of the new snapshot.
+        """
+        with self.lock:
+            latest = self.latest()
+            snapshot = latest + 1 if latest is not None else 0
+            previous = self.get_agents(latest) if latest is not None else {}
+            offset = self.data_path.stat().st_size if self.data_path.exists() else 0
+            chunks = []
+            agents = {}
+            written = 0
+            for agent, (tensors, metadata) in states.items():
+                previous_records = previous.get(agent, {}).get("tensors", {})
+                records = {}
+                for name, tensor in tensors.items():
+                    array = tensor.detach().cpu().contiguous().numpy()
+                    raw = array.reshape(-1).view(np.uint8)
+                    record = {
+                        "dtype": array.dtype.str,
+                        "shape": list(array.shape),
+                        "digest": hashlib.sha256(raw).hexdigest(),
+                    }
+                    previous_record = previous_records.get(name)
+                    if previous_record is not None and all(
+                        previous_record[k] == v for k, v in record.items()
+                    ):
+                        records[name] = previous_record
+                        continue
+                    padding = -offset % self.alignment
+                    if padding > 0:
+                        chunks.append(bytes(padding))
+                        offset += padding
+                    records[name] = {"offset": offset, **record}
+                    chunks.append(raw)
+                    offset += raw.nbytes
+                    written += raw.nbytes
+                agents[agent] = {"metadata": metadata, "tensors": records}
+            self.folder.mkdir(parents=True, exist_ok=True)
+            with open(self.data_path, "ab") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            line = (
+                json.dumps(
+                    {"snapshot": snapshot, "agents": agents}, separators=(",", ":")
+                )
+                + "\n"
+            ).encode("utf-8")
+            with open(self.index_path, "ab") as f:
+                # Drops the incomplete line of an interrupted checkpoint, if any
+                f.truncate(self.index_end)
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.positions[snapshot] = (self.index_end, len(line))
+            self.index_end += len(line)
+            self.cached_snapshot = (snapshot, agents)
+            self.memory_map = None
+            self.last_written_bytes = written
+            return snapshot
+
+    def get_memory_map(self) -> np.ndarray:
+        if self.memory_map is None:
+            if self.data_path.exists() and self.data_path.stat().st_size > 0:
+                self.memory_map = np.memmap(self.data_path, dtype=np.uint8, mode="c")
+            else:
+                self.memory_map = np.empty(0, dtype=np.uint8)
+        return self.memory_map
+
+    def load(
+        self, agent: str, snapshot: int = None
+    ) -> tuple[dict[str, torch.Tensor], dict[str, Any]]:
+        """
+        Loads the state of an agent. The tensors are views of the memory map of the data file, they must be
+        copied (for example, with load_state_dict) if they are kept after the store is written again.
+
+        Args:
+            agent (str): The agent JID.
+            snapshot (int, optional): The snapshot to load. Defaults to None (the latest consistent snapshot).
+
+        Returns:
+            tuple[dict[str, torch.Tensor], dict[str, Any]]: The tensors and the metadata of the agent.
+        """
+        import torch
+
+        snapshot = self.latest() if snapshot is None else snapshot
+        if snapshot is None:
+            raise KeyError(f"The checkpoint store {self.index_path} is empty.")
+        state = self.get_agents(snapshot)[agent]
+        memory_map = self.get_memory_map()
+        tensors = {}
+        for name, record in state["tensors"].items():
+            array = np.ndarray(
+                shape=record["shape"],
+                dtype=np.dtype(record["dtype"]),
+                buffer=memory_map,
+                offset=record["offset"],
+            )
+            tensors[name] = torch.from_numpy(array)
+        return tensors, state["metadata"]
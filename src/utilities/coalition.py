@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+class CoalitionManager:
+    """
+    Class created to organize the agents of ACoaL in coalitions to reduce the number of exchanged models.
+    Each coalition has a leader that aggregates the models of its members and is the only one that exchanges
+    models with the leaders of the other coalitions, so each round needs about O(agents + coalitions²) messages
+    instead of one message per edge of the neighbours graph.
+
+    Every agent keeps its own copy of the manager built from the same assignment, so the election is deterministic:
+    the leader is the first alive member in the sorted order of the coalition and, when it fails, the leadership
+    rotates to the next alive member. The failures are detected by the agents (AgentNodeBase.detect_failures), which
+    call mark_failed when an agent that should send them its model stays silent and mark_recovered when it sends again.
+    """
+
+    def __init__(self, coalitions: dict[str, list[str]]) -> None:
+        self.coalitions: dict[str, list[str]] = {
+            coalition: sorted(str(m) for m in members)
+            for coalition, members in coalitions.items()
+        }
+        self.coalition_of: dict[str, str] = {
+            member: coalition
+            for coalition, members in self.coalitions.items()
+            for member in members
+        }
+        self.failed: set[str] = set()
+        self.leaders: dict[str, str | None] = {}
+        for coalition in self.coalitions.keys():
+            self.elect_leader(coalition)
+
+    @classmethod
+    def from_graph(cls, graph: nx.Graph, resolution: float = 1) -> "CoalitionManager":
+        """
+        Builds the coalitions from the communities of the neighbours graph (greedy modularity maximization).
+        """
+        import networkx as nx
+
+        communities = nx.algorithms.community.greedy_modularity_communities(
+            graph, resolution=resolution
+        )
+        return cls(
+            {
+                f"coalition{i}": [str(node) for node in community]
+                for i, community in enumerate(communities)
+            }
+        )
+
+    @classmethod
+    def from_neighbours(
+        cls, neighbours: dict[str, list[str]], resolution: float = 1
+    ) -> "CoalitionManager":
+        import networkx as nx
+
+        graph = nx.Graph()
+        for agent, agent_neighbours in neighbours.items():
+            graph.add_node(str(agent))
+            graph.add_edges_from((str(agent), str(n)) for n in agent_neighbours)
+        return cls.from_graph(graph, resolution=resolution)
+
+    def elect_leader(self, coalition: str) -> str | None:
+        members = self.coalitions[coalition]
+        current = self.leaders.get(coalition)
+        start = members.index(current) if current in members else 0
+        # Rotates from the current leader, so a recovered member does not take the leadership back
+        rotation = members[start:] + members[:start]
+        self.leaders[coalition] = next(
+            (m for m in rotation if not m in self.failed), None
+        )
+        return self.leaders[coalition]
+
+    def mark_failed(self, agent: str) -> None:
+        agent = str(agent)
+        self.failed.add(agent)
+        coalition = self.coalition_of.get(agent)
+        if coalition is not None and self.leaders[coalition] == agent:
+            self.elect_leader(coalition)
+
+    def mark_recovered(self, agent: str) -> None:
+        agent = str(agent)
+        self.failed.discard(agent)
+        coalition = self.coalition_of.get(agent)
+        if coalition is not None and self.leaders[coalition] is None:
+            self.elect_leader(coalition)
+
+    def get_leader(self, agent: str) -> str | None:
+        return self.leaders.get(self.coalition_of.get(str(agent)))
+
+    def is_leader(self, agent: str) -> bool:
+        return self.get_leader(agent) == str(agent)
+
+    def get_members(self, agent: str) -> list[str]:
+        coalition = self.coalition_of.get(str(agent))
+        if coalition is None:
+            return []
+        return [m for m in self.coalitions[coalition] if not m in self.failed]
+
+    def get_other_leaders(self, agent: str) -> list[str]:
+        coalition = self.coalition_of.get(str(agent))
+        return [
+            leader
+            for c, leader in self.leaders.items()
+            if c != coalition and leader is not None
+        ]
+
+    def get_recipients(self, agent: str) -> list[str]:
+        """
+        Returns the agents that must receive the model of the agent: the leader of its coalition for the
+        members and, for the leaders, the other members of the coalition and the other leaders.
+        """
+        agent = str(agent)
+        leader = self.get_leader(agent)
+        if leader is None:
+            return []
+        if leader != agent:
+            return [leader]
+        members = [m for m in self.get_members(agent) if m != agent]
+        return members + self.get_other_leaders(agent)
+
+    def get_messages_per_round(self) -> int:
+        return sum(
+            len(self.get_recipients(a))
+            for a in self.coalition_of.keys()
+            if not a in self.failed
+        )
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import base64
+import json
+import struct
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import torch
+
+
+class PayloadCodec:
+    """
+    Class created to pack PyTorch state dicts into a compact binary payload that can travel in the body of a
+    SPADE message. The payload is made of a JSON header (names, shapes, dtypes and quantization scales of the
+    tensors) followed by the contiguous raw bytes of every tensor. The whole binary blob is base64 encoded
+    to be transport-safe and prefixed with "tensor#" to be recognized in the reception.
+
+    The floating point tensors can be quantized to reduce the size of the payload:
+        - "fp32": raw float32 values (lossless for float32 models).
+        - "fp16": values casted to float16.
+        - "int8": symmetric per tensor quantization to int8 with a float32 scale.
+    Non floating point tensors (for example BatchNorm "num_batches_tracked") are always sent without changes.
+    """
+
+    QUANTIZATIONS = ("fp32", "fp16", "int8")
+
+    def __init__(self, quantization: str = "fp32") -> None:
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(
+                f"quantization must be one of {self.QUANTIZATIONS}, got {quantization}."
+            )
+        self.quantization = quantization
+        self.payload_prefix: str = "tensor#"
+        self.header_length_format: str = "<I"
+        self.header_length_size: int = struct.calcsize(self.header_length_format)
+        self.alignment: int = 8
+
+    def is_encoded(self, content: str) -> bool:
+        return content is not None and content.startswith(self.payload_prefix)
+
+    def quantize(self, tensor: torch.Tensor) -> tuple[torch.Tensor, float | None]:
+        import torch
+
+        if not tensor.is_floating_point() or self.quantization == "fp32":
+            return tensor, None
+        if self.quantization == "fp16":
+            return tensor.to(torch.float16), None
+        max_value = tensor.abs().max().item() if tensor.numel() > 0 else 0.0
+        scale = max_value / 127 if max_value > 0 else 1.0
+        quantized = torch.round(tensor / scale).clamp_(-127, 127).to(torch.int8)
+        return quantized, scale
+
+    def quantization_roundtrip(self, tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Returns the values that the receiver gets for the tensor after the quantization of the codec.
+        """
+        data, scale = self.quantize(tensor)
+        if scale is not None:
+            return data.to(tensor.dtype) * scale
+        return data.to(tensor.dtype)
+
+    def encode(self, state_dict: dict[str, torch.Tensor]) -> str:
+        """
+        Packs a state dict into a transport-safe string.
+
+        Args:
+            state_dict (dict[str, torch.Tensor]): Tensors to encode, usually the result of "model.state_dict()".
+
+        Returns:
+            str: The encoded payload, ready to be used as the body of a SPADE message.
+        """
+        return self.encode_bytes(state_dict).decode("ascii")
+
+    def encode_bytes(self, state_dict: dict[str, torch.Tensor]) -> bytes:
+        """
+        Same as encode but returns the ASCII bytes of the payload, which the MultipartHandler can slice
+        without copying the whole payload into a string.
+        """
+        tensors_header = []
+        buffers = []
+        offset = 0
+        for name, tensor in state_dict.items():
+            tensor = tensor.detach().cpu()
+            data, scale = self.quantize(tensor)
+            data = data.contiguous()
+            raw = data.numpy().reshape(-1).view("uint8")
+            padding = -offset % self.alignment
+            if padding > 0:
+                buffers.append(bytes(padding))
+                offset += padding
+            tensors_header.append(
+                {
+                    "name": name,
+                    "shape": list(tensor.shape),
+                    "dtype": str(tensor.dtype).replace("torch.", ""),
+                    "wire_dtype": str(data.dtype).replace("torch.", ""),
+                    "scale": scale,
+                    "offset": offset,
+                    "numel": data.numel(),
+                }
+            )
+            buffers.append(raw)
+            offset += raw.nbytes
+        header = json.dumps(
+            {"quantization": self.quantization, "tensors": tensors_header},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        # Pad the header so the tensor data starts aligned and can be reinterpreted in place
+        header += b" " * (-(self.header_length_size + len(header)) % self.alignment)
+        blob = b"".join(
+            [struct.pack(self.header_length_format, len(header)), header, *buffers]
+        )
+        return self.payload_prefix.encode("ascii") + base64.b64encode(blob)
+
+    def decode(self, content: str) -> OrderedDict[str, torch.Tensor]:
+        """
+        Unpacks a payload generated by the encode method. The tensors are built reinterpreting slices of a
+        single decoded buffer, so no per-value parsing is done.
+
+        Args:
+            content (str): The encoded payload, with the "tensor#" prefix.
+
+        Returns:
+            OrderedDict[str, torch.Tensor]: The decoded state dict, dequantized to the original dtypes.
+        """
+        if not self.is_encoded(content):
+            raise ValueError("content is not an encoded tensor payload.")
+        import torch
+
+        blob = bytearray(base64.b64decode(content[len(self.payload_prefix) :]))
+        (header_length,) = struct.unpack_from(self.header_length_format, blob, 0)
+        data_start = self.header_length_size + header_length
+        header = json.loads(blob[self.header_length_size : data_start].decode("utf-8"))
+        state_dict = OrderedDict()
+        for info in header["tensors"]:
+            wire_dtype = getattr(torch, info["wire_dtype"])
+            dtype = getattr(torch, info["dtype"])
+            if info["numel"] > 0:
+                tensor = torch.frombuffer(
+                    blob,
+                    dtype=wire_dtype,
+                    count=info["numel"],
+                    offset=data_start + info["offset"],
+                )
+            else:
+                tensor = torch.empty(0, dtype=wire_dtype)
+            tensor = tensor.view(info["shape"])
+            if info["scale"] is not None:
+                tensor = tensor.to(dtype) * info["scale"]
+            elif wire_dtype != dtype:
+                tensor = tensor.to(dtype)
+            state_dict[info["name"]] = tensor
+        return state_dict
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import math
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from utilities.codec import PayloadCodec
+
+if TYPE_CHECKING:
+    import torch
+
+
+class DeltaMismatchError(ValueError):
+    """
+    Raised when an update does not apply to the copy of the sender model: an update was lost (for example,
+    an evicted multipart stream) or the receiver lost its copy (for example, it was restarted).
+    """
+
+
+class DeltaEncoder:
+    """
+    Class created to send model updates instead of full models. For every neighbour it keeps the reference model,
+    the model as that neighbour has rebuilt it, and sends the difference with the current model:
+        - "full": the whole model, always used the first time and after a reset.
+        - "dense": the difference of every floating point value.
+        - "topk": only the "ratio" fraction of the differences with the largest magnitude of each tensor,
+          as index and value arrays.
+    The reference is updated with exactly what the neighbour receives (including the quantization of the codec),
+    so the error of the values that were not sent remains in the next difference (error feedback) and the
+    neighbour model converges to the real one.
+
+    Non floating point tensors are always sent complete. The reference is updated when the update is encoded and
+    every update has a sequence number (0 for full models, the previous one plus 1 for the differences), so the
+    decoder detects the updates that do not follow the last one it applied. In that case, reset must be called
+    to send the full model again.
+    """
+
+    MODES = ("full", "dense", "topk")
+
+    def __init__(
+        self, mode: str = "topk", ratio: float = 0.01, codec: PayloadCodec = None
+    ) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, got {mode}.")
+        if not 0 < ratio <= 1:
+            raise ValueError("ratio must be in (0, 1].")
+        self.mode = mode
+        self.ratio = ratio
+        self.codec = codec if codec is not None else PayloadCodec()
+        self.references: dict[str, OrderedDict[str, torch.Tensor]] = {}
+        self.sequences: dict[str, int] = {}
+
+    def reset(self, neighbour: str | None = None) -> None:
+        if neighbour is None:
+            self.references.clear()
+            self.sequences.clear()
+        else:
+            self.references.pop(neighbour, None)
+            self.sequences.pop(neighbour, None)
+
+    def encode(
+        self, neighbour: str, state_dict: dict[str, torch.Tensor]
+    ) -> tuple[str, int, OrderedDict[str, torch.Tensor]]:
+        """
+        Generates the update for one neighbour and updates its reference model.
+
+        Args:
+            neighbour (str): The bare JID of the neighbour.
+            state_dict (dict[str, torch.Tensor]): The current model.
+
+        Returns:
+            tuple[str, int, OrderedDict[str, torch.Tensor]]: The kind of update ("full", "dense" or "topk"),
+            its sequence number and its tensors.
+        """
+        reference = self.references.get(neighbour)
+        if self.mode == "full" or reference is None:
+            tensors = OrderedDict(
+                (name, tensor.detach()) for name, tensor in state_dict.items()
+            )
+            self.references[neighbour] = OrderedDict(
+                (
+                    name,
+                    self.codec.quantization_roundtrip(tensor.detach().cpu()).clone(),
+                )
+                for name, tensor in state_dict.items()
+            )
+            self.sequences[neighbour] = 0
+            return "full", 0, tensors
+        import torch
+
+        tensors = OrderedDict()
+        with torch.no_grad():
+            for name, tensor in state_dict.items():
+                tensor = tensor.detach().cpu()
+                if not tensor.is_floating_point():
+                    tensors[name] = tensor
+                    reference[name] = tensor.clone()
+                    continue
+                delta = tensor - reference[name]
+                if self.mode == "dense":
+                    tensors[name] = delta
+                    reference[name] += self.codec.quantization_roundtrip(delta)
+                    continue
+                flat_delta = delta.view(-1)
+                k = max(1, math.ceil(self.ratio * flat_delta.numel()))
+                indices = flat_delta.abs().topk(k, sorted=False).indices
+                values = flat_delta[indices]
+                tensors[f"{name}.indices"] = indices.to(torch.int32)
+                tensors[f"{name}.values"] = values
+                reference[name].view(-1).index_add_(
+                    0, indices, self.codec.quantization_roundtrip(values)
+                )
+        self.sequences[neighbour] += 1
+        return self.mode, self.sequences[neighbour], tensors
+
+
+class DeltaDecoder:
+    """
+    Receiver side of the DeltaEncoder. Keeps a copy of the model of every sender and applies the updates to it.
+    """
+
+    def __init__(self) -> None:
+        self.models: dict[str, OrderedDict[str, torch.Tensor]] = {}
+        self.sequences: dict[str, int] = {}
+
+    def reset(self, sender: str | None = None) -> None:
+        if sender is None:
+            self.models.clear()
+            self.sequences.clear()
+        else:
+            self.models.pop(sender, None)
+            self.sequences.pop(sender, None)
+
+    def decode(
+        self,
+        sender: str,
+        kind: str,
+        tensors: dict[str, torch.Tensor],
+        sequence: int = None,
+    ) -> OrderedDict[str, torch.Tensor]:
+        """
+        Applies an update to the copy of the sender model.
+
+        Args:
+            sender (str): The bare JID of the sender.
+            kind (str): The kind of update ("full", "dense" or "topk").
+            tensors (dict[str, torch.Tensor]): The tensors of the update.
+            sequence (int, optional): The sequence number of the update. Defaults to None (not checked).
+
+        Raises:
+            DeltaMismatchError: If the update is a difference and there is no copy of the sender model or the update
+            does not follow the last one applied. The copy is discarded until a full model is received.
+
+        Returns:
+            OrderedDict[str, torch.Tensor]: The rebuilt model of the sender. It must not be modified in place.
+        """
+        if kind == "full":
+            self.models[sender] = OrderedDict(
+                (name, tensor.clone()) for name, tensor in tensors.items()
+            )
+            self.sequences[sender] = 0
+            return self.models[sender]
+        if not sender in self.models.keys():
+            raise DeltaMismatchError(
+                f"Received a {kind} update from {sender} without a previous full model."
+            )
+        if sequence is not None and sequence != self.sequences[sender] + 1:
+            expected = self.sequences[sender] + 1
+            self.reset(sender)
+            raise DeltaMismatchError(
+                f"Received the {kind} update {sequence} from {sender}, expected {expected}."
+            )
+        import torch
+
+        model = self.models[sender]
+        with torch.no_grad():
+            for name, tensor in model.items():
+                if not tensor.is_floating_point():
+                    model[name] = tensors[name].clone()
+                elif kind == "dense":
+                    tensor += tensors[name]
+                elif kind == "topk":
+                    tensor.view(-1).index_add_(
+                        0,
+                        tensors[f"{name}.indices"].to(torch.int64),
+                        tensors[f"{name}.values"].to(tensor.dtype),
+                    )
+                else:
+                    raise ValueError(f"Unknown update kind {kind}.")
+        self.sequences[sender] += 1
+        return model
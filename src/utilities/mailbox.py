@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable
+
+from spade.message import Message
+
+from utilities.multipart import MultipartHandler, MultipartStream
+
+
+class CoalescingMailbox:
+    """
+    Class created to keep only the latest complete model of every sender in the asynchronous algorithms (ACoL,
+    ACoaL), where a slow agent can receive several models from the same fast neighbour before processing them.
+    When a complete model arrives, the older queued model of the sender and its older incomplete multipart
+    streams of full models are discarded, so they are never rebuilt, decoded nor aggregated. The other incomplete
+    streams of the sender (differences or messages that are not models) are kept.
+
+    A model is older than another if its "version" metadata (an integer, when the sender sets it) is lower.
+    Without versions, the model whose multipart stream started later is the newer one. The messages that are
+    not models are kept in order in a separate queue.
+
+    Only full models are coalesced. The differences sent by send_model_update ("update" metadata "dense" or
+    "topk") need every previous update of the sender to be applied, so they are kept in order after the full
+    model of the sender (if any) and only discarded when a newer full model replaces them.
+    """
+
+    def __init__(
+        self,
+        multipart_handler: MultipartHandler,
+        is_model: Callable[[Message], bool],
+    ) -> None:
+        self.multipart_handler = multipart_handler
+        self.is_model = is_model
+        self.models: OrderedDict[str, list[Message]] = OrderedDict()
+        self.model_versions: dict[str, tuple[int | None, float]] = {}
+        self.other_messages: deque[Message] = deque()
+        self.discarded_models: int = 0
+        self.discarded_streams: int = 0
+        self.discarded_stream_keys: OrderedDict[tuple, None] = OrderedDict()
+        self.max_discarded_stream_keys: int = 1024
+
+    def get_version(self, message: Message) -> int | None:
+        return self.parse_version(message.get_metadata("version"))
+
+    def parse_version(self, version: str | None) -> int | None:
+        try:
+            return int(version) if version is not None else None
+        except ValueError:
+            return None
+
+    def is_difference(self, message: Message) -> bool:
+        return message.get_metadata("update") not in (None, "full")
+
+    def is_superseded(
+        self, stream: MultipartStream, version: int | None, started: float
+    ) -> bool:
+        """
+        Returns whether an incomplete stream is a full model older than a complete full model of the same sender.
+        The streams of full models are recognized by their metadata: "update" "full" (send_model_update) or a
+        "version" without "update" (broadcast_model).
+        """
+        update = stream.metadata.get("update")
+        if not (update == "full" or (update is None and "version" in stream.metadata)):
+            return False
+        stream_version = self.parse_version(stream.metadata.get("version"))
+        if version is not None and stream_version is not None:
+            return stream_version < version
+        return stream.first_update < started
+
+    def is_newer(self, sender: str, version: int | None, started: float) -> bool:
+        if not sender in self.model_versions.keys():
+            return True
+        queued_version, queued_started = self.model_versions[sender]
+        if version is not None and queued_version is not None:
+            return version > queued_version
+        return started > queued_started
+
+    def put(self, message: Message) -> bool:
+        """
+        Stores a received message, rebuilding it first if it is part of a multipart message.
+
+        Args:
+            message (Message): A received message or multipart message part.
+
+        Returns:
+            bool: True if a complete message has been stored.
+        """
+        started = time.monotonic()
+        if self.multipart_handler.is_multipart(message):
+            # Late parts of a discarded stream would start a stream that can never be completed
+            if (
+                self.multipart_handler.get_stream_key(message)
+                in self.discarded_stream_keys
+            ):
+                return False
+            stream = self.multipart_handler.get_stream(message)
+            started = stream.first_update if stream is not None else started
+            message = self.multipart_handler.rebuild_multipart(message)
+            if message is None:
+                return False
+        if not self.is_model(message):
+            self.other_messages.append(message)
+            return True
+        sender = str(message.sender.bare())
+        if self.is_difference(message):
+            # The older streams of the sender may be previous differences, they are not discarded
+            self.models.setdefault(sender, []).append(message)
+            return True
+        version = self.get_version(message)
+        for key in self.multipart_handler.discard_streams(
+            message.sender, lambda stream: self.is_superseded(stream, version, started)
+        ):
+            self.discarded_streams += 1
+            self.discarded_stream_keys[key] = None
+            if len(self.discarded_stream_keys) > self.max_discarded_stream_keys:
+                self.discarded_stream_keys.popitem(last=False)
+        if not self.is_newer(sender, version, started):
+            self.discarded_models += 1
+            return True
+        if sender in self.models.keys():
+            self.discarded_models += len(self.models[sender])
+            del self.models[sender]
+        self.models[sender] = [message]
+        self.model_versions[sender] = (version, started)
+        return True
+
+    def pop_models(self) -> OrderedDict[str, list[Message]]:
+        """
+        Returns:
+            OrderedDict[str, list[Message]]: The model messages of every sender to apply in order (the latest full
+            model, if any, and the differences received after it), by arrival order, removing them from the mailbox.
+        """
+        models = self.models
+        self.models = OrderedDict()
+        return models
+
+    def pop_other_message(self) -> Message | None:
+        return self.other_messages.popleft() if self.other_messages else None
+
+    def size(self) -> int:
+        return sum(len(m) for m in self.models.values()) + len(self.other_messages)
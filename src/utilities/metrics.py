@@ -0,0 +1,168 @@
+import bisect
+import json
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from threading import Lock
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket upper bounds, as in the Prometheus text format.
+    """
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> list[int]:
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": dict(zip(map(str, self.buckets), self.get_cumulative_counts())),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class MetricsRegistry:
+    """
+    Class created to instrument the agents while the experiment is running. It stores counters (values that
+    only increase, like the bytes sent), gauges (values that are set, like the mailbox depth) and histograms
+    (distributions, like the encoding time) identified by name and labels. The labels of the registry (for
+    example, the agent JID) are added to every metric.
+
+    The updates only take a lock and update a dict entry, so they can be called in the send and receive paths.
+    The snapshots of the registries are exported in JSON and in the Prometheus text format by to_json and
+    to_prometheus, which accept the snapshots of several agents (also from other processes, since the
+    snapshots are plain dicts).
+    """
+
+    TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+    COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+    def __init__(self, **labels: str) -> None:
+        self.labels: Labels = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        self.lock = Lock()
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def get_key(self, name: str, labels: dict[str, str]) -> tuple[str, Labels]:
+        if not labels:
+            return name, self.labels
+        return name, tuple(
+            sorted(self.labels + tuple((k, str(v)) for k, v in labels.items()))
+        )
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = self.get_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = self.get_key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: tuple[float, ...] = TIME_BUCKETS,
+        **labels: str,
+    ) -> None:
+        key = self.get_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """
+        Observes the seconds spent in the block in the histogram "name".
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict[str, list[dict]]:
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": n, "labels": dict(l), "value": v}
+                    for (n, l), v in self.counters.items()
+                ],
+                "gauges": [
+                    {"name": n, "labels": dict(l), "value": v}
+                    for (n, l), v in self.gauges.items()
+                ],
+                "histograms": [
+                    {"name": n, "labels": dict(l), **h.to_dict()}
+                    for (n, l), h in self.histograms.items()
+                ],
+            }
+
+
+def to_json(snapshots: Iterable[dict[str, list[dict]]]) -> str:
+    merged = {"counters": [], "gauges": [], "histograms": []}
+    for snapshot in snapshots:
+        for kind, metrics in snapshot.items():
+            merged[kind].extend(metrics)
+    return json.dumps(merged)
+
+
+def to_prometheus(snapshots: Iterable[dict[str, list[dict]]]) -> str:
+    lines: dict[str, list[str]] = {}
+
+    def format_labels(labels: dict[str, str], **extra: str) -> str:
+        labels = {**labels, **extra}
+        if not labels:
+            return ""
+        escaped = (
+            (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items()
+        )
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    for snapshot in snapshots:
+        for kind, type_name in (("counters", "counter"), ("gauges", "gauge")):
+            for metric in snapshot[kind]:
+                name = f"rrf_{metric['name']}"
+                lines.setdefault(name, [f"# TYPE {name} {type_name}"]).append(
+                    f"{name}{format_labels(metric['labels'])} {metric['value']}"
+                )
+        for metric in snapshot["histograms"]:
+            name = f"rrf_{metric['name']}"
+            series = lines.setdefault(name, [f"# TYPE {name} histogram"])
+            for bound, count in metric["buckets"].items():
+                series.append(
+                    f"{name}_bucket{format_labels(metric['labels'], le=bound)} {count}"
+                )
+            series.append(
+                f"{name}_bucket{format_labels(metric['labels'], le='+Inf')} {metric['count']}"
+            )
+            series.append(
+                f"{name}_sum{format_labels(metric['labels'])} {metric['sum']}"
+            )
+            series.append(
+                f"{name}_count{format_labels(metric['labels'])} {metric['count']}"
+            )
+    return "\n".join(line for series in lines.values() for line in series) + "\n"
@@ -1,8 +1,56 @@
-import copy
+import secrets
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
 
 from aioxmpp import JID
 from spade.message import Message
 
+from utilities.metrics import MetricsRegistry
+
+
+class MultipartStream:
+    """
+    Incomplete multipart content of one stream. The parts are stored in a preallocated list and the received
+    parts are counted, so checking the completion is O(1) and rebuilding the content is O(n). The metadata of
+    the message (the same in all the parts) is kept to know what the stream carries before it is complete.
+    """
+
+    def __init__(
+        self, total_parts: int, now: float, metadata: dict[str, str] = None
+    ) -> None:
+        self.total_parts = total_parts
+        self.metadata: dict[str, str] = metadata if metadata is not None else {}
+        self.parts: list[str | None] = [None] * total_parts
+        self.received_parts: int = 0
+        self.size: int = 0
+        self.first_update: float = now
+        self.last_update: float = now
+
+    def add_part(self, part_number: int, part: str, now: float) -> int:
+        """
+        Stores a part of the stream. Duplicated parts replace the previous content without being counted twice.
+
+        Returns:
+            int: The increment of stored characters.
+        """
+        previous = self.parts[part_number - 1]
+        if previous is None:
+            self.received_parts += 1
+            increment = len(part)
+        else:
+            increment = len(part) - len(previous)
+        self.parts[part_number - 1] = part
+        self.size += increment
+        self.last_update = now
+        return increment
+
+    def is_complete(self) -> bool:
+        return self.received_parts == self.total_parts
+
+    def rebuild(self) -> str:
+        return "".join(self.parts)
+
 
 class MultipartHandler:
     """
@@ -11,26 +59,56 @@ class MultipartHandler:
     of the same desired maximum length. This class inyects a header into the messages content to be able to
     rebuild the messages in the correct order. The header is "multipart#[index]/[total]|" where "index"
     is the id of the current message, starting by 1, and "total" is the number of messages needed to rebuild the
-    original content.
+    original content. The header also carries a stream id, "multipart#[stream]#[index]/[total]|", so several
+    multipart messages from the same sender can be rebuilt at the same time. Incomplete streams are evicted
+    when they do not receive parts for "stream_ttl" seconds or when the stored content exceeds "max_storage_size".
+    If a metrics registry is given, the reassembly latency of the streams and the evictions are recorded in it.
     """
 
-    def __init__(self) -> None:
-        self.multipart_message_storage: dict[JID, str] = {}
+    def __init__(
+        self,
+        stream_ttl: float = 60.0,
+        max_storage_size: int | None = None,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        self.multipart_message_storage: OrderedDict[
+            tuple[JID, str], MultipartStream
+        ] = OrderedDict()
         self.metadata_split: str = "|"
+        self.stream_id_size: int = 8
         self.metadata_header_size: int = len(
-            f"multipart#9999/9999{self.metadata_split}"
+            f"multipart#{'f' * self.stream_id_size}#9999/9999{self.metadata_split}"
         )
+        self.stream_ttl = stream_ttl
+        self.max_storage_size = max_storage_size
+        self.storage_size: int = 0
+        self.evicted_streams: int = 0
+        self.metrics = metrics
 
     def is_multipart(self, message: Message) -> bool:
-        return message.body.startswith("multipart#")
+        return message.body is not None and message.body.startswith("multipart#")
 
     def any_multipart_waiting(self) -> bool:
         return len(self.multipart_message_storage.keys()) > 0
 
+    def parse_header(self, message: Message) -> tuple[str, int, int, int]:
+        """
+        Parses the multipart header of a message. Headers without stream id ("multipart#1/2|") belong to
+        the stream "0".
+
+        Returns:
+            tuple[str, int, int, int]: Stream id, part number (starting by 1), total parts and header length.
+        """
+        header_end = message.body.index(self.metadata_split)
+        multipart_meta = message.body[:header_end].split("#")
+        stream_id = multipart_meta[1] if len(multipart_meta) > 2 else "0"
+        part_number, total_parts = multipart_meta[-1].split("/")
+        return stream_id, int(part_number), int(total_parts), header_end + 1
+
     def is_multipart_complete(self, message: Message) -> bool | None:
         """
         Returns a bool to denote whether the message is complete and ready to be rebuilded.
-        Returns None if the sender has not multipart messages stored.
+        Returns None if the sender has not multipart messages stored for the message stream.
 
         Args:
             message (Message): A SPADE message used to check if it is part of a chain of multipart messages.
@@ -38,28 +116,86 @@ class MultipartHandler:
         Returns:
             bool | None: True if multipart is complete, False otherwise and None if the sender has not multipart messages stored.
         """
-        sender = message.sender
-        if not sender in self.multipart_message_storage.keys():
+        stream_id, _, _, _ = self.parse_header(message)
+        key = (message.sender, stream_id)
+        if not key in self.multipart_message_storage.keys():
             return None
-        for part in self.multipart_message_storage[sender]:
-            if part is None:
-                return False
-        return True
+        return self.multipart_message_storage[key].is_complete()
 
-    def rebuild_multipart_content(self, sender: JID) -> str:
-        content = ""
-        for part in self.multipart_message_storage[sender]:
-            content += part
-        return content
+    def get_stream_key(self, message: Message) -> tuple[JID, str]:
+        stream_id, _, _, _ = self.parse_header(message)
+        return (message.sender, stream_id)
 
-    def remove_data(self, sender: JID) -> None:
-        if sender in self.multipart_message_storage.keys():
-            del self.multipart_message_storage[sender]
+    def get_stream(self, message: Message) -> MultipartStream | None:
+        return self.multipart_message_storage.get(self.get_stream_key(message))
+
+    def discard_streams(
+        self, sender: JID, predicate: Callable[[MultipartStream], bool]
+    ) -> list[tuple[JID, str]]:
+        """
+        Removes the incomplete streams of the sender that match the predicate.
+
+        Returns:
+            list[tuple[JID, str]]: The keys of the removed streams.
+        """
+        keys = [
+            k
+            for (k, stream) in self.multipart_message_storage.items()
+            if k[0] == sender and predicate(stream)
+        ]
+        for key in keys:
+            self.remove_stream(key)
+        return keys
+
+    def rebuild_multipart_content(self, sender: JID, stream_id: str = "0") -> str:
+        return self.multipart_message_storage[(sender, stream_id)].rebuild()
+
+    def remove_stream(self, key: tuple[JID, str]) -> None:
+        stream = self.multipart_message_storage.pop(key, None)
+        if stream is not None:
+            self.storage_size -= stream.size
+
+    def remove_data(self, sender: JID, stream_id: str | None = None) -> None:
+        """
+        Removes the stored parts of one stream of the sender or all the streams of the sender if stream_id is None.
+        """
+        if stream_id is not None:
+            self.remove_stream((sender, stream_id))
+            return
+        for key in [k for k in self.multipart_message_storage.keys() if k[0] == sender]:
+            self.remove_stream(key)
+
+    def evict_streams(self, now: float | None = None) -> int:
+        """
+        Evicts the incomplete streams that have not received parts for more than stream_ttl seconds and,
+        if max_storage_size is set, the least recently updated streams until the storage fits.
+
+        Returns:
+            int: The number of evicted streams.
+        """
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        # Streams are kept ordered by their last update, so the stale ones are always at the beginning
+        while self.multipart_message_storage:
+            key, stream = next(iter(self.multipart_message_storage.items()))
+            expired = now - stream.last_update > self.stream_ttl
+            oversized = (
+                self.max_storage_size is not None
+                and self.storage_size > self.max_storage_size
+            )
+            if not expired and not oversized:
+                break
+            self.remove_stream(key)
+            evicted += 1
+        self.evicted_streams += evicted
+        if evicted > 0 and self.metrics is not None:
+            self.metrics.inc("multipart_evicted_streams", evicted)
+        return evicted
 
     def rebuild_multipart(self, message: Message) -> Message | None:
         """
         Rebuilds the multipart message linked to the message argument and removes the sender
-        multipart stored data.
+        multipart stored data of that stream.
 
         Args:
             message (Message): One message part.
@@ -68,74 +204,157 @@ class MultipartHandler:
             Message | None: The rebuilded message with all the multiparts content in its body property.
             Returns None if the message is not complete or it is not a multipart message.
         """
-        # NOTE multipart header: multipart#1/2|
-        # multipart_meta = message.get_metadata("multipart")
+        # NOTE multipart header: multipart#[stream]#1/2|
         if self.is_multipart(message):
-            sender = message.sender
-            multipart_meta = message.body.split(self.metadata_split)[0]
-            multipart_meta_parts = multipart_meta.split("#")[1]
-            part_number = int(multipart_meta_parts.split("/")[0])
-            total_parts = int(multipart_meta_parts.split("/")[1])
-            if not sender in self.multipart_message_storage.keys():
-                self.multipart_message_storage[sender] = [None] * total_parts
-            self.multipart_message_storage[sender][part_number - 1] = message.body[
-                len(multipart_meta + self.metadata_split) :
-            ]
-            if self.is_multipart_complete(message):
-                message.body = self.rebuild_multipart_content(sender=sender)
-                self.remove_data(sender=sender)
+            now = time.monotonic()
+            stream_id, part_number, total_parts, header_size = self.parse_header(
+                message
+            )
+            key = (message.sender, stream_id)
+            stream = self.multipart_message_storage.get(key)
+            if stream is None or stream.total_parts != total_parts:
+                self.remove_stream(key)
+                stream = MultipartStream(
+                    total_parts=total_parts, now=now, metadata=dict(message.metadata)
+                )
+                self.multipart_message_storage[key] = stream
+            else:
+                self.multipart_message_storage.move_to_end(key)
+            self.storage_size += stream.add_part(
+                part_number=part_number, part=message.body[header_size:], now=now
+            )
+            if stream.is_complete():
+                if self.metrics is not None:
+                    self.metrics.observe(
+                        "multipart_reassembly_seconds", now - stream.first_update
+                    )
+                message.body = stream.rebuild()
+                self.remove_stream(key)
+                self.evict_streams(now=now)
                 return message
+            self.evict_streams(now=now)
         return None
 
-    def divide_content(self, content: str, size: int) -> list[str]:
-        return [content[i : i + size] for i in range(0, len(content), size)]
+    def generate_stream_id(self) -> str:
+        return secrets.token_hex(self.stream_id_size // 2)
+
+    def get_total_parts(self, content_length: int, max_size: int) -> int:
+        """
+        Returns:
+            int: The number of messages needed to send a content of that length, 1 if it is not split.
+        """
+        if content_length <= max_size:
+            return 1
+        return -(-content_length // (max_size - self.metadata_header_size))
+
+    def divide_content(self, content: str | bytes, size: int) -> Iterator[str]:
+        """
+        Lazily yields slices of the content. Binary content (ASCII bytes, like the base64 payloads of the
+        PayloadCodec) is sliced through a memoryview, so only one slice is copied at a time.
+        """
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            view = memoryview(content)
+            for i in range(0, len(view), size):
+                yield str(view[i : i + size], "ascii")
+        else:
+            for i in range(0, len(content), size):
+                yield content[i : i + size]
+
+    def iter_multipart_content(
+        self, content: str | bytes, max_size: int
+    ) -> Iterator[str] | None:
+        """
+        Lazy version of generate_multipart_content. The multipart bodies are built one by one while iterating.
+
+        Args:
+            content (str | bytes): The content to be splitted if its length exceeds the max_size.
+            max_size (int): Threshold to split the content into a list of content.
+
+        Returns:
+            Iterator[str] | None: Iterator of multipart message content or None if the content does not exceed the max_size.
+        """
+        if len(content) <= max_size:
+            return None
+        part_size = max_size - self.metadata_header_size
+        total_parts = self.get_total_parts(len(content), max_size)
+        stream_id = self.generate_stream_id()
+        return (
+            f"multipart#{stream_id}#{i + 1}/{total_parts}{self.metadata_split}{part}"
+            for i, part in enumerate(self.divide_content(content, part_size))
+        )
 
     def generate_multipart_content(
-        self, content: str, max_size: int
+        self, content: str | bytes, max_size: int
     ) -> list[str] | None:
         """
         Generates a list of multipart content based on the desired maximum size of each multipart message content
         and the maximum header size of the multipart messages metadata.
 
         Args:
-            content (str): The content to be splitted if its length exceeds the max_size.
+            content (str | bytes): The content to be splitted if its length exceeds the max_size.
             max_size (int): Threshold to split the content into a list of content.
 
         Returns:
             list[str] | None: List of multipart message content to put in the body of the SPADE messages
             or None if the content length does not exceed the max_size tanking into account the multipart header metadata.
         """
-        if len(content) > max_size:
-            multiparts = self.divide_content(
-                content, max_size - self.metadata_header_size
-            )
-            return [
-                f"multipart#{i + 1}/{len(multiparts)}{self.metadata_split}{part}"
-                for i, part in enumerate(multiparts)
-            ]
-        return None
+        multiparts = self.iter_multipart_content(content=content, max_size=max_size)
+        return list(multiparts) if multiparts is not None else None
+
+    def build_message(
+        self, message_base: Message, body: str, to: str | None = None
+    ) -> Message:
+        """
+        Builds a lightweight copy of message_base with another body and, optionally, another receiver.
+        The metadata values are immutable strings, so a shallow copy of the metadata is enough.
+        """
+        if to is None and message_base.to is not None:
+            to = str(message_base.to)
+        return Message(
+            to=to,
+            sender=(
+                str(message_base.sender) if message_base.sender is not None else None
+            ),
+            body=body,
+            thread=message_base.thread,
+            metadata=dict(message_base.metadata),
+        )
+
+    def iter_multipart_messages(
+        self, content: str | bytes, max_size: int, message_base: Message
+    ) -> Iterator[Message] | None:
+        """
+        Lazy version of generate_multipart_messages. Only one multipart body is alive at a time while iterating.
+
+        Args:
+            content (str | bytes): The information that multipart messages will have in its bodies.
+            max_size (int): Maximum size body length of each multipart message.
+            message_base (Message): The message used as base by all the multipart messages, replacing just the body.
+
+        Returns:
+            Iterator[Message] | None: An iterator of multipart messages to send or None if the content does not exceed the maximum size.
+        """
+        multiparts = self.iter_multipart_content(content=content, max_size=max_size)
+        if multiparts is None:
+            return None
+        return (self.build_message(message_base, multipart) for multipart in multiparts)
 
     def generate_multipart_messages(
-        self, content: str, max_size: int, message_base: Message
+        self, content: str | bytes, max_size: int, message_base: Message
     ) -> list[Message] | None:
         """
         Creates multipart messages from one SPADE message if the length of the content
         argument is longer than the max_size argument.
 
         Args:
-            content (str): The information that multipart messages will have in its bodies.
+            content (str | bytes): The information that multipart messages will have in its bodies.
             max_size (int): Maximum size body length of each multipart message.
-            message_base (Message): The message that will be copied by all the multipart messages, replacing just the body.
+            message_base (Message): The message used as base by all the multipart messages, replacing just the body.
 
         Returns:
             list[Message] | None: A list of multipart messages to send or None if the content does not exceed the maximum size.
         """
-        multiparts = self.generate_multipart_content(content=content, max_size=max_size)
-        if multiparts is not None:
-            multiparts_messages = []
-            for multipart in multiparts:
-                message = copy.deepcopy(message_base)
-                message.body = multipart
-                multiparts_messages.append(message)
-            return multiparts_messages
-        return None
+        multiparts = self.iter_multipart_messages(
+            content=content, max_size=max_size, message_base=message_base
+        )
+        return list(multiparts) if multiparts is not None else None
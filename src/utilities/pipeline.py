@@ -0,0 +1,91 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterable
+
+from spade.message import Message
+
+
+class SendPipeline:
+    """
+    Class created to send the messages of an agent concurrently. Every destination has a window with the maximum
+    number of messages in flight, so the parts of a multipart message are pipelined instead of waiting the
+    round trip of each part. The bytes of all the messages in flight are limited by a budget shared by all the
+    destinations: when it is exceeded, new sends wait until previous ones are handed off (backpressure).
+    """
+
+    def __init__(self, window: int = 8, max_pending_bytes: int = 8 * 1024 * 1024) -> None:
+        if window < 1:
+            raise ValueError("window must be greater than 0.")
+        self.window = window
+        self.max_pending_bytes = max_pending_bytes
+        self.pending_bytes: int = 0
+        self.windows: dict[str, asyncio.Semaphore] = {}
+        self.budget_condition: asyncio.Condition | None = None
+
+    def get_window(self, destination: str) -> asyncio.Semaphore:
+        if not destination in self.windows.keys():
+            self.windows[destination] = asyncio.Semaphore(self.window)
+        return self.windows[destination]
+
+    def get_budget_condition(self) -> asyncio.Condition:
+        # Created lazily to be bound to the loop of the agent
+        if self.budget_condition is None:
+            self.budget_condition = asyncio.Condition()
+        return self.budget_condition
+
+    async def acquire_budget(self, size: int) -> None:
+        condition = self.get_budget_condition()
+        async with condition:
+            # A message bigger than the budget is allowed when nothing else is in flight
+            await condition.wait_for(
+                lambda: self.pending_bytes == 0
+                or self.pending_bytes + size <= self.max_pending_bytes
+            )
+            self.pending_bytes += size
+
+    async def release_budget(self, size: int) -> None:
+        condition = self.get_budget_condition()
+        async with condition:
+            self.pending_bytes -= size
+            condition.notify_all()
+
+    async def send_message(
+        self, message: Message, send: Callable[[Message], Awaitable[None]]
+    ) -> None:
+        size = len(message.body) if message.body is not None else 0
+        await self.acquire_budget(size)
+        try:
+            await send(message)
+        finally:
+            await self.release_budget(size)
+
+    async def send_all(
+        self,
+        destination: str,
+        messages: Iterable[Message],
+        send: Callable[[Message], Awaitable[None]],
+    ) -> None:
+        """
+        Sends the messages to one destination keeping at most "window" messages in flight. The messages iterable
+        is consumed lazily, only when there is room in the window.
+
+        Args:
+            destination (str): The destination of the messages, used to select the window.
+            messages (Iterable[Message]): The messages to send.
+            send (Callable[[Message], Awaitable[None]]): Coroutine function that hands off one message.
+        """
+        window = self.get_window(destination)
+        tasks = []
+        try:
+            for message in messages:
+                await window.acquire()
+                task = asyncio.ensure_future(
+                    self.send_message(message=message, send=send)
+                )
+                # Released on completion, even if the task is cancelled before starting
+                task.add_done_callback(lambda _: window.release())
+                tasks.append(task)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
@@ -0,0 +1,55 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from utilities.metrics import MetricsRegistry
+
+
+class StartupTimer:
+    """
+    Class created to measure where the startup time of an experiment goes (imports, dataset load, XMPP
+    registration of the agents...). Every phase is timed with the phase context manager or recorded with its
+    seconds, and the phases that are repeated (for example, one dataset load per agent) are accumulated.
+
+    If a metrics registry is given, every phase is also exported as the "startup_phase_seconds" gauge.
+    """
+
+    def __init__(self, metrics: MetricsRegistry = None) -> None:
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    def set_metrics(self, metrics: MetricsRegistry) -> None:
+        """
+        Exports the phases to the registry, including the ones recorded before it existed (like the imports).
+        """
+        self.metrics = metrics
+        for name, seconds in self.phases.items():
+            self.metrics.set("startup_phase_seconds", seconds, phase=name)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0) + seconds
+        if self.metrics is not None:
+            self.metrics.set("startup_phase_seconds", self.phases[name], phase=name)
+
+    def elapsed(self) -> float:
+        """
+        Returns:
+            float: Seconds since the timer was created.
+        """
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        lines = [
+            f"{name:<24} {seconds:>10.3f} s" for name, seconds in self.phases.items()
+        ]
+        lines.append(f"{'total':<24} {self.elapsed():>10.3f} s")
+        return "\n".join(lines)
@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+from threading import Lock
+
+from aioxmpp import JID
+from spade.agent import Agent
+from spade.message import Message
+
+
+class LoopbackTransport:
+    """
+    Class created to exchange messages between agents of the same process without the XMPP server. The agents
+    that share a transport are registered by their bare JID and the messages sent to them are put directly in
+    the mailboxes of their behaviours (Agent.dispatch), so there is no stanza serialization, no round-trip
+    to the server and no maximum message size: the content is never split in multipart messages.
+
+    The receivers get a new Message with the same fields, so the algorithms receive the same messages as with
+    XMPP. Messages to agents that are not registered (other processes or hosts) are still sent through XMPP.
+    """
+
+    def __init__(self) -> None:
+        self.agents: dict[str, Agent] = {}
+        self.lock = Lock()
+        self.delivered_messages: int = 0
+
+    def get_key(self, jid: JID | str) -> str:
+        if isinstance(jid, str):
+            jid = JID.fromstr(jid)
+        return str(jid.bare())
+
+    def register(self, agent: Agent) -> None:
+        with self.lock:
+            self.agents[self.get_key(agent.jid)] = agent
+
+    def unregister(self, agent: Agent) -> None:
+        with self.lock:
+            key = self.get_key(agent.jid)
+            if self.agents.get(key) is agent:
+                del self.agents[key]
+
+    def is_local(self, jid: JID | str | None) -> bool:
+        return jid is not None and self.get_key(jid) in self.agents.keys()
+
+    async def deliver(self, message: Message) -> None:
+        """
+        Puts the message in the mailboxes of the receiver behaviours that match it.
+
+        Args:
+            message (Message): The message to deliver, its receiver must be registered in the transport.
+        """
+        agent = self.agents[self.get_key(message.to)]
+        futures = agent.dispatch(msg=message)
+        self.delivered_messages += 1
+        await asyncio.gather(*[asyncio.wrap_future(f) for f in futures])
+
+
+class OfflineConnection:
+    """
+    Mixin for the agents that run without an XMPP server, like the stand-in agents of the tests and benchmarks:
+    class StandInAgent(OfflineConnection, AgentNodeBase). The registration does nothing and the connection only
+    waits "connect_latency" seconds in the event loop, so starting and stopping the agents runs the same code as
+    with a server. The agents can only exchange messages with the agents of the same process, through the SPADE
+    container or a LoopbackTransport.
+    """
+
+    connect_latency: float = 0.0
+
+    async def _async_register(self) -> None:
+        pass
+
+    async def _async_connect(self) -> None:
+        await asyncio.sleep(self.connect_latency)
+        # Exited by Agent._async_stop as the connection to the server
+        self.conn_coro = contextlib.nullcontext()
@@ -0,0 +1,40 @@
+import asyncio
+from collections.abc import Coroutine
+from concurrent.futures import Future
+
+from spade.behaviour import CyclicBehaviour
+from spade.container import Container
+
+from base import AgentBase, AgentNodeBase
+from utilities.transport import OfflineConnection
+
+
+class StandInAgent(OfflineConnection, AgentBase):
+    pass
+
+
+class StandInNode(OfflineConnection, AgentNodeBase):
+    pass
+
+
+class InboxBehaviour(CyclicBehaviour):
+    """
+    Behaviour that only collects the messages of the agent, received by the tests with agent.receive.
+    """
+
+    def set_agent(self, agent) -> None:
+        try:
+            super().set_agent(agent)
+        except TypeError:
+            # SPADE 3.2.2 passes the removed loop argument to asyncio.Queue in Python 3.10+
+            self.agent = agent
+            self.queue = asyncio.Queue()
+            self.presence = agent.presence
+            self.web = agent.web
+
+    async def run(self) -> None:
+        await asyncio.sleep(1)
+
+
+def run_in_container(coroutine: Coroutine) -> Future:
+    return asyncio.run_coroutine_threadsafe(coroutine, Container().loop)
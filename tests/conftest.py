@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The modules of the project are imported from the src folder and the agents from the agent folder, as in launch.py
+src = Path(__file__).resolve().parent.parent / "src"
+sys.path[:0] = [str(src), str(src / "agent")]
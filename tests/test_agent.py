@@ -0,0 +1,71 @@
+import asyncio
+from concurrent.futures import Future
+
+from agents import StandInAgent, run_in_container
+from utilities.transport import LoopbackTransport
+
+
+def test_start_in_the_container_loop() -> None:
+    transport = LoopbackTransport()
+    agent = StandInAgent(
+        "start@localhost", "password", neighbours=[], transport=transport
+    )
+
+    async def start() -> bool:
+        # Agent.start returns a coroutine in the loop of the container
+        assert asyncio.iscoroutine(coroutine := agent.start())
+        await coroutine
+        return agent.is_alive()
+
+    assert run_in_container(start()).result(timeout=5)
+    assert transport.is_local("start@localhost")
+    histograms = agent.metrics.snapshot()["histograms"]
+    assert [h["name"] for h in histograms] == ["xmpp_registration_seconds"]
+    stopped = []
+    agent.stop_callbacks.append(stopped.append)
+
+    async def stop() -> None:
+        assert asyncio.iscoroutine(coroutine := agent.stop())
+        await coroutine
+
+    run_in_container(stop()).result(timeout=5)
+    assert not agent.is_alive()
+    assert stopped == [agent]
+    assert not transport.is_local("start@localhost")
+
+
+def test_start_from_another_thread() -> None:
+    transport = LoopbackTransport()
+    agent = StandInAgent(
+        "thread@localhost", "password", neighbours=[], transport=transport
+    )
+    future = agent.start()
+    assert isinstance(future, Future)
+    future.result(timeout=5)
+    assert agent.is_alive()
+    assert transport.is_local("thread@localhost")
+    agent.stop().result(timeout=5)
+
+
+def test_async_start_from_any_loop() -> None:
+    agent = StandInAgent("any@localhost", "password", neighbours=[])
+    run_in_container(agent.async_start()).result(timeout=5)
+    assert agent.is_alive()
+    agent.stop().result(timeout=5)
+    asyncio.run(agent.async_start())
+    assert agent.is_alive()
+    agent.stop().result(timeout=5)
+
+
+def test_failed_start_is_not_registered() -> None:
+    class FailingAgent(StandInAgent):
+        async def setup(self) -> None:
+            raise RuntimeError("setup failed")
+
+    transport = LoopbackTransport()
+    agent = FailingAgent("fail@localhost", "password", [], transport=transport)
+    try:
+        run_in_container(agent.async_start()).result(timeout=5)
+    except RuntimeError:
+        pass
+    assert not transport.is_local("fail@localhost")
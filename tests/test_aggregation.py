@@ -0,0 +1,112 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from nn.aggregation import ModelAggregator
+
+
+class TiedModel(nn.Module):
+    def __init__(self) -> None:
+        super().__init__()
+        self.encoder = nn.Linear(4, 4)
+        self.decoder = nn.Linear(4, 4)
+        self.decoder.weight = self.encoder.weight
+        self.norm = nn.BatchNorm1d(4)
+
+
+def build_models(count: int, dtype: torch.dtype = torch.float32) -> list[nn.Module]:
+    torch.manual_seed(0)
+    return [
+        nn.Sequential(nn.Linear(4, 3), nn.BatchNorm1d(3)).to(dtype)
+        for _ in range(count)
+    ]
+
+
+def average(
+    state_dicts: list[dict[str, torch.Tensor]], weights: list[float]
+) -> dict[str, torch.Tensor]:
+    return {
+        name: sum(w * s[name] for s, w in zip(state_dicts, weights)) / sum(weights)
+        for name, tensor in state_dicts[0].items()
+        if tensor.is_floating_point()
+    }
+
+
+def assert_model_equal(model: nn.Module, expected: dict[str, torch.Tensor]) -> None:
+    state_dict = model.state_dict()
+    for name, tensor in expected.items():
+        torch.testing.assert_close(state_dict[name], tensor)
+
+
+def test_fedavg() -> None:
+    local, *neighbours = build_models(3)
+    state_dicts = [
+        {k: v.clone() for k, v in m.state_dict().items()} for m in (local, *neighbours)
+    ]
+    aggregator = ModelAggregator(local, strategy="fedavg")
+    model = aggregator.aggregate(
+        [m.state_dict() for m in neighbours], num_samples=[10, 1000]
+    )
+    assert model is local
+    assert_model_equal(local, average(state_dicts, [1, 1, 1]))
+    # The integer buffers are not aggregated
+    assert local.state_dict()["1.num_batches_tracked"].dtype == torch.int64
+
+
+def test_weighted_and_staleness() -> None:
+    for strategy, weights in (
+        ("weighted", [10, 30, 60]),
+        ("staleness", [10, 30 * 2**-1, 60 * 4**-1]),
+    ):
+        local, *neighbours = build_models(3)
+        state_dicts = [m.state_dict() for m in (local, *neighbours)]
+        expected = average(state_dicts, weights)
+        aggregator = ModelAggregator(local, strategy=strategy, staleness_exponent=1)
+        # The neighbour models can also be given already flattened
+        flat = [aggregator.flatten(m.state_dict()) for m in neighbours]
+        aggregator.aggregate(
+            flat, num_samples=[30, 60], staleness=[1, 3], local_num_samples=10
+        )
+        assert_model_equal(local, expected)
+
+
+def test_dtype_is_kept() -> None:
+    local, neighbour = build_models(2, dtype=torch.float64)
+    expected = average([local.state_dict(), neighbour.state_dict()], [1, 1])
+    aggregator = ModelAggregator(local)
+    assert aggregator.flat_model.dtype == torch.float64
+    aggregator.aggregate([neighbour.state_dict()])
+    assert all(p.dtype == torch.float64 for p in local.parameters())
+    assert_model_equal(local, expected)
+
+
+def test_tied_weights() -> None:
+    local, neighbour = TiedModel(), TiedModel()
+    expected = average([local.state_dict(), neighbour.state_dict()], [1, 1])
+    aggregator = ModelAggregator(local)
+    aggregator.aggregate([neighbour.state_dict()])
+    assert local.decoder.weight is local.encoder.weight
+    assert_model_equal(local, expected)
+
+
+def test_model_is_bound_to_the_flat_buffer() -> None:
+    local, neighbour = build_models(2)
+    aggregator = ModelAggregator(local)
+    optimizer = torch.optim.SGD(local.parameters(), lr=0.1)
+    local.train()
+    local(torch.randn(8, 4)).sum().backward()
+    optimizer.step()
+    # The training updates the flat buffer, so the next aggregation uses the trained model
+    trained = {k: v.clone() for k, v in local.state_dict().items()}
+    assert torch.equal(aggregator.flatten(trained), aggregator.flat_model)
+    expected = average([trained, neighbour.state_dict()], [1, 1])
+    aggregator.aggregate([neighbour.state_dict()])
+    assert_model_equal(local, expected)
+
+
+def test_invalid_models() -> None:
+    with pytest.raises(ValueError):
+        ModelAggregator(build_models(1)[0], strategy="median")
+    mixed = nn.Sequential(nn.Linear(4, 3), nn.Linear(3, 2).to(torch.float64))
+    with pytest.raises(ValueError):
+        ModelAggregator(mixed)
@@ -0,0 +1,97 @@
+import pickle
+from pathlib import Path
+
+import pytest
+import torch
+
+from agents import StandInNode
+from utilities.checkpoint import CheckpointStore
+
+
+def states(weight: torch.Tensor, bias: torch.Tensor, round: int) -> dict:
+    return {
+        "a@localhost": ({"weight": weight, "bias": bias}, {"round": round}),
+        "b@localhost": ({"counts": torch.arange(5, dtype=torch.int64)}, {}),
+    }
+
+
+def test_save_and_load(tmp_path: Path) -> None:
+    store = CheckpointStore(tmp_path)
+    assert store.latest() is None
+    with pytest.raises(KeyError):
+        store.load("a@localhost")
+    weight, bias = torch.randn(3, 4), torch.randn(3, dtype=torch.float16)
+    assert store.save(states(weight, bias, round=1)) == 0
+    # A new store reads the files written by the first one
+    tensors, metadata = CheckpointStore(tmp_path).load("a@localhost")
+    assert metadata == {"round": 1}
+    assert torch.equal(tensors["weight"], weight)
+    assert tensors["bias"].dtype == torch.float16
+    assert torch.equal(tensors["bias"], bias)
+    counts, _ = store.load("b@localhost")
+    assert torch.equal(counts["counts"], torch.arange(5))
+    assert store.contains(0, "b@localhost")
+    assert not store.contains(0, "c@localhost")
+
+
+def test_unchanged_tensors_are_not_written(tmp_path: Path) -> None:
+    store = CheckpointStore(tmp_path)
+    weight, bias = torch.randn(3, 4), torch.randn(3, dtype=torch.float16)
+    store.save(states(weight, bias, round=1))
+    first_size = store.data_path.stat().st_size
+    new_weight = weight + 1
+    assert store.save(states(new_weight, bias, round=2)) == 1
+    # Only the changed tensor is appended
+    assert store.last_written_bytes == new_weight.numel() * new_weight.element_size()
+    assert store.data_path.stat().st_size <= first_size + 64 + 48
+    assert torch.equal(store.load("a@localhost")[0]["weight"], new_weight)
+    assert torch.equal(store.load("a@localhost")[0]["bias"], bias)
+    assert torch.equal(store.load("a@localhost", snapshot=0)[0]["weight"], weight)
+    assert store.get_snapshots() == [0, 1]
+
+
+def test_incomplete_index_line_is_ignored(tmp_path: Path) -> None:
+    store = CheckpointStore(tmp_path)
+    weight, bias = torch.randn(3, 4), torch.randn(3)
+    store.save(states(weight, bias, round=1))
+    # A crash in the middle of the next checkpoint leaves an incomplete index line
+    with open(store.index_path, "ab") as f:
+        f.write(b'{"snapshot":1,"agents":{"a@loc')
+    reopened = CheckpointStore(tmp_path)
+    assert reopened.get_snapshots() == [0]
+    assert reopened.save(states(weight * 2, bias, round=2)) == 1
+    reopened = pickle.loads(pickle.dumps(reopened))
+    assert reopened.get_snapshots() == [0, 1]
+    tensors, metadata = reopened.load("a@localhost")
+    assert metadata == {"round": 2}
+    assert torch.equal(tensors["weight"], weight * 2)
+
+
+def build_node(optimizer: bool = True) -> StandInNode:
+    node = StandInNode(
+        jid="node@localhost", password="test", observers=[], neighbours=[]
+    )
+    node.model = torch.nn.Linear(4, 2)
+    if optimizer:
+        node.optimizer = torch.optim.SGD(node.model.parameters(), lr=0.1, momentum=0.9)
+        node.model(torch.randn(8, 4)).sum().backward()
+        node.optimizer.step()
+    return node
+
+
+def test_agent_resumes_from_the_store(tmp_path: Path) -> None:
+    node = build_node()
+    node.round = 7
+    store = CheckpointStore(tmp_path)
+    store.save({str(node.jid): node.get_checkpoint()})
+    resumed = build_node()
+    resumed.load_checkpoint(*store.load(str(node.jid)))
+    assert resumed.round == 7
+    for name, tensor in node.model.state_dict().items():
+        assert torch.equal(resumed.model.state_dict()[name], tensor)
+    momentum = [s["momentum_buffer"] for s in node.optimizer.state.values()]
+    resumed_momentum = [s["momentum_buffer"] for s in resumed.optimizer.state.values()]
+    assert all(torch.equal(a, b) for a, b in zip(momentum, resumed_momentum))
+    # The optimizer state can not be restored without an optimizer
+    with pytest.raises(ValueError):
+        build_node(optimizer=False).load_checkpoint(*store.load(str(node.jid)))
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from spade.message import Message
+
+from agents import InboxBehaviour, StandInNode, run_in_container
+from utilities.coalition import CoalitionManager
+
+COALITIONS = {
+    "c0": ["a@localhost", "b@localhost", "c@localhost"],
+    "c1": ["d@localhost", "e@localhost"],
+}
+
+
+def test_election_and_rotation() -> None:
+    coalitions = CoalitionManager(COALITIONS)
+    assert coalitions.get_leader("c@localhost") == "a@localhost"
+    assert coalitions.get_recipients("b@localhost") == ["a@localhost"]
+    assert coalitions.get_recipients("a@localhost") == [
+        "b@localhost",
+        "c@localhost",
+        "d@localhost",
+    ]
+    coalitions.mark_failed("a@localhost")
+    assert coalitions.get_leader("c@localhost") == "b@localhost"
+    assert coalitions.get_recipients("d@localhost") == ["e@localhost", "b@localhost"]
+    # The recovered leader does not take the leadership back
+    coalitions.mark_recovered("a@localhost")
+    assert coalitions.get_leader("a@localhost") == "b@localhost"
+
+
+def test_agent_detects_a_silent_leader() -> None:
+    agent = StandInNode(
+        "b@localhost",
+        "password",
+        [],
+        [],
+        coalitions=CoalitionManager(COALITIONS),
+        failure_timeout=10,
+    )
+    now = time.monotonic()
+    assert agent.detect_failures(now=now) == []
+    assert agent.detect_failures(now=now + 5) == []
+    # The leader is silent for longer than the timeout, so b becomes the leader
+    assert agent.detect_failures(now=now + 11) == ["a@localhost"]
+    assert agent.coalitions.is_leader("b@localhost")
+    # The new senders (c and the other leader) get a whole timeout to send
+    assert agent.detect_failures(now=now + 20) == []
+    assert agent.detect_failures(now=now + 22) == ["c@localhost", "d@localhost"]
+    assert agent.coalitions.get_leader("e@localhost") == "e@localhost"
+    agent.mark_seen("a@localhost")
+    assert not "a@localhost" in agent.coalitions.failed
+
+
+def test_leader_rotates_between_running_agents() -> None:
+    coalitions = {"c0": ["a@localhost", "b@localhost", "c@localhost"]}
+    # The leader a never starts
+    agents = {
+        name: StandInNode(
+            f"{name}@localhost",
+            "password",
+            [],
+            [],
+            coalitions=CoalitionManager(coalitions),
+            failure_timeout=0.3,
+        )
+        for name in ("b", "c")
+    }
+    behaviours = {name: InboxBehaviour() for name in agents.keys()}
+    for name, agent in agents.items():
+        agent.add_behaviour(behaviours[name])
+
+    async def run() -> None:
+        for agent in agents.values():
+            await agent.async_start()
+        assert [str(r) for r in agents["c"].get_model_recipients()] == ["a@localhost"]
+        await agents["b"].receive_models(behaviours["b"])
+        await asyncio.sleep(0.2)
+        await agents["c"].send(Message(to="b@localhost", body="alive"))
+        await asyncio.sleep(0.2)
+        # c hears nothing from a, b hears from c but a does not send to b
+        assert [str(r) for r in agents["c"].get_model_recipients()] == ["b@localhost"]
+        await agents["b"].receive_models(behaviours["b"])
+        assert agents["b"].coalitions.is_leader("b@localhost")
+        assert [str(r) for r in agents["b"].get_model_recipients()] == ["c@localhost"]
+        assert not "c@localhost" in agents["b"].coalitions.failed
+        for agent in agents.values():
+            await agent.async_stop()
+
+    run_in_container(run()).result(timeout=10)
@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+from utilities.codec import PayloadCodec
+
+
+def get_state_dict() -> dict[str, torch.Tensor]:
+    generator = torch.Generator().manual_seed(0)
+    return {
+        "fc.weight": torch.randn(16, 8, generator=generator),
+        "fc.bias": torch.randn(16, generator=generator),
+        "bn.num_batches_tracked": torch.tensor(7),
+        "empty": torch.empty(0),
+    }
+
+
+@pytest.mark.parametrize(
+    "quantization, tolerance", [("fp32", 0.0), ("fp16", 1e-2), ("int8", 5e-2)]
+)
+def test_round_trip(quantization: str, tolerance: float) -> None:
+    codec = PayloadCodec(quantization=quantization)
+    state_dict = get_state_dict()
+    content = codec.encode(state_dict)
+    assert codec.is_encoded(content)
+    decoded = codec.decode(content)
+    assert list(decoded.keys()) == list(state_dict.keys())
+    for name, tensor in state_dict.items():
+        assert decoded[name].dtype == tensor.dtype
+        assert decoded[name].shape == tensor.shape
+        if tensor.is_floating_point():
+            assert torch.allclose(decoded[name], tensor, rtol=0, atol=tolerance)
+        else:
+            assert torch.equal(decoded[name], tensor)
+
+
+@pytest.mark.parametrize("quantization", PayloadCodec.QUANTIZATIONS)
+def test_decoded_values_match_quantization_roundtrip(quantization: str) -> None:
+    codec = PayloadCodec(quantization=quantization)
+    state_dict = get_state_dict()
+    decoded = codec.decode(codec.encode_bytes(state_dict).decode("ascii"))
+    for name, tensor in state_dict.items():
+        assert torch.equal(decoded[name], codec.quantization_roundtrip(tensor))
+
+
+def test_quantization_reduces_size() -> None:
+    state_dict = get_state_dict()
+    sizes = [len(PayloadCodec(q).encode(state_dict)) for q in ("fp32", "fp16", "int8")]
+    assert sizes[0] > sizes[1] > sizes[2]
+
+
+def test_invalid_content() -> None:
+    with pytest.raises(ValueError):
+        PayloadCodec().decode("not a payload")
@@ -0,0 +1,118 @@
+import pytest
+import torch
+from spade.message import Message
+
+from agents import InboxBehaviour, StandInNode, run_in_container
+
+from utilities.codec import PayloadCodec
+from utilities.delta import DeltaDecoder, DeltaEncoder, DeltaMismatchError
+
+SENDER = "sender@localhost"
+RECEIVER = "receiver@localhost"
+
+
+def get_models(steps: int) -> list[dict[str, torch.Tensor]]:
+    generator = torch.Generator().manual_seed(0)
+    model = {"w": torch.randn(32, 4, generator=generator), "steps": torch.tensor(0)}
+    models = []
+    for step in range(steps):
+        model = {
+            "w": model["w"] + 0.01 * torch.randn(32, 4, generator=generator),
+            "steps": torch.tensor(step + 1),
+        }
+        models.append(model)
+    return models
+
+
+def transmit(
+    encoder: DeltaEncoder, decoder: DeltaDecoder, model: dict[str, torch.Tensor]
+) -> dict[str, torch.Tensor]:
+    kind, sequence, tensors = encoder.encode(RECEIVER, model)
+    # The tensors travel through the codec, as in send_model_update
+    tensors = encoder.codec.decode(encoder.codec.encode(tensors))
+    return decoder.decode(SENDER, kind, tensors, sequence=sequence)
+
+
+@pytest.mark.parametrize("mode", DeltaEncoder.MODES)
+def test_first_update_is_full(mode: str) -> None:
+    kind, sequence, _ = DeltaEncoder(mode=mode).encode(RECEIVER, get_models(1)[0])
+    assert (kind, sequence) == ("full", 0)
+
+
+@pytest.mark.parametrize("mode", ["dense", "topk"])
+@pytest.mark.parametrize("quantization", ["fp32", "int8"])
+def test_convergence(mode: str, quantization: str) -> None:
+    encoder = DeltaEncoder(mode=mode, ratio=0.1, codec=PayloadCodec(quantization))
+    decoder = DeltaDecoder()
+    models = get_models(20)
+    for model in models:
+        rebuilt = transmit(encoder, decoder, model)
+        # The receiver always has what the encoder believes it has
+        assert torch.equal(rebuilt["w"], encoder.references[RECEIVER]["w"])
+        assert torch.equal(rebuilt["steps"], model["steps"])
+    # With error feedback, sending the same model again drives the remaining error to 0
+    error = (rebuilt["w"] - models[-1]["w"]).abs().max().item()
+    for _ in range(50):
+        rebuilt = transmit(encoder, decoder, models[-1])
+    assert (rebuilt["w"] - models[-1]["w"]).abs().max().item() < max(error, 1e-6)
+    if quantization == "fp32":
+        assert torch.allclose(rebuilt["w"], models[-1]["w"], atol=1e-6)
+
+
+def test_lost_update_is_detected() -> None:
+    encoder = DeltaEncoder(mode="dense")
+    decoder = DeltaDecoder()
+    models = get_models(3)
+    transmit(encoder, decoder, models[0])
+    encoder.encode(RECEIVER, models[1])
+    kind, sequence, tensors = encoder.encode(RECEIVER, models[2])
+    with pytest.raises(DeltaMismatchError):
+        decoder.decode(SENDER, kind, tensors, sequence=sequence)
+    with pytest.raises(DeltaMismatchError):
+        decoder.decode(SENDER, kind, tensors, sequence=sequence + 1)
+    # After the resync request the encoder sends the full model again
+    encoder.reset(RECEIVER)
+    rebuilt = transmit(encoder, decoder, models[2])
+    assert torch.equal(rebuilt["w"], models[2]["w"])
+
+
+def test_resync_between_agents() -> None:
+    sender = StandInNode(SENDER, "password", [], [], update_mode="dense")
+    receiver = StandInNode(RECEIVER, "password", [], [], update_mode="dense")
+    behaviours = {sender: InboxBehaviour(), receiver: InboxBehaviour()}
+    for agent, behaviour in behaviours.items():
+        agent.add_behaviour(behaviour)
+    models = get_models(5)
+
+    async def send(model: dict[str, torch.Tensor]) -> None:
+        await sender.send_model_update(Message(to=RECEIVER), model)
+
+    async def receive() -> list[dict[str, torch.Tensor] | None]:
+        messages = await receiver.receive_models(behaviours[receiver], timeout=1)
+        return [receiver.decode_model_update(m) for m in messages.get(SENDER, [])]
+
+    async def exchange() -> None:
+        for agent in behaviours.keys():
+            await agent.async_start()
+        await send(models[0])
+        [model] = await receive()
+        assert torch.equal(model["w"], models[0]["w"])
+        # The update of models[1] is lost, so the next one does not apply
+        sender.delta_encoder.encode(RECEIVER, models[1])
+        await send(models[2])
+        assert await receive() == [None]
+        # The receiver asks for the full model and the sender resets its reference
+        assert await sender.receive_models(behaviours[sender], timeout=1) == {}
+        assert not RECEIVER in sender.delta_encoder.references.keys()
+        await send(models[3])
+        await send(models[4])
+        received = await receive()
+        assert [m is not None for m in received] == [True, True]
+        assert torch.allclose(received[-1]["w"], models[4]["w"])
+        for agent in behaviours.keys():
+            await agent.async_stop()
+
+    run_in_container(exchange()).result(timeout=10)
+    counters = {c["name"]: c["value"] for c in receiver.metrics.snapshot()["counters"]}
+    assert counters["delta_resync_requests"] == 1
+    assert not "post_errors" in counters
@@ -0,0 +1,127 @@
+import contextlib
+import io
+import json
+import socket
+import time
+import urllib.parse
+import urllib.request
+
+from agents import StandInNode
+from launcher import LauncherAgent
+from utilities.transport import LoopbackTransport, OfflineConnection
+
+
+class CountingNode(StandInNode):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.starts: int = 0
+
+    async def setup(self) -> None:
+        self.starts += 1
+
+
+def build_launcher(name: str, count: int) -> LauncherAgent:
+    transport = LoopbackTransport()
+    agents = [
+        CountingNode(f"{name}{i}@localhost", "password", [], [], transport=transport)
+        for i in range(count)
+    ]
+    return LauncherAgent(
+        jid=f"{name}-launcher@localhost",
+        password="password",
+        neighbours=[],
+        agents=agents,
+    )
+
+
+def test_launch_and_stop_in_the_container_loop() -> None:
+    launcher = build_launcher("concurrent", 5)
+    stopped = []
+    for agent in launcher.agents:
+        agent.stop_callbacks.append(stopped.append)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        launcher.launch_agents_concurrently(max_concurrency=2).result(timeout=10)
+    assert "exploded" not in output.getvalue()
+    assert launcher.wait_for_launch(timeout=0)
+    assert launcher.all_agents_are_launched()
+    assert all(agent.is_alive() for agent in launcher.agents)
+    assert all(agent.transport.is_local(agent.jid) for agent in launcher.agents)
+    launcher.submit(launcher.async_stop_agents()).result(timeout=10)
+    assert not launcher.any_agent_alive()
+    assert set(stopped) == set(launcher.agents)
+    assert launcher.agents_stopped.is_set()
+    assert not any(agent.transport.is_local(agent.jid) for agent in launcher.agents)
+
+
+def test_launch_skips_running_agents() -> None:
+    launcher = build_launcher("relaunch", 3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        launcher.launch_agents_concurrently().result(timeout=10)
+        launcher.launch_agents_concurrently().result(timeout=10)
+    assert [agent.starts for agent in launcher.agents] == [1, 1, 1]
+    launcher.stop_agents()
+    assert not launcher.any_agent_alive()
+
+
+def test_failed_agent_is_not_launched() -> None:
+    class FailingNode(CountingNode):
+        async def setup(self) -> None:
+            raise RuntimeError("setup failed")
+
+    launcher = build_launcher("failing", 2)
+    launcher.agents[1] = FailingNode("failing-bad@localhost", "password", [], [])
+    launcher.launched_agents = {agent: False for agent in launcher.agents}
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        launcher.launch_agents_concurrently().result(timeout=10)
+    assert "failing-bad@localhost] exploded" in output.getvalue()
+    assert launcher.launched_agents[launcher.agents[0]]
+    assert not launcher.all_agents_are_launched()
+    launcher.stop_agents()
+
+
+def test_start_route() -> None:
+    class StandInLauncher(OfflineConnection, LauncherAgent):
+        pass
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    agents = [CountingNode(f"route{i}@localhost", "password", [], []) for i in range(3)]
+    launcher = StandInLauncher(
+        jid="route-launcher@localhost",
+        password="password",
+        neighbours=[],
+        agents=agents,
+        web_address="127.0.0.1",
+        web_port=port,
+    )
+    launcher.start().result(timeout=10)
+    # The web server is started in the background by the setup of the launcher
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except ConnectionRefusedError:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+    def post() -> dict[str, bool]:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/agents/start",
+            data=urllib.parse.urlencode({"max_concurrency": 2}).encode(),
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = {str(agent.jid): True for agent in agents}
+            assert post() == expected
+            # A second request does not start the running agents again
+            assert post() == expected
+        assert [agent.starts for agent in agents] == [1, 1, 1]
+    finally:
+        launcher.stop_agents()
+        launcher.stop().result(timeout=10)
@@ -0,0 +1,35 @@
+import gc
+import logging
+import weakref
+from pathlib import Path
+
+from log.log import BatchedCsvLogHandler
+
+
+def record(message: str) -> logging.LogRecord:
+    return logging.LogRecord("spade", logging.INFO, __file__, 0, message, None, None)
+
+
+def test_writer_survives_write_errors(tmp_path: Path) -> None:
+    # A folder can not be opened as a file, so the first batch fails
+    handler = BatchedCsvLogHandler(default_file=str(tmp_path), flush_interval=0.05)
+    handler.emit(record("lost"))
+    handler.flush()
+    assert handler.writer.is_alive()
+    handler.default_file = tmp_path / "logs.csv"
+    handler.emit(record("written"))
+    handler.flush()
+    handler.close()
+    assert (tmp_path / "logs.csv").read_text() == "written\n"
+
+
+def test_closed_handler_is_released(tmp_path: Path) -> None:
+    handler = BatchedCsvLogHandler(
+        default_file=str(tmp_path / "logs.csv"), flush_interval=0.05
+    )
+    handler.emit(record("line"))
+    handler.close()
+    reference = weakref.ref(handler)
+    del handler
+    gc.collect()
+    assert reference() is None
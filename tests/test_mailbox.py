@@ -0,0 +1,92 @@
+from spade.message import Message
+
+from utilities.mailbox import CoalescingMailbox
+from utilities.multipart import MultipartHandler
+
+
+def is_model(message: Message) -> bool:
+    return message.body.startswith("model")
+
+
+def build_mailbox() -> tuple[CoalescingMailbox, MultipartHandler]:
+    handler = MultipartHandler()
+    return CoalescingMailbox(handler, is_model), handler
+
+
+def model(sender: str, body: str, **metadata: str) -> Message:
+    return Message(to="receiver@localhost", sender=sender, body=body, metadata=metadata)
+
+
+def split(handler: MultipartHandler, message: Message) -> list[Message]:
+    return handler.generate_multipart_messages(
+        content=message.body,
+        max_size=handler.metadata_header_size + 10,
+        message_base=message,
+    )
+
+
+def test_latest_version_is_kept() -> None:
+    mailbox, _ = build_mailbox()
+    for version in (1, 3, 2):
+        assert mailbox.put(
+            model("a@localhost", f"model{version}", version=str(version))
+        )
+    mailbox.put(model("b@localhost", "model1", version="1"))
+    models = mailbox.pop_models()
+    assert list(models.keys()) == ["a@localhost", "b@localhost"]
+    assert [m.body for m in models["a@localhost"]] == ["model3"]
+    assert mailbox.discarded_models == 2
+    assert mailbox.size() == 0
+
+
+def test_differences_are_kept_in_order() -> None:
+    mailbox, _ = build_mailbox()
+    mailbox.put(model("a@localhost", "model-full", update="full"))
+    mailbox.put(model("a@localhost", "model-dense1", update="dense"))
+    mailbox.put(model("a@localhost", "model-dense2", update="dense"))
+    mailbox.put(model("a@localhost", "hello"))
+    assert mailbox.size() == 4
+    bodies = [m.body for m in mailbox.pop_models()["a@localhost"]]
+    assert bodies == ["model-full", "model-dense1", "model-dense2"]
+    assert mailbox.pop_other_message().body == "hello"
+    assert mailbox.pop_other_message() is None
+    # A newer full model replaces the full model and its differences
+    mailbox.put(model("a@localhost", "model-full", update="full"))
+    mailbox.put(model("a@localhost", "model-dense3", update="dense"))
+    mailbox.put(model("a@localhost", "model-full2", update="full"))
+    assert [m.body for m in mailbox.pop_models()["a@localhost"]] == ["model-full2"]
+
+
+def test_superseded_model_stream_is_discarded() -> None:
+    mailbox, handler = build_mailbox()
+    old_parts = split(handler, model("a@localhost", "model" + "1" * 95, version="1"))
+    mailbox.put(old_parts[0])
+    new_parts = split(handler, model("a@localhost", "model" + "2" * 95, version="2"))
+    for part in new_parts:
+        mailbox.put(part)
+    assert mailbox.discarded_streams == 1
+    assert not handler.any_multipart_waiting()
+    # The late parts of the discarded stream do not start a new stream
+    for part in old_parts[1:]:
+        assert not mailbox.put(part)
+    assert not handler.any_multipart_waiting()
+    assert [m.body for m in mailbox.pop_models()["a@localhost"]] == ["model" + "2" * 95]
+
+
+def test_unrelated_streams_are_kept() -> None:
+    mailbox, handler = build_mailbox()
+    other_parts = split(handler, model("a@localhost", "x" * 100))
+    difference_parts = split(
+        handler, model("a@localhost", "model" + "d" * 95, update="dense")
+    )
+    newer_parts = split(handler, model("a@localhost", "model" + "3" * 95, version="3"))
+    mailbox.put(other_parts[0])
+    mailbox.put(difference_parts[0])
+    for part in newer_parts:
+        mailbox.put(part)
+    assert mailbox.discarded_streams == 0
+    for part in other_parts[1:] + difference_parts[1:]:
+        mailbox.put(part)
+    assert mailbox.pop_other_message().body == "x" * 100
+    bodies = [m.body for m in mailbox.pop_models()["a@localhost"]]
+    assert bodies == ["model" + "3" * 95, "model" + "d" * 95]
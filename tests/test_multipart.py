@@ -0,0 +1,135 @@
+import asyncio
+import random
+import time
+
+from spade.message import Message
+
+from agents import StandInAgent
+from utilities.multipart import MultipartHandler
+
+
+def split(handler: MultipartHandler, content: str, sender: str) -> list[Message]:
+    return handler.generate_multipart_messages(
+        content=content,
+        max_size=handler.metadata_header_size + 10,
+        message_base=Message(to="receiver@localhost", sender=sender),
+    )
+
+
+def test_out_of_order() -> None:
+    handler = MultipartHandler()
+    content = "".join(str(i % 10) for i in range(200))
+    messages = split(handler, content, "sender@localhost")
+    assert len(messages) > 2
+    random.Random(0).shuffle(messages)
+    rebuilt = [handler.rebuild_multipart(m) for m in messages]
+    assert all(m is None for m in rebuilt[:-1])
+    assert rebuilt[-1].body == content
+    assert not handler.any_multipart_waiting()
+    assert handler.storage_size == 0
+
+
+def test_interleaved_streams() -> None:
+    handler = MultipartHandler()
+    contents = {
+        ("a@localhost", 0): "a" * 95,
+        ("a@localhost", 1): "b" * 120,
+        ("c@localhost", 0): "c" * 64,
+    }
+    streams = [split(handler, content, s) for (s, _), content in contents.items()]
+    # Round robin of the parts of the three streams, two of them from the same sender
+    interleaved = [
+        s[i] for i in range(max(map(len, streams))) for s in streams if i < len(s)
+    ]
+    rebuilt = {
+        (str(m.sender), m.body)
+        for m in map(handler.rebuild_multipart, interleaved)
+        if m is not None
+    }
+    assert rebuilt == {(s, content) for (s, _), content in contents.items()}
+    assert not handler.any_multipart_waiting()
+
+
+def test_duplicated_parts_are_not_counted_twice() -> None:
+    handler = MultipartHandler()
+    messages = split(handler, "x" * 50, "sender@localhost")
+    assert handler.rebuild_multipart(messages[0]) is None
+    assert handler.rebuild_multipart(messages[0]) is None
+    for message in messages[1:-1]:
+        assert handler.rebuild_multipart(message) is None
+    assert handler.rebuild_multipart(messages[-1]).body == "x" * 50
+
+
+def test_ttl_eviction() -> None:
+    handler = MultipartHandler(stream_ttl=10)
+    stale = split(handler, "s" * 50, "stale@localhost")
+    assert handler.rebuild_multipart(stale[0]) is None
+    assert handler.evict_streams(now=time.monotonic()) == 0
+    assert handler.evict_streams(now=time.monotonic() + 11) == 1
+    assert handler.evicted_streams == 1
+    assert not handler.any_multipart_waiting()
+    assert handler.storage_size == 0
+
+
+class QueueBehaviour:
+    def __init__(self, messages: list[Message]) -> None:
+        self.messages = messages
+
+    async def receive(self, timeout: float = None) -> Message | None:
+        return self.messages.pop(0) if self.messages else None
+
+
+def test_receive_evicts_quiet_streams() -> None:
+    agent = StandInAgent(jid="receiver@localhost", password="test", neighbours=[])
+    handler = agent.multipart_handler
+    handler.stream_ttl = 0.05
+    behaviour = QueueBehaviour(split(handler, "q" * 50, "quiet@localhost")[:1])
+    assert asyncio.run(agent.receive(behaviour)) is None
+    assert handler.any_multipart_waiting()
+    # The sender goes quiet: no more parts arrive, but receiving evicts its stream
+    time.sleep(0.1)
+    assert asyncio.run(agent.receive(behaviour)) is None
+    assert not handler.any_multipart_waiting()
+    assert handler.evicted_streams == 1
+
+
+def test_storage_size_eviction() -> None:
+    handler = MultipartHandler(max_storage_size=15)
+    first = split(handler, "f" * 50, "first@localhost")
+    second = split(handler, "s" * 50, "second@localhost")
+    handler.rebuild_multipart(first[0])
+    handler.rebuild_multipart(second[0])
+    # The least recently updated stream is evicted first
+    assert handler.get_stream(first[0]) is None
+    assert handler.get_stream(second[0]) is not None
+
+
+def test_content_not_split() -> None:
+    handler = MultipartHandler()
+    assert handler.generate_multipart_content("short", max_size=100) is None
+    assert (
+        handler.iter_multipart_messages("short", 100, Message(to="r@localhost")) is None
+    )
+
+
+def test_lazy_generation() -> None:
+    handler = MultipartHandler()
+    content = b"0123456789" * 30
+    max_size = handler.metadata_header_size + 16
+    message_base = Message(to="receiver@localhost", sender="sender@localhost")
+    message_base.set_metadata("version", "3")
+    messages = handler.iter_multipart_messages(content, max_size, message_base)
+    first = next(messages)
+    # The bytes are sliced lazily and every body fits in the maximum size
+    assert first.body.endswith("0123456789012345")
+    parts = [first, *messages]
+    assert len(parts) == handler.get_total_parts(len(content), max_size)
+    assert all(len(m.body) <= max_size for m in parts)
+    for message in parts:
+        assert str(message.to) == "receiver@localhost"
+        assert message.get_metadata("version") == "3"
+    # The parts do not share the metadata of the base message
+    parts[0].set_metadata("version", "4")
+    assert message_base.get_metadata("version") == "3"
+    rebuilt = [handler.rebuild_multipart(m) for m in parts]
+    assert rebuilt[-1].body == content.decode("ascii")
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from dataset.partition import DataPartition, DataPartitioner
+
+NUM_CLIENTS = 7
+
+
+def get_partitions(seed: int) -> dict[str, DataPartition]:
+    targets = np.random.default_rng(1).integers(0, 10, size=1000)
+    partitioner = DataPartitioner(targets, num_classes=10, seed=seed)
+    return {
+        "iid": partitioner.iid(NUM_CLIENTS),
+        "label_skew": partitioner.label_skew(NUM_CLIENTS, labels_per_client=2),
+        "dirichlet": partitioner.dirichlet(NUM_CLIENTS, alpha=0.5),
+    }
+
+
+@pytest.mark.parametrize("method", ["iid", "label_skew", "dirichlet"])
+def test_reproducible(method: str) -> None:
+    first = get_partitions(seed=3)[method]
+    second = get_partitions(seed=3)[method]
+    other = get_partitions(seed=4)[method]
+    assert np.array_equal(first.indices, second.indices)
+    assert np.array_equal(first.offsets, second.offsets)
+    assert not np.array_equal(first.indices, other.indices)
+
+
+@pytest.mark.parametrize("method", ["iid", "label_skew", "dirichlet"])
+def test_coverage(method: str) -> None:
+    partition = get_partitions(seed=3)[method]
+    assert partition.num_clients == NUM_CLIENTS
+    # Every sample belongs to exactly one client
+    assert np.array_equal(np.sort(partition.indices), np.arange(1000))
+    assert partition.get_sizes().sum() == 1000
+    assigned = np.concatenate([partition.get_indices(c) for c in range(NUM_CLIENTS)])
+    assert np.array_equal(assigned, partition.indices)
+
+
+def test_iid_is_balanced() -> None:
+    sizes = get_partitions(seed=3)["iid"].get_sizes()
+    assert sizes.max() - sizes.min() <= 1
+
+
+def test_label_skew_labels() -> None:
+    targets = np.random.default_rng(1).integers(0, 10, size=1000)
+    partition = DataPartitioner(targets, num_classes=10, seed=3).label_skew(
+        NUM_CLIENTS, labels_per_client=2
+    )
+    for client in range(NUM_CLIENTS):
+        assert len(np.unique(targets[partition.get_indices(client)])) <= 2
+
+
+def test_save_and_load(tmp_path) -> None:
+    partition = get_partitions(seed=3)["dirichlet"]
+    partition.save(tmp_path / "partition.npz")
+    loaded = DataPartition.load(tmp_path / "partition.npz")
+    assert np.array_equal(loaded.indices, partition.indices)
+    assert np.array_equal(loaded.offsets, partition.offsets)
+    assert loaded.description == partition.description
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from spade.message import Message
+
+from utilities.pipeline import SendPipeline
+
+
+class SlowTransport:
+    """
+    Hands off the messages after a delay, recording the messages and bytes in flight.
+    """
+
+    def __init__(self, pipeline: SendPipeline, delay: float = 0.01) -> None:
+        self.pipeline = pipeline
+        self.delay = delay
+        self.in_flight: int = 0
+        self.max_in_flight: int = 0
+        self.max_pending_bytes: int = 0
+        self.sent: list[str] = []
+
+    async def send(self, message: Message) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.max_pending_bytes = max(
+            self.max_pending_bytes, self.pipeline.pending_bytes
+        )
+        try:
+            await asyncio.sleep(self.delay)
+            self.sent.append(message.body)
+        finally:
+            self.in_flight -= 1
+
+
+def messages(count: int, size: int = 10) -> list[Message]:
+    return [
+        Message(to="receiver@localhost", body=str(i % 10) * size) for i in range(count)
+    ]
+
+
+def test_window_limits_messages_in_flight() -> None:
+    pipeline = SendPipeline(window=3)
+    transport = SlowTransport(pipeline)
+    consumed = []
+
+    def lazy_messages():
+        for message in messages(10):
+            # The iterable is consumed only when there is room in the window
+            consumed.append(transport.in_flight)
+            yield message
+
+    asyncio.run(
+        pipeline.send_all("receiver@localhost", lazy_messages(), transport.send)
+    )
+    assert transport.max_in_flight == 3
+    assert max(consumed) <= 3
+    assert sorted(transport.sent) == sorted(m.body for m in messages(10))
+    assert pipeline.pending_bytes == 0
+
+
+def test_budget_backpressure() -> None:
+    pipeline = SendPipeline(window=8, max_pending_bytes=25)
+    transport = SlowTransport(pipeline)
+
+    async def send_to_all() -> None:
+        await asyncio.gather(
+            *(
+                pipeline.send_all(f"node{i}@localhost", messages(4), transport.send)
+                for i in range(3)
+            )
+        )
+
+    asyncio.run(send_to_all())
+    assert len(transport.sent) == 12
+    # Two messages of 10 bytes fit in the budget shared by all the destinations
+    assert transport.max_in_flight == 2
+    assert transport.max_pending_bytes <= 25
+    assert pipeline.pending_bytes == 0
+
+
+def test_message_bigger_than_budget_is_sent_alone() -> None:
+    pipeline = SendPipeline(window=8, max_pending_bytes=5)
+    transport = SlowTransport(pipeline)
+    asyncio.run(
+        pipeline.send_all("receiver@localhost", messages(3, size=10), transport.send)
+    )
+    assert len(transport.sent) == 3
+    assert transport.max_in_flight == 1
+    assert pipeline.pending_bytes == 0
+
+
+def test_cancellation_releases_window_and_budget() -> None:
+    pipeline = SendPipeline(window=2, max_pending_bytes=100)
+    transport = SlowTransport(pipeline, delay=10)
+
+    async def cancel_send() -> None:
+        task = asyncio.ensure_future(
+            pipeline.send_all("receiver@localhost", messages(5), transport.send)
+        )
+        await asyncio.sleep(0.05)
+        assert transport.in_flight == 2
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        assert transport.in_flight == 0
+        assert pipeline.pending_bytes == 0
+        assert not pipeline.get_window("receiver@localhost").locked()
+        # The pipeline can be used again
+        transport.delay = 0
+        await pipeline.send_all("receiver@localhost", messages(2), transport.send)
+
+    asyncio.run(cancel_send())
+    assert len(transport.sent) == 2
+
+
+def test_failed_send_cancels_the_other_messages() -> None:
+    pipeline = SendPipeline(window=4)
+    transport = SlowTransport(pipeline, delay=10)
+
+    async def fail(message: Message) -> None:
+        if message.body.startswith("1"):
+            raise ConnectionError("closed")
+        await transport.send(message)
+
+    async def send() -> None:
+        with pytest.raises(ConnectionError):
+            await pipeline.send_all("receiver@localhost", messages(4), fail)
+        await asyncio.sleep(0)
+        assert transport.in_flight == 0
+        assert pipeline.pending_bytes == 0
+
+    asyncio.run(send())
+
+
+def test_invalid_window() -> None:
+    with pytest.raises(ValueError):
+        SendPipeline(window=0)
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import torch
+
+from nn.scheduler import TrainingScheduler
+from utilities.metrics import MetricsRegistry
+
+
+@pytest.fixture(autouse=True)
+def restore_threads():
+    # The scheduler sets the intra-op threads of the whole process
+    threads = torch.get_num_threads()
+    yield
+    torch.set_num_threads(threads)
+
+
+def run_queued(scheduler: TrainingScheduler, jobs: list[tuple[str, int]]) -> list[str]:
+    """
+    Queues the jobs (agent and staleness) while the only worker is busy and returns the order they run in.
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def block() -> None:
+        started.set()
+        release.wait()
+
+    order = []
+    scheduler.submit("blocker@localhost", block)
+    started.wait()
+    futures = [
+        scheduler.submit(agent, order.append, agent, staleness=staleness)
+        for agent, staleness in jobs
+    ]
+    assert scheduler.pending() == len(jobs)
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.close()
+    return order
+
+
+def test_fifo_policy() -> None:
+    scheduler = TrainingScheduler(max_concurrent=1, policy="fifo")
+    jobs = [("a", 0), ("a", 0), ("b", 3), ("c", 1)]
+    assert run_queued(scheduler, jobs) == ["a", "a", "b", "c"]
+
+
+def test_fair_policy() -> None:
+    scheduler = TrainingScheduler(max_concurrent=1, policy="fair")
+    scheduler.submit("a", lambda: None).result(timeout=5)
+    scheduler.submit("a", lambda: None).result(timeout=5)
+    # The agent "a" has already trained twice, so the agents with fewer trainings go first
+    jobs = [("a", 0), ("b", 0), ("c", 0)]
+    assert run_queued(scheduler, jobs) == ["b", "c", "a"]
+
+
+def test_staleness_policy() -> None:
+    scheduler = TrainingScheduler(max_concurrent=1, policy="staleness")
+    jobs = [("a", 0), ("b", 2), ("c", 5), ("d", 2)]
+    assert run_queued(scheduler, jobs) == ["c", "b", "d", "a"]
+
+
+def test_invalid_policy() -> None:
+    with pytest.raises(ValueError):
+        TrainingScheduler(max_concurrent=1, policy="random")
+
+
+def test_max_concurrent() -> None:
+    scheduler = TrainingScheduler(max_concurrent=2, threads_per_training=1)
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def train() -> None:
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    futures = [scheduler.submit(f"node{i % 3}", train) for i in range(8)]
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.close()
+    assert running[1] == 2
+
+
+def test_thread_budget() -> None:
+    TrainingScheduler(max_concurrent=2, threads_per_training=3).close()
+    assert torch.get_num_threads() == 3
+    scheduler = TrainingScheduler(max_concurrent=1)
+    assert scheduler.threads_per_training >= 1
+    assert torch.get_num_threads() == scheduler.threads_per_training
+    scheduler.close()
+
+
+def test_stats_metrics_and_errors() -> None:
+    scheduler = TrainingScheduler(max_concurrent=1, threads_per_training=1)
+    metrics = MetricsRegistry(agent="a")
+
+    def fail() -> None:
+        raise RuntimeError("diverged")
+
+    async def train() -> int:
+        return await scheduler.run("a", lambda x: x * 2, 21, metrics=metrics)
+
+    assert asyncio.run(train()) == 42
+    with pytest.raises(RuntimeError):
+        scheduler.submit("a", fail, metrics=metrics).result(timeout=5)
+    stats = scheduler.get_stats()
+    assert stats["a"]["trainings"] == 2
+    assert stats["a"]["wait_seconds"] >= 0 and stats["a"]["compute_seconds"] >= 0
+    histograms = {h["name"]: h for h in metrics.snapshot()["histograms"]}
+    assert histograms["training_queue_seconds"]["count"] == 2
+    assert histograms["training_step_seconds"]["count"] == 2
+    scheduler.close()
+    with pytest.raises(RuntimeError):
+        scheduler.submit("a", lambda: None)